@@ -0,0 +1,57 @@
+# Async File I/O
+# Runs filesystem syscalls on a bounded thread pool so workspace file
+# operations never block the event loop
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Dict, List
+import asyncio
+import functools
+import os
+
+FS_IO_WORKERS = int(os.environ.get('FS_IO_WORKERS', '8'))
+FS_STREAM_CHUNK_SIZE = int(os.environ.get('FS_STREAM_CHUNK_SIZE', str(256 * 1024)))
+
+_executor = ThreadPoolExecutor(max_workers=FS_IO_WORKERS, thread_name_prefix="fs-io")
+
+
+async def run_io(func, *args, **kwargs):
+    """Run a blocking filesystem call on the I/O pool"""
+    return await asyncio.get_running_loop().run_in_executor(
+        _executor, functools.partial(func, *args, **kwargs)
+    )
+
+
+def scan_directory(path: str) -> List[Dict]:
+    """
+    One scandir pass over a directory. DirEntry caches the file type from
+    readdir, so only regular files and directories cost an extra stat.
+    """
+    entries = []
+    with os.scandir(path) as iterator:
+        for entry in iterator:
+            try:
+                is_dir = entry.is_dir()
+                stat = entry.stat()
+            except OSError:
+                continue  # Vanished or dangling symlink
+            entries.append({
+                "name": entry.name,
+                "path": entry.path,
+                "is_dir": is_dir,
+                "size": 0 if is_dir else stat.st_size,
+                "modified": stat.st_mtime,
+            })
+    return entries
+
+
+async def iter_file_chunks(path: str, chunk_size: int = FS_STREAM_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """Stream a file in chunks; each read runs on the I/O pool"""
+    handle = await run_io(open, path, 'rb')
+    try:
+        while True:
+            chunk = await run_io(handle.read, chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        await run_io(handle.close)
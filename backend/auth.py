@@ -2,22 +2,14 @@
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 import jwt
-from passlib.hash import bcrypt
 from fastapi import HTTPException, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from config import JWT_SECRET, JWT_ALGORITHM, JWT_EXPIRATION_HOURS, db, INITIAL_CREDITS
+from password_hashing import hash_password, verify_and_update
 import uuid
 
 security = HTTPBearer()
 
-def hash_password(password: str) -> str:
-    """Hash password using bcrypt"""
-    return bcrypt.hash(password)
-
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Verify password against hash"""
-    return bcrypt.verify(plain_password, hashed_password)
-
 def create_access_token(user_id: str) -> str:
     """Create JWT token"""
     expire = datetime.now(timezone.utc) + timedelta(hours=JWT_EXPIRATION_HOURS)
@@ -65,7 +57,7 @@ async def register_user(email: str, password: str, name: str = None) -> dict:
     user = {
         'id': user_id,
         'email': email,
-        'password': hash_password(password),
+        'password': await hash_password(password),
         'name': name or email.split('@')[0],
         'credits': INITIAL_CREDITS,
         'created_at': datetime.now(timezone.utc).isoformat()
@@ -95,9 +87,14 @@ async def login_user(email: str, password: str) -> dict:
         raise HTTPException(status_code=401, detail='Invalid credentials')
     
     # Verify password
-    if not verify_password(password, user['password']):
+    valid, new_hash = await verify_and_update(password, user['password'])
+    if not valid:
         raise HTTPException(status_code=401, detail='Invalid credentials')
     
+    # Re-hash with the current cost factor
+    if new_hash:
+        await db.users.update_one({'id': user['id']}, {'$set': {'password': new_hash}})
+    
     # Create token
     token = create_access_token(user['id'])
     
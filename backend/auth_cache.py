@@ -0,0 +1,202 @@
+# Authentication Principal Cache
+# In-process TTL LRU backed by Redis for resolved auth principals (session
+# tokens and JWTs), with cross-process invalidation over pub/sub
+
+from collections import OrderedDict
+from prometheus_client import Counter, Histogram
+from redis.exceptions import RedisError
+from redis_cache import cache
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+AUTH_CACHE_TTL = int(os.environ.get('AUTH_CACHE_TTL', '60'))
+AUTH_CACHE_MAX_ENTRIES = int(os.environ.get('AUTH_CACHE_MAX_ENTRIES', '10000'))
+AUTH_INVALIDATION_CHANNEL = "auth:invalidate"
+
+AUTH_PRINCIPAL_LOOKUPS = Counter(
+    'auth_principal_lookups_total',
+    'Auth principal resolutions by where they were served from (local, redis, db, miss)',
+    ['principal', 'source']
+)
+AUTH_DEPENDENCY_LATENCY = Histogram(
+    'auth_dependency_seconds',
+    'Time spent in authentication dependencies',
+    ['principal'],
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)
+)
+
+# A loader returns (principal, ttl_seconds) or None when the credential is invalid
+Loader = Callable[[], Awaitable[Optional[Tuple[Dict[str, Any], float]]]]
+
+
+def session_cache_key(session_token: str) -> str:
+    """Session tokens are hashed so raw credentials never become Redis keys"""
+    return f"session:{hashlib.sha256(session_token.encode()).hexdigest()[:32]}"
+
+
+def jwt_cache_key(payload: Dict, token: str) -> str:
+    """Keyed by jti; tokens issued before jti was added fall back to a hash"""
+    jti = payload.get('jti') or hashlib.sha256(token.encode()).hexdigest()[:32]
+    return f"jwt:{jti}"
+
+
+class PrincipalCache:
+    """
+    Two-level cache of resolved principals keyed by credential.
+
+    Every entry records its user_id so all of a user's cached principals can
+    be dropped at once (credit or plan changes). Invalidations delete the
+    Redis copy and are broadcast so other processes evict their local copy.
+    """
+
+    def __init__(self, redis_client, ttl: int = AUTH_CACHE_TTL, max_entries: int = AUTH_CACHE_MAX_ENTRIES):
+        self.redis = redis_client
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # key -> (expires_at monotonic, user_id, principal)
+        self._local: "OrderedDict[str, Tuple[float, str, Dict]]" = OrderedDict()
+        self._listener: Optional[asyncio.Task] = None
+
+    # ==================== Local LRU ====================
+
+    def _get_local(self, key: str) -> Optional[Dict]:
+        entry = self._local.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._local[key]
+            return None
+        self._local.move_to_end(key)
+        return entry[2]
+
+    def _set_local(self, key: str, user_id: str, principal: Dict, ttl: float):
+        self._local[key] = (time.monotonic() + ttl, user_id, principal)
+        self._local.move_to_end(key)
+        while len(self._local) > self.max_entries:
+            self._local.popitem(last=False)
+
+    def _evict_local(self, key: Optional[str] = None, user_id: Optional[str] = None):
+        if key is not None:
+            self._local.pop(key, None)
+        if user_id is not None:
+            for cached_key in [k for k, entry in self._local.items() if entry[1] == user_id]:
+                del self._local[cached_key]
+
+    # ==================== Lookup ====================
+
+    async def resolve(self, principal: str, key: str, loader: Loader) -> Optional[Dict]:
+        """Return the cached principal for `key`, loading (and caching) it on a miss"""
+        cached = self._get_local(key)
+        if cached is not None:
+            AUTH_PRINCIPAL_LOOKUPS.labels(principal, 'local').inc()
+            return cached
+
+        try:
+            raw = await self.redis.get(f"auth:principal:{key}")
+            if raw:
+                entry = json.loads(raw)
+                ttl = await self.redis.ttl(f"auth:principal:{key}")
+                self._set_local(key, entry['user_id'], entry['principal'], min(self.ttl, max(ttl, 1)))
+                AUTH_PRINCIPAL_LOOKUPS.labels(principal, 'redis').inc()
+                return entry['principal']
+        except RedisError as e:
+            logger.warning(f"Auth cache read failed, falling back to database: {e}")
+
+        loaded = await loader()
+        if loaded is None:
+            AUTH_PRINCIPAL_LOOKUPS.labels(principal, 'miss').inc()
+            return None
+
+        value, ttl = loaded
+        AUTH_PRINCIPAL_LOOKUPS.labels(principal, 'db').inc()
+        ttl = min(self.ttl, ttl)
+        if ttl > 0:
+            await self.set(key, value['user_id'], value, ttl)
+        return value
+
+    async def set(self, key: str, user_id: str, principal: Dict, ttl: float):
+        self._set_local(key, user_id, principal, ttl)
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.setex(f"auth:principal:{key}", max(int(ttl), 1),
+                           json.dumps({'user_id': user_id, 'principal': principal}, default=str))
+                pipe.sadd(f"auth:user:{user_id}", key)
+                pipe.expire(f"auth:user:{user_id}", self.ttl)
+                await pipe.execute()
+        except RedisError as e:
+            logger.warning(f"Auth cache write failed: {e}")
+
+    # ==================== Invalidation ====================
+
+    async def invalidate_key(self, key: str):
+        """Drop one credential (logout, session deleted)"""
+        self._evict_local(key=key)
+        await self._invalidate_remote({'key': key}, [f"auth:principal:{key}"])
+
+    async def invalidate_user(self, user_id: str):
+        """Drop every cached principal of a user (credits, plan or profile changed)"""
+        self._evict_local(user_id=user_id)
+        try:
+            keys = await self.redis.smembers(f"auth:user:{user_id}")
+        except RedisError as e:
+            logger.error(f"Auth cache invalidation failed for {user_id}: {e}")
+            keys = []
+        await self._invalidate_remote(
+            {'user_id': user_id},
+            [f"auth:principal:{key}" for key in keys] + [f"auth:user:{user_id}"]
+        )
+
+    async def _invalidate_remote(self, message: Dict, redis_keys):
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                if redis_keys:
+                    pipe.delete(*redis_keys)
+                pipe.publish(AUTH_INVALIDATION_CHANNEL, json.dumps(message))
+                await pipe.execute()
+        except RedisError as e:
+            logger.error(f"Auth cache invalidation broadcast failed: {e}")
+
+    def start_listener(self):
+        """Subscribe to invalidations from other processes"""
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.get_running_loop().create_task(self._listen())
+
+    async def stop_listener(self):
+        if self._listener:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+    async def _listen(self):
+        while True:
+            pubsub = self.redis.pubsub()
+            try:
+                await pubsub.subscribe(AUTH_INVALIDATION_CHANNEL)
+                async for message in pubsub.listen():
+                    if message.get('type') != 'message':
+                        continue
+                    data = json.loads(message['data'])
+                    self._evict_local(key=data.get('key'), user_id=data.get('user_id'))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Missed invalidations are bounded by the TTL; start clean after reconnecting
+                logger.error(f"Auth invalidation listener error: {e}")
+                self._local.clear()
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.close()
+
+
+# Global principal cache (shares the RedisCache connection pool)
+principal_cache = PrincipalCache(cache.redis)
@@ -5,7 +5,6 @@ from fastapi import APIRouter, HTTPException, Depends, status
 from pydantic import BaseModel
 from typing import Optional
 from datetime import datetime, timezone, timedelta
-from passlib.context import CryptContext
 import jwt
 import uuid
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -16,8 +15,8 @@ from db_helpers import (
     create_user, user_to_dict
 )
 from constants import INITIAL_FREE_CREDITS
+from password_hashing import hash_password, verify_and_update
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRATION = timedelta(days=30)
 
@@ -61,7 +60,7 @@ async def register_endpoint(user_data: UserRegister, db: AsyncSession = Depends(
         'id': str(uuid.uuid4()),
         'email': user_data.email,
         'name': user_data.username,
-        'password_hash': pwd_context.hash(user_data.password),
+        'password_hash': await hash_password(user_data.password),
         'credits': INITIAL_FREE_CREDITS,
         'created_at': datetime.now(timezone.utc),
         'updated_at': datetime.now(timezone.utc)
@@ -71,7 +70,7 @@ async def register_endpoint(user_data: UserRegister, db: AsyncSession = Depends(
     
     # Generate JWT
     token = jwt.encode(
-        {"user_id": user.id, "exp": datetime.now(timezone.utc) + JWT_EXPIRATION},
+        {"user_id": user.id, "exp": datetime.now(timezone.utc) + JWT_EXPIRATION, "jti": uuid.uuid4().hex},
         get_jwt_secret(),
         algorithm=JWT_ALGORITHM
     )
@@ -87,12 +86,21 @@ async def login_endpoint(user_data: UserLogin, db: AsyncSession = Depends(get_db
     """Login user"""
     user = await get_user_by_email(db, user_data.email)
     
-    if not user or not pwd_context.verify(user_data.password, user.password_hash):
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid email or password")
+    
+    valid, new_hash = await verify_and_update(user_data.password, user.password_hash or '')
+    if not valid:
         raise HTTPException(status_code=401, detail="Invalid email or password")
     
+    # Re-hash with the current cost factor
+    if new_hash:
+        user.password_hash = new_hash
+        await db.commit()
+    
     # Generate JWT
     token = jwt.encode(
-        {"user_id": user.id, "exp": datetime.now(timezone.utc) + JWT_EXPIRATION},
+        {"user_id": user.id, "exp": datetime.now(timezone.utc) + JWT_EXPIRATION, "jti": uuid.uuid4().hex},
         get_jwt_secret(),
         algorithm=JWT_ALGORITHM
     )
@@ -155,7 +163,7 @@ async def google_auth_endpoint(auth_data: GoogleAuthRequest, db: AsyncSession =
     
     # Generate JWT
     token = jwt.encode(
-        {"user_id": user.id, "exp": datetime.now(timezone.utc) + JWT_EXPIRATION},
+        {"user_id": user.id, "exp": datetime.now(timezone.utc) + JWT_EXPIRATION, "jti": uuid.uuid4().hex},
         get_jwt_secret(),
         algorithm=JWT_ALGORITHM
     )
@@ -194,7 +202,7 @@ async def firebase_sync_endpoint(sync_data: FirebaseSyncRequest, db: AsyncSessio
     
     # Generate JWT
     token = jwt.encode(
-        {"user_id": user.id, "exp": datetime.now(timezone.utc) + JWT_EXPIRATION},
+        {"user_id": user.id, "exp": datetime.now(timezone.utc) + JWT_EXPIRATION, "jti": uuid.uuid4().hex},
         get_jwt_secret(),
         algorithm=JWT_ALGORITHM
     )
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Workspace Content Search Benchmark
+Generates a synthetic project (default 5,000 files), builds the tree and
+trigram indexes, then compares indexed search latency against a brute-force
+scan that reads and greps every file - what a content search without the
+index would cost.
+
+Needs no services; the project is created in a temporary directory:
+
+    python benchmark_content_search.py --files 5000 --repeat 20
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import re
+import shutil
+import statistics
+import string
+import tempfile
+import time
+
+from content_index import ContentIndexRegistry
+from file_tree_index import FileTreeRegistry
+
+QUERIES = [
+    ("substring, rare", "handleCheckoutSubmit", False),
+    ("substring, common", "return", False),
+    ("substring, short", "id", False),
+    ("regex, literal prefix", r"fetchUser\w+\(", True),
+    ("regex, no literal", r"\bv[0-9]+_[a-z]+\b", True),
+]
+
+WORDS = ["user", "item", "cart", "order", "profile", "session", "render", "state",
+         "props", "value", "index", "config", "theme", "layout", "button", "modal"]
+
+
+def identifier(rng: random.Random) -> str:
+    return rng.choice(WORDS) + rng.choice(WORDS).capitalize() + str(rng.randint(0, 999))
+
+
+def generate_file(rng: random.Random, file_number: int) -> str:
+    lines = [f"// module {file_number}", "import React from 'react';", ""]
+    for _ in range(rng.randint(3, 8)):
+        name = identifier(rng)
+        lines.append(f"export function {name}({identifier(rng)}, {identifier(rng)}) {{")
+        for _ in range(rng.randint(3, 12)):
+            lines.append(f"  const {identifier(rng)} = {identifier(rng)}.{identifier(rng)} + {rng.randint(0, 9999)};")
+        lines.append(f"  return {identifier(rng)};")
+        lines.append("}")
+        lines.append("")
+    # A few needles so the rare queries have hits
+    if file_number % 997 == 0:
+        lines.append("export const handleCheckoutSubmit = () => fetchUserOrders(session);")
+    if file_number % 251 == 0:
+        lines.append(f"const v{file_number}_{rng.choice(string.ascii_lowercase) * 3} = 1;")
+    return "\n".join(lines) + "\n"
+
+
+def generate_project(root: str, files: int, seed: int = 7):
+    rng = random.Random(seed)
+    for file_number in range(files):
+        directory = os.path.join(root, "src", f"feature{file_number % 50}", f"part{file_number % 7}")
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"module{file_number}.js"), "w") as f:
+            f.write(generate_file(rng, file_number))
+    # Ignored directories must not be indexed
+    node_modules = os.path.join(root, "node_modules", "lib")
+    os.makedirs(node_modules, exist_ok=True)
+    with open(os.path.join(node_modules, "index.js"), "w") as f:
+        f.write("export const handleCheckoutSubmit = 'ignored';\n")
+
+
+def brute_force(root: str, pattern: str, regex: bool) -> int:
+    """Walk, read and grep every file (ignore list applied), counting matching lines"""
+    matcher = re.compile(pattern if regex else re.escape(pattern), re.IGNORECASE)
+    hits = 0
+    for directory, subdirectories, names in os.walk(root):
+        subdirectories[:] = [d for d in subdirectories
+                             if not d.startswith('.') and d not in ('node_modules', '__pycache__', 'venv')]
+        for name in names:
+            with open(os.path.join(directory, name), encoding='utf-8') as f:
+                for line in f:
+                    if matcher.search(line):
+                        hits += 1
+    return hits
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    return statistics.median(samples), samples[max(int(len(samples) * 0.95) - 1, 0)]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Trigram content search benchmark")
+    parser.add_argument('--files', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--brute-repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="search-bench-")
+    try:
+        print(f"📁 Generating {args.files} files in {root}...")
+        generate_project(root, args.files)
+
+        trees = FileTreeRegistry()
+        contents = ContentIndexRegistry()
+
+        start = time.perf_counter()
+        tree = await trees.get(root)
+        tree_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        # First search builds the trigram index
+        await contents.search(tree, "warmup")
+        index_seconds = time.perf_counter() - start
+        index = contents._get(root)
+        print(f"🌲 Tree index: {len(tree.files())} files in {tree_seconds * 1000:.0f} ms")
+        print(f"🔎 Trigram index: {len(index.ids)} files, {len(index.postings)} trigrams, "
+              f"~{index.bytes_used / 1024 / 1024:.1f} MiB in {index_seconds * 1000:.0f} ms")
+
+        print("\n" + "=" * 92)
+        print(f"{'Query':<24} {'hits':>6} {'scanned':>8} {'index p50':>10} {'index p95':>10} "
+              f"{'brute p50':>10} {'speedup':>8}")
+        print("=" * 92)
+        for name, pattern, regex in QUERIES:
+            indexed = []
+            result = None
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                result = await contents.search(tree, pattern, regex=regex, max_results=100000)
+                indexed.append((time.perf_counter() - start) * 1000)
+            brute = []
+            brute_hits = 0
+            for _ in range(args.brute_repeat):
+                start = time.perf_counter()
+                brute_hits = brute_force(root, pattern, regex)
+                brute.append((time.perf_counter() - start) * 1000)
+            if brute_hits != len(result['hits']):
+                print(f"⚠️  {name}: index found {len(result['hits'])} lines, brute force {brute_hits}")
+            p50, p95 = summarize(indexed)
+            brute_p50, _ = summarize(brute)
+            print(f"{name:<24} {len(result['hits']):>6} {result['files_scanned']:>8} {p50:>10.2f} {p95:>10.2f} "
+                  f"{brute_p50:>10.1f} {brute_p50 / max(p50, 0.001):>7.0f}x")
+        print("=" * 92)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
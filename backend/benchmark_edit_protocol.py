@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Edit Protocol Benchmark
+Runs common edit requests against a sample landing page twice - once asking
+the model for the complete file (the old protocol) and once for
+SEARCH/REPLACE edits - and compares estimated output tokens, provider
+latency and whether the patch applied.
+
+Calls the real providers through ModelRouter, so the API keys must be set:
+
+    python benchmark_edit_protocol.py --task-type frontend --repeat 2
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+from code_patch import EDIT_PROTOCOL_INSTRUCTIONS, apply_edit_response, estimate_tokens
+from model_router import get_model_router
+
+EDIT_REQUESTS = [
+    "Make the primary button blue",
+    "Change the hero headline to 'Ship faster with AutoWebIQ'",
+    "Add a fourth feature card about 24/7 support",
+    "Make the navbar sticky",
+    "Fix the footer copyright year to 2025",
+]
+
+FEATURES = "\n".join(
+    f"""      <div class="feature-card">
+        <h3>Feature {number}</h3>
+        <p>Everything you need to launch, measure and grow, built into one workflow number {number}.</p>
+      </div>""" for number in range(1, 4)
+)
+
+SAMPLE_PAGE = f"""<!DOCTYPE html>
+<html lang="en">
+<head>
+  <meta charset="UTF-8">
+  <meta name="viewport" content="width=device-width, initial-scale=1.0">
+  <title>Acme Launch</title>
+  <style>
+    * {{ box-sizing: border-box; margin: 0; padding: 0; }}
+    body {{ font-family: 'Inter', sans-serif; color: #1f2937; background: #f9fafb; }}
+    .navbar {{ display: flex; justify-content: space-between; padding: 1rem 2rem; background: white; }}
+    .navbar a {{ color: #374151; text-decoration: none; margin-left: 1.5rem; }}
+    .hero {{ padding: 6rem 2rem; text-align: center; background: linear-gradient(135deg, #6366f1, #a855f7); color: white; }}
+    .hero h1 {{ font-size: 3rem; margin-bottom: 1rem; }}
+    .btn-primary {{ background: #f97316; color: white; padding: 0.75rem 2rem; border-radius: 9999px; border: none; }}
+    .btn-primary:hover {{ transform: translateY(-2px); box-shadow: 0 10px 20px rgba(0, 0, 0, 0.15); }}
+    .features {{ display: grid; grid-template-columns: repeat(auto-fit, minmax(240px, 1fr)); gap: 2rem; padding: 4rem 2rem; }}
+    .feature-card {{ background: white; padding: 2rem; border-radius: 1rem; box-shadow: 0 4px 12px rgba(0, 0, 0, 0.05); }}
+    footer {{ padding: 2rem; text-align: center; color: #6b7280; }}
+    @media (max-width: 640px) {{ .hero h1 {{ font-size: 2rem; }} }}
+  </style>
+</head>
+<body>
+  <nav class="navbar">
+    <strong>Acme</strong>
+    <div><a href="#features">Features</a><a href="#pricing">Pricing</a><a href="#contact">Contact</a></div>
+  </nav>
+  <section class="hero">
+    <h1>Launch your product in days</h1>
+    <p>Acme gives small teams the tools of a big one.</p>
+    <button class="btn-primary">Get started</button>
+  </section>
+  <section id="features">
+    <div class="features">
+{FEATURES}
+    </div>
+  </section>
+  <footer>&copy; 2023 Acme Inc. All rights reserved.</footer>
+  <script>
+    document.querySelector('.btn-primary').addEventListener('click', () => {{
+      window.location.hash = '#features';
+    }});
+  </script>
+</body>
+</html>
+"""
+
+SYSTEM_MESSAGE = "You are an expert developer. Modify the given file based on the user's request."
+
+
+async def run_once(router, task_type: str, request: str, patch: bool):
+    prompt = f'User request: "{request}"\n\nCurrent file content:\n```html\n{SAMPLE_PAGE}\n```\n\n'
+    if patch:
+        prompt += EDIT_PROTOCOL_INSTRUCTIONS
+    else:
+        prompt += "Modify this file to fulfill the user's request. Return the complete modified file."
+    start = time.perf_counter()
+    response = await router.generate_completion(
+        task_type=task_type,
+        prompt=prompt,
+        system_message=SYSTEM_MESSAGE,
+        session_id=f"edit_benchmark_{time.time()}"
+    )
+    seconds = time.perf_counter() - start
+    applied = apply_edit_response(SAMPLE_PAGE, response, "index.html").mode if patch else "full"
+    return estimate_tokens(response), seconds, applied
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Full-file vs SEARCH/REPLACE edit benchmark")
+    parser.add_argument('--task-type', default='frontend', choices=['frontend', 'backend', 'content'])
+    parser.add_argument('--repeat', type=int, default=1)
+    args = parser.parse_args()
+
+    router = get_model_router()
+    print(f"📄 Sample page: ~{estimate_tokens(SAMPLE_PAGE)} tokens")
+    print("\n" + "=" * 100)
+    print(f"{'Request':<52} {'full tok':>9} {'full s':>7} {'patch tok':>10} {'patch s':>8} {'applied':>10}")
+    print("=" * 100)
+
+    totals = {"full": [], "patch": [], "full_s": [], "patch_s": []}
+    for request in EDIT_REQUESTS:
+        for _ in range(args.repeat):
+            full_tokens, full_seconds, _ = await run_once(router, args.task_type, request, patch=False)
+            patch_tokens, patch_seconds, applied = await run_once(router, args.task_type, request, patch=True)
+            totals["full"].append(full_tokens)
+            totals["patch"].append(patch_tokens)
+            totals["full_s"].append(full_seconds)
+            totals["patch_s"].append(patch_seconds)
+            print(f"{request[:50]:<52} {full_tokens:>9} {full_seconds:>7.1f} "
+                  f"{patch_tokens:>10} {patch_seconds:>8.1f} {applied:>10}")
+    print("=" * 100)
+    print(f"Median output tokens: full {statistics.median(totals['full']):.0f}, "
+          f"patch {statistics.median(totals['patch']):.0f}")
+    print(f"Median latency:       full {statistics.median(totals['full_s']):.1f}s, "
+          f"patch {statistics.median(totals['patch_s']):.1f}s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,187 @@
+# Catalog Cache
+# Template/component catalogs serialized once per catalog version, stored
+# precompressed (gzip + brotli) and served with strong ETags / 304s
+
+from collections import OrderedDict
+from fastapi import HTTPException, Request, Response
+from redis.exceptions import RedisError
+from redis_cache import cache
+from typing import Dict, NamedTuple, Optional, Tuple
+import asyncio
+import brotli
+import gzip
+import hashlib
+import logging
+import orjson
+import os
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+# How often a process checks the shared catalog version (seconds)
+CATALOG_VERSION_CHECK_INTERVAL = float(os.environ.get('CATALOG_VERSION_CHECK_INTERVAL', '2'))
+# Rebuild at least this often even without a version bump (picks up use_count etc.)
+CATALOG_MAX_AGE = float(os.environ.get('CATALOG_MAX_AGE', '600'))
+# Clients always revalidate; an unchanged catalog costs a 304 with no body
+CATALOG_CACHE_CONTROL = "public, no-cache"
+
+MAX_PROJECTION_FIELDS = 20
+MAX_VARIANTS = 16
+FIELD_NAME = re.compile(r'^[A-Za-z_][A-Za-z0-9_.]*$')
+
+
+def catalog_version_key(name: str) -> str:
+    return f"catalog:version:{name}"
+
+
+async def bump_catalog_version(*names: str):
+    """Call after writing to a catalog collection so every process rebuilds it"""
+    try:
+        async with cache.redis.pipeline(transaction=False) as pipe:
+            for name in names:
+                pipe.incr(catalog_version_key(name))
+            await pipe.execute()
+    except RedisError as e:
+        logger.warning(f"Catalog version bump failed for {names}: {e}")
+
+
+class CatalogVariant(NamedTuple):
+    identity: bytes
+    gzip: bytes
+    br: bytes
+    etag: str  # opaque tag; each encoding gets its own strong ETag derived from it
+
+
+def parse_fields(fields: Optional[str]) -> Optional[Tuple[str, ...]]:
+    """`fields=id,name,category` -> sorted tuple of field names (None = full documents)"""
+    if not fields:
+        return None
+    names = tuple(sorted({f.strip() for f in fields.split(',') if f.strip()}))
+    if not names:
+        return None
+    if len(names) > MAX_PROJECTION_FIELDS or not all(FIELD_NAME.match(n) for n in names):
+        raise HTTPException(status_code=400, detail="Invalid fields parameter")
+    return names
+
+
+def accepted_encodings(accept_encoding: str) -> set:
+    accepted = set()
+    for part in accept_encoding.lower().split(','):
+        token, _, params = part.strip().partition(';')
+        if params.replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            continue
+        accepted.add(token.strip())
+    return accepted
+
+
+def etag_matches(if_none_match: Optional[str], etags) -> bool:
+    if not if_none_match:
+        return False
+    candidates = {tag.strip() for tag in if_none_match.split(',')}
+    if '*' in candidates:
+        return True
+    # If-None-Match uses weak comparison
+    candidates |= {tag[2:] for tag in candidates if tag.startswith('W/')}
+    return any(tag in candidates for tag in etags)
+
+
+class Catalog:
+    """
+    Serialized, precompressed snapshot of one Mongo collection.
+
+    Snapshots are keyed by projection and rebuilt when the shared version in
+    Redis changes (bump_catalog_version) or after CATALOG_MAX_AGE.
+    """
+
+    def __init__(self, name: str, collection):
+        self.name = name
+        self.collection = collection
+        self._variants: "OrderedDict[Optional[Tuple[str, ...]], Tuple[float, CatalogVariant]]" = OrderedDict()
+        self._version: Optional[str] = None
+        self._version_checked = 0.0
+        self._lock = asyncio.Lock()
+
+    async def _refresh_version(self):
+        now = time.monotonic()
+        if now - self._version_checked < CATALOG_VERSION_CHECK_INTERVAL:
+            return
+        self._version_checked = now
+        try:
+            version = await cache.redis.get(catalog_version_key(self.name))
+        except RedisError as e:
+            logger.warning(f"Catalog version check failed for {self.name}: {e}")
+            return
+        if version != self._version:
+            self._version = version
+            self._variants.clear()
+
+    def _cached(self, fields) -> Optional[CatalogVariant]:
+        entry = self._variants.get(fields)
+        if entry is None or time.monotonic() - entry[0] > CATALOG_MAX_AGE:
+            return None
+        self._variants.move_to_end(fields)
+        return entry[1]
+
+    async def _build(self, fields) -> CatalogVariant:
+        if fields is None:
+            projection = None
+        else:
+            projection = {name: 1 for name in fields}
+            if '_id' not in fields:
+                projection['_id'] = 0
+        documents = await self.collection.find({}, projection).to_list(length=None)
+        for document in documents:
+            if '_id' in document:
+                document['_id'] = str(document['_id'])
+
+        body = orjson.dumps({"success": True, "count": len(documents), self.name: documents})
+        loop = asyncio.get_running_loop()
+        # Max compression is affordable: it runs once per version, off the event loop
+        gz, br = await asyncio.gather(
+            loop.run_in_executor(None, lambda: gzip.compress(body, compresslevel=9, mtime=0)),
+            loop.run_in_executor(None, lambda: brotli.compress(body, quality=11)),
+        )
+        etag = hashlib.sha256(body).hexdigest()[:32]
+        logger.info(f"Built {self.name} catalog {fields or 'full'}: {len(body)} bytes, "
+                    f"gzip {len(gz)}, br {len(br)}")
+        return CatalogVariant(body, gz, br, etag)
+
+    async def get(self, fields: Optional[Tuple[str, ...]] = None) -> CatalogVariant:
+        await self._refresh_version()
+        variant = self._cached(fields)
+        if variant is not None:
+            return variant
+        async with self._lock:
+            variant = self._cached(fields)
+            if variant is None:
+                variant = await self._build(fields)
+                self._variants[fields] = (time.monotonic(), variant)
+                while len(self._variants) > MAX_VARIANTS:
+                    self._variants.popitem(last=False)
+            return variant
+
+    async def respond(self, request: Request, fields: Optional[str] = None) -> Response:
+        variant = await self.get(parse_fields(fields))
+        etags = {
+            'br': f'"{variant.etag}-br"',
+            'gzip': f'"{variant.etag}-gz"',
+            'identity': f'"{variant.etag}"',
+        }
+
+        accepted = accepted_encodings(request.headers.get('accept-encoding', ''))
+        encoding = 'br' if 'br' in accepted else 'gzip' if 'gzip' in accepted else 'identity'
+        headers: Dict[str, str] = {
+            "ETag": etags[encoding],
+            "Cache-Control": CATALOG_CACHE_CONTROL,
+            "Vary": "Accept-Encoding",
+        }
+
+        if etag_matches(request.headers.get('if-none-match'), etags.values()):
+            return Response(status_code=304, headers=headers)
+
+        if encoding == 'identity':
+            return Response(content=variant.identity, media_type="application/json", headers=headers)
+        headers["Content-Encoding"] = encoding
+        content = variant.br if encoding == 'br' else variant.gzip
+        return Response(content=content, media_type="application/json", headers=headers)
@@ -49,6 +49,22 @@ celery_app.conf.update(
     task_send_sent_event=True,
 )
 
+# Periodic Tasks (run with: celery -A celery_app beat)
+celery_app.conf.beat_schedule = {
+    'reconcile-user-stats': {
+        'task': 'celery_tasks.reconcile_user_stats_task',
+        'schedule': float(os.environ.get('USER_STATS_RECONCILE_INTERVAL', '900')),  # 15 minutes
+    },
+    'manage-ledger-partitions': {
+        'task': 'celery_tasks.manage_ledger_partitions_task',
+        'schedule': 86400.0,  # daily
+    },
+    'reconcile-credit-balances': {
+        'task': 'celery_tasks.reconcile_credit_balances_task',
+        'schedule': float(os.environ.get('CREDIT_RECONCILE_INTERVAL', '300')),  # 5 minutes
+    },
+}
+
 # Task Priority (0-10, higher = more priority)
 celery_app.conf.task_default_priority = 5
 celery_app.conf.broker_transport_options = {
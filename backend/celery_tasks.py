@@ -135,6 +135,16 @@ async def _build_website_async(task_self, user_prompt, project_id, user_id, uplo
             
             print(f"📊 [{progress}%] {stage}: {message}")
         
+        # Forward agent messages as progress updates (not stored in the chat history)
+        async def agent_message_callback(proj_id: str, update: dict):
+            await progress_callback(
+                update.get('agent', 'system'),
+                update.get('progress', 0),
+                update.get('content', '')
+            )
+        
+        orchestrator.set_message_callback(agent_message_callback)
+        
         # Generate website
         task_self.update_state(
             state='PROGRESS',
@@ -258,6 +268,58 @@ async def _generate_images_async(task_self, image_requirements, project_id):
 # Task is already registered with decorator above
 
 
+@celery_app.task(name='celery_tasks.reconcile_user_stats_task')
+def reconcile_user_stats_task() -> Dict:
+    """Periodic job: correct any drift in the user_stats counters"""
+    loop = asyncio.get_event_loop()
+    return loop.run_until_complete(_reconcile_user_stats_async())
+
+
+async def _reconcile_user_stats_async():
+    from database import AsyncSessionLocal
+    from user_stats import reconcile_user_stats
+    
+    async with AsyncSessionLocal() as session:
+        corrected = await reconcile_user_stats(session)
+        await session.commit()
+    
+    if corrected:
+        print(f"🔧 Reconciled user_stats: {corrected} row(s) corrected")
+    return {'status': 'success', 'corrected': corrected}
+
+
+@celery_app.task(name='celery_tasks.manage_ledger_partitions_task')
+def manage_ledger_partitions_task() -> Dict:
+    """Periodic job: create upcoming ledger partitions, detach expired ones"""
+    from database import engine
+    from ledger_partitions import manage_partitions
+    
+    loop = asyncio.get_event_loop()
+    return loop.run_until_complete(manage_partitions(engine))
+
+
+@celery_app.task(name='celery_tasks.reconcile_credit_balances_task')
+def reconcile_credit_balances_task() -> Dict:
+    """Periodic job: verify hot Redis balances against the durable ledger"""
+    loop = asyncio.get_event_loop()
+    return loop.run_until_complete(_reconcile_credit_balances_async())
+
+
+async def _reconcile_credit_balances_async():
+    from hot_credits import HotCreditLedger, create_redis_client, make_ledger_sink
+    
+    redis_client = create_redis_client()
+    try:
+        ledger = HotCreditLedger(redis_client, make_ledger_sink())
+        result = await ledger.reconcile()
+    finally:
+        await redis_client.close()
+    
+    if result['drifted']:
+        print(f"🔧 Hot credit balances: {len(result['drifted'])} drifted, {result['repaired']} repaired")
+    return result
+
+
 # Health check task
 @celery_app.task(name='celery_tasks.health_check')
 def health_check():
@@ -0,0 +1,266 @@
+# Chat Context Builder
+# Compact prompts for /api/chat: a running summary of older turns (updated in
+# the background after each response and cached per project), the last few
+# raw turns with code stripped, and an outline of the current page plus only
+# the excerpts relevant to the request instead of the raw page
+
+from file_retrieval import FileRetriever, query_terms
+from html.parser import HTMLParser
+from prometheus_client import Histogram
+from redis_cache import cache
+from typing import Dict, List, NamedTuple, Optional
+import asyncio
+import logging
+import os
+import re
+
+logger = logging.getLogger(__name__)
+
+CHAT_RECENT_TURNS = int(os.environ.get('CHAT_RECENT_TURNS', '4'))
+# Turns kept raw when the background summary lags behind
+CHAT_MAX_RAW_TURNS = int(os.environ.get('CHAT_MAX_RAW_TURNS', '8'))
+CHAT_RAW_TURN_CHARS = int(os.environ.get('CHAT_RAW_TURN_CHARS', '2000'))
+CHAT_SUMMARY_MAX_CHARS = int(os.environ.get('CHAT_SUMMARY_MAX_CHARS', '1500'))
+CHAT_SUMMARY_TTL = int(os.environ.get('CHAT_SUMMARY_TTL', str(30 * 86400)))
+CHAT_SUMMARY_MODEL = os.environ.get('CHAT_SUMMARY_MODEL', 'gpt-4o-mini')
+# Most turns folded per update, so catching up on a long history stays cheap
+CHAT_SUMMARY_BATCH = int(os.environ.get('CHAT_SUMMARY_BATCH', '40'))
+# Pages up to this size are sent verbatim; larger ones as outline + excerpts
+CHAT_CODE_INLINE_CHARS = int(os.environ.get('CHAT_CODE_INLINE_CHARS', '6000'))
+CHAT_CODE_EXCERPT_CHARS = int(os.environ.get('CHAT_CODE_EXCERPT_CHARS', '6000'))
+CHAT_OUTLINE_MAX_CHARS = int(os.environ.get('CHAT_OUTLINE_MAX_CHARS', '2500'))
+CHAT_EXCERPT_LINES = 20
+CHARS_PER_TOKEN = 4
+
+CODE_BLOCK_RE = re.compile(r'```[\w+-]*\n.*?(?:```|$)', re.DOTALL)
+CSS_SELECTOR_RE = re.compile(r'([^{};]+)\{')
+JS_FUNCTION_RE = re.compile(
+    r'function\s+([A-Za-z_$][\w$]*)|(?:const|let|var)\s+([A-Za-z_$][\w$]*)\s*=\s*(?:async\s*)?(?:function|\([^)]*\)\s*=>|[A-Za-z_$][\w$]*\s*=>)'
+)
+
+CHAT_PROMPT_TOKENS = Histogram(
+    'chat_prompt_input_tokens',
+    'Estimated /api/chat prompt tokens by part',
+    ['part'],
+    buckets=(50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+)
+
+SUMMARY_SYSTEM_PROMPT = """You maintain a running summary of a website-building chat.
+Merge the new turns into the existing summary. Keep: what the site is for, design
+decisions (colors, fonts, layout, sections), features added or removed, open requests
+and user preferences. Drop pleasantries and code. Plain sentences, at most 12 bullet
+points, under 200 words. Return only the summary."""
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text or "") // CHARS_PER_TOKEN
+
+
+def strip_code(content: str) -> str:
+    """Replace fenced code with a one-line marker so the prose survives truncation"""
+    def marker(match):
+        return f"[code omitted: {match.group(0).count(chr(10))} lines]"
+    text = CODE_BLOCK_RE.sub(marker, content)
+    if len(text) > CHAT_RAW_TURN_CHARS:
+        text = text[:CHAT_RAW_TURN_CHARS] + "…"
+    return text
+
+
+class _OutlineParser(HTMLParser):
+    """Element skeleton (tag#id.class and headings/button text) plus style and script bodies"""
+
+    SKIPPED = {'meta', 'link', 'br', 'hr', 'img', 'path', 'svg', 'span', 'i', 'b', 'strong', 'em', 'a', 'li', 'option'}
+    LABELLED = {'h1', 'h2', 'h3', 'h4', 'button', 'title', 'label'}
+    VOID = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source', 'track', 'wbr'}
+
+    def __init__(self, max_depth: int = 6):
+        super().__init__()
+        self.max_depth = max_depth
+        self.lines: List[str] = []
+        self.styles: List[str] = []
+        self.scripts: List[str] = []
+        self.depth = 0
+        self._stack: List[str] = []
+        self._label_line: Optional[int] = None
+
+    def handle_starttag(self, tag, attrs):
+        attributes = dict(attrs)
+        if tag not in self.SKIPPED and self.depth <= self.max_depth:
+            name = tag
+            if attributes.get('id'):
+                name += f"#{attributes['id']}"
+            if attributes.get('class'):
+                name += "." + ".".join(attributes['class'].split()[:3])
+            self.lines.append("  " * self.depth + name)
+            if tag in self.LABELLED:
+                self._label_line = len(self.lines) - 1
+        if tag not in self.VOID:
+            self._stack.append(tag)
+            self.depth += 1
+
+    def handle_endtag(self, tag):
+        if tag in self._stack:
+            while self._stack:
+                self.depth -= 1
+                if self._stack.pop() == tag:
+                    break
+        if tag in self.LABELLED:
+            self._label_line = None
+
+    def handle_data(self, data):
+        current = self._stack[-1] if self._stack else None
+        if current == 'style':
+            self.styles.append(data)
+        elif current == 'script':
+            self.scripts.append(data)
+        elif self._label_line is not None and data.strip():
+            line = self.lines[self._label_line]
+            if '"' not in line:
+                self.lines[self._label_line] = f'{line} "{data.strip()[:60]}"'
+
+
+def outline_html(code: str, max_chars: int = CHAT_OUTLINE_MAX_CHARS) -> str:
+    """Compact structural outline of an HTML page: elements, CSS selectors and JS functions"""
+    parser = _OutlineParser()
+    try:
+        parser.feed(code)
+        parser.close()
+    except Exception as e:
+        logger.debug(f"Outline parse stopped early: {e}")
+
+    selectors = []
+    for style in parser.styles:
+        for selector in CSS_SELECTOR_RE.findall(style):
+            selector = " ".join(selector.split())
+            if selector and selector not in selectors:
+                selectors.append(selector)
+    functions = []
+    for script in parser.scripts:
+        for match in JS_FUNCTION_RE.finditer(script):
+            name = match.group(1) or match.group(2)
+            if name not in functions:
+                functions.append(name)
+
+    sections = ["Structure:\n" + "\n".join(parser.lines)]
+    if selectors:
+        sections.append("CSS selectors: " + ", ".join(selectors))
+    if functions:
+        sections.append("JS functions: " + ", ".join(functions))
+    outline = "\n\n".join(sections)
+    if len(outline) > max_chars:
+        outline = outline[:max_chars] + "\n…"
+    return outline
+
+
+def code_context(code: str, request: str) -> str:
+    """The current page for a prompt: verbatim when small, otherwise outline + relevant excerpts"""
+    excerpts = ""
+    if len(code) > CHAT_CODE_INLINE_CHARS:
+        excerpts = FileRetriever.best_chunks(code, query_terms(request), CHAT_CODE_EXCERPT_CHARS, CHAT_EXCERPT_LINES)
+    # Small pages, and pages with no window that fits (e.g. minified), go verbatim
+    if not excerpts:
+        context = f"Current website code (index.html):\n```html\n{code}\n```"
+    else:
+        context = (
+            f"Current website (index.html, {len(code.splitlines())} lines) outline:\n{outline_html(code)}\n\n"
+            f"Excerpts relevant to the request (copy SEARCH lines from these exactly):\n```html\n{excerpts}\n```"
+        )
+    CHAT_PROMPT_TOKENS.labels('code').observe(estimate_tokens(context))
+    return context
+
+
+class ChatContext(NamedTuple):
+    summary: str
+    turns: List[Dict]  # [{"role", "content"}], oldest first
+
+
+class ChatContextBuilder:
+    """
+    Running per-project summaries for /api/chat.
+
+    The summary covers every message up to `through` (a created_at value);
+    prompts carry it plus the raw turns after it. After each response the
+    turns that fell out of the raw window are folded in by a cheap model,
+    in the background and at most once at a time per project.
+    """
+
+    def __init__(self, messages_collection, openai_client, model: str = CHAT_SUMMARY_MODEL):
+        self.messages = messages_collection
+        self.openai_client = openai_client
+        self.model = model
+        self._updating = set()
+        self._tasks = set()
+
+    @staticmethod
+    def _key(project_id: str) -> str:
+        return f"chatsummary:{project_id}"
+
+    async def build(self, project_id: str, exclude_id: Optional[str] = None) -> ChatContext:
+        """Summary plus the unsummarized turns (at most CHAT_MAX_RAW_TURNS), code stripped"""
+        state = await cache.get(self._key(project_id)) or {}
+        query = {"project_id": project_id, "role": {"$in": ["user", "assistant"]}}
+        if state.get("through"):
+            query["created_at"] = {"$gt": state["through"]}
+        if exclude_id:
+            query["id"] = {"$ne": exclude_id}
+        recent = await self.messages.find(query, {"_id": 0, "role": 1, "content": 1}).sort(
+            "created_at", -1
+        ).limit(CHAT_MAX_RAW_TURNS).to_list(length=CHAT_MAX_RAW_TURNS)
+        recent.reverse()
+
+        turns = [{"role": message["role"], "content": strip_code(message["content"])} for message in recent]
+        summary = state.get("summary", "")
+        CHAT_PROMPT_TOKENS.labels('summary').observe(estimate_tokens(summary))
+        CHAT_PROMPT_TOKENS.labels('turns').observe(sum(estimate_tokens(turn["content"]) for turn in turns))
+        return ChatContext(summary, turns)
+
+    def schedule_update(self, project_id: str):
+        """Fold older turns into the summary without delaying the response"""
+        if project_id in self._updating:
+            return
+        self._updating.add(project_id)
+        task = asyncio.get_running_loop().create_task(self._update(project_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _update(self, project_id: str):
+        try:
+            key = self._key(project_id)
+            state = await cache.get(key) or {}
+            query = {"project_id": project_id, "role": {"$in": ["user", "assistant"]}}
+            if state.get("through"):
+                query["created_at"] = {"$gt": state["through"]}
+            limit = CHAT_SUMMARY_BATCH + CHAT_RECENT_TURNS
+            pending = await self.messages.find(query, {"_id": 0, "role": 1, "content": 1, "created_at": 1}).sort(
+                "created_at", 1
+            ).limit(limit).to_list(length=limit)
+            # The newest turns stay raw in the prompt
+            to_fold = pending[:max(len(pending) - CHAT_RECENT_TURNS, 0)][:CHAT_SUMMARY_BATCH]
+            if not to_fold:
+                return
+
+            summary = await self._summarize(state.get("summary", ""), to_fold)
+            await cache.set(key, {
+                "summary": summary[:CHAT_SUMMARY_MAX_CHARS],
+                "through": to_fold[-1]["created_at"],
+            }, ttl=CHAT_SUMMARY_TTL)
+        except Exception as e:
+            logger.warning(f"Chat summary update failed for project {project_id}: {e}")
+        finally:
+            self._updating.discard(project_id)
+
+    async def _summarize(self, previous: str, turns: List[Dict]) -> str:
+        transcript = "\n".join(f"{turn['role']}: {strip_code(turn['content'])}" for turn in turns)
+        completion = await self.openai_client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+                {"role": "user", "content": f"Existing summary:\n{previous or '(none)'}\n\nNew turns:\n{transcript}"},
+            ],
+            temperature=0.2,
+            max_tokens=400
+        )
+        return completion.choices[0].message.content.strip()
+
+    async def clear(self, project_id: str):
+        await cache.delete(self._key(project_id))
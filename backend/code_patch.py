@@ -0,0 +1,356 @@
+# Code Patch Protocol
+# Edit protocol for LLM code changes: the model answers with search/replace
+# blocks (or a unified diff) instead of the whole file; hunks are applied with
+# whitespace-tolerant and fuzzy anchoring and the result is validated before
+# it replaces the file. Callers fall back to full regeneration on failure.
+
+from difflib import SequenceMatcher
+from prometheus_client import Counter, Histogram
+from typing import List, NamedTuple, Optional, Tuple
+import json
+import os
+import re
+
+# Minimum similarity for a fuzzy anchor when no exact/whitespace match exists
+EDIT_FUZZY_THRESHOLD = float(os.environ.get('EDIT_FUZZY_THRESHOLD', '0.85'))
+# A fenced block replaces the file only if it keeps this share of its lines;
+# shorter blocks are taken for example snippets
+EDIT_FULL_MIN_RATIO = float(os.environ.get('EDIT_FULL_MIN_RATIO', '0.5'))
+# Files shorter than this (lines) accept any complete replacement
+EDIT_FULL_MIN_LINES = 10
+CHARS_PER_TOKEN = 4
+
+EDIT_PROTOCOL_INSTRUCTIONS = """Return ONLY the changes, as SEARCH/REPLACE blocks (not the whole file):
+
+<<<<<<< SEARCH
+exact lines copied from the current file
+=======
+the lines that replace them
+>>>>>>> REPLACE
+
+Rules:
+- SEARCH must match the current file exactly, including indentation, with just enough lines to be unique
+- One block per separate change, in file order
+- To delete code leave REPLACE empty; to insert code, SEARCH a neighbouring line and repeat it in REPLACE
+- A one or two sentence summary may precede the blocks
+- Only if the request rewrites most of the file, return the complete file in a single fenced code block instead"""
+
+BLOCK_RE = re.compile(
+    r'^<{5,9} ?SEARCH[^\n]*\n(.*?)^={5,9}[ \t]*\n(.*?)^>{5,9} ?REPLACE[^\n]*$',
+    re.MULTILINE | re.DOTALL
+)
+FENCE_RE = re.compile(r'```([\w+-]*)[ \t]*\n(.*?)\n?```', re.DOTALL)
+HUNK_HEADER_RE = re.compile(r'^@@ .* @@')
+
+EDIT_RESULTS = Counter(
+    'llm_edit_results_total',
+    'LLM code edits by how they were applied (patch, full, fallback, failed)',
+    ['caller', 'outcome']
+)
+EDIT_OUTPUT_TOKENS = Histogram(
+    'llm_edit_output_tokens',
+    'Estimated output tokens of LLM code edit responses',
+    ['caller', 'mode'],
+    buckets=(50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000)
+)
+EDIT_LATENCY = Histogram(
+    'llm_edit_latency_seconds',
+    'Provider latency of LLM code edit requests',
+    ['caller', 'mode'],
+    buckets=(0.5, 1, 2, 4, 8, 15, 30, 60, 120)
+)
+
+
+class Hunk(NamedTuple):
+    search: str
+    replace: str
+
+
+class ParsedEdit(NamedTuple):
+    hunks: List[Hunk]
+    full_content: Optional[str]  # Set when the model returned a complete file instead
+
+
+class PatchResult(NamedTuple):
+    content: Optional[str]  # None when the edit could not be applied or failed validation
+    mode: str               # "patch" | "full" | "failed"
+    error: Optional[str] = None
+    fuzzy_hunks: int = 0
+
+
+class PatchError(Exception):
+    pass
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text or "") // CHARS_PER_TOKEN
+
+
+def record_edit(caller: str, mode: str, response: str, seconds: float):
+    """Record one provider call; mode is patch, full or fallback (failed responses count as patch)"""
+    label = "patch" if mode == "failed" else mode
+    EDIT_RESULTS.labels(caller, mode).inc()
+    EDIT_OUTPUT_TOKENS.labels(caller, label).observe(estimate_tokens(response))
+    EDIT_LATENCY.labels(caller, label).observe(seconds)
+
+
+# ==================== Parsing ====================
+
+def _strip_final_newline(text: str) -> str:
+    return text[:-1] if text.endswith('\n') else text
+
+
+def parse_unified_diff(text: str) -> List[Hunk]:
+    """Each @@ hunk becomes a search (context + removed) / replace (context + added) pair"""
+    hunks = []
+    search: Optional[List[str]] = None
+    replace: List[str] = []
+    for line in text.splitlines():
+        if HUNK_HEADER_RE.match(line):
+            if search is not None:
+                hunks.append(Hunk("\n".join(search), "\n".join(replace)))
+            search, replace = [], []
+        elif search is None or line.startswith('\\'):
+            continue  # File headers and "\ No newline at end of file"
+        elif line.startswith('-') and not line.startswith('---'):
+            search.append(line[1:])
+        elif line.startswith('+') and not line.startswith('+++'):
+            replace.append(line[1:])
+        elif line.startswith(' ') or line == '':
+            search.append(line[1:])
+            replace.append(line[1:])
+    if search is not None:
+        hunks.append(Hunk("\n".join(search), "\n".join(replace)))
+    return [hunk for hunk in hunks if hunk.search != hunk.replace]
+
+
+def parse_edit_response(response: str) -> ParsedEdit:
+    """SEARCH/REPLACE blocks, else a unified diff, else a complete file in a code fence"""
+    response = response.replace('\r\n', '\n')
+    blocks = BLOCK_RE.findall(response)
+    if blocks:
+        return ParsedEdit(
+            [Hunk(_strip_final_newline(search), _strip_final_newline(replace)) for search, replace in blocks],
+            None
+        )
+
+    fences = FENCE_RE.findall(response)
+    for language, body in fences:
+        if language == 'diff' or any(HUNK_HEADER_RE.match(line) for line in body.splitlines()):
+            hunks = parse_unified_diff(body)
+            if hunks:
+                return ParsedEdit(hunks, None)
+    if any(HUNK_HEADER_RE.match(line) for line in response.splitlines()):
+        hunks = parse_unified_diff(response)
+        if hunks:
+            return ParsedEdit(hunks, None)
+
+    if fences:
+        return ParsedEdit([], max((body for _, body in fences), key=len))
+    return ParsedEdit([], None)
+
+
+def strip_edit_blocks(response: str) -> str:
+    """The prose part of an edit response (SEARCH/REPLACE blocks and diffs removed)"""
+    text = BLOCK_RE.sub('', response.replace('\r\n', '\n'))
+    text = FENCE_RE.sub(lambda match: '' if match.group(1) == 'diff' else match.group(0), text)
+    return re.sub(r'\n{3,}', '\n\n', text).strip()
+
+
+# ==================== Applying ====================
+
+def _indent(line: str) -> str:
+    return line[:len(line) - len(line.lstrip())]
+
+
+def _first_text_line(lines: List[str]) -> Optional[str]:
+    return next((line for line in lines if line.strip()), None)
+
+
+def _unique_match(positions: List[int], search: List[str], start: int) -> Optional[int]:
+    """
+    The single match at or after `start` (file order), else the single match
+    anywhere; a SEARCH block matching several places is ambiguous
+    """
+    candidates = [i for i in positions if i >= start] or positions
+    if len(candidates) > 1:
+        preview = (_first_text_line(search) or '').strip()[:80]
+        raise PatchError(f"SEARCH block matches {len(candidates)} places, not unique: {preview!r}")
+    return candidates[0] if candidates else None
+
+
+def _find_exact(lines: List[str], search: List[str], start: int) -> Optional[int]:
+    size = len(search)
+    positions = [
+        i for i in range(len(lines) - size + 1)
+        if lines[i] == search[0] and lines[i:i + size] == search
+    ]
+    return _unique_match(positions, search, start)
+
+
+def _find_stripped(lines: List[str], search: List[str], start: int) -> Optional[int]:
+    size = len(search)
+    stripped = [line.strip() for line in search]
+    positions = [
+        i for i in range(len(lines) - size + 1)
+        if lines[i].strip() == stripped[0] and [line.strip() for line in lines[i:i + size]] == stripped
+    ]
+    return _unique_match(positions, search, start)
+
+
+def _find_fuzzy(lines: List[str], search: List[str], start: int) -> Optional[int]:
+    """Best window above EDIT_FUZZY_THRESHOLD; None if absent or ambiguous"""
+    size = len(search)
+    target = "\n".join(line.strip() for line in search)
+    matcher = SequenceMatcher(None, autojunk=False)
+    matcher.set_seq2(target)
+    best, best_ratio, tie = None, EDIT_FUZZY_THRESHOLD, False
+    for i in range(start, len(lines) - size + 1):
+        matcher.set_seq1("\n".join(line.strip() for line in lines[i:i + size]))
+        if matcher.real_quick_ratio() < best_ratio or matcher.quick_ratio() < best_ratio:
+            continue
+        ratio = matcher.ratio()
+        if ratio > best_ratio:
+            best, best_ratio, tie = i, ratio, False
+        elif ratio == best_ratio and best is not None:
+            tie = True
+    return None if tie else best
+
+
+def _reindent(replace: List[str], search_indent: str, target_indent: str) -> List[str]:
+    if search_indent == target_indent:
+        return replace
+    result = []
+    for line in replace:
+        if line.startswith(search_indent):
+            result.append(target_indent + line[len(search_indent):])
+        else:
+            result.append(line)
+    return result
+
+
+def apply_hunk(lines: List[str], hunk: Hunk, start: int = 0) -> Tuple[List[str], int, bool]:
+    """
+    Apply one hunk to `lines`, anchoring exactly, then ignoring indentation,
+    then fuzzily; hunks are searched from `start` (file order) and then from
+    the top. An anchor that matches several places raises PatchError.
+    Returns (new lines, position after the replacement, fuzzy).
+    """
+    search = hunk.search.split('\n')
+    replace = hunk.replace.split('\n') if hunk.replace else []
+    if not hunk.search.strip():
+        if any(line.strip() for line in lines):
+            raise PatchError("empty SEARCH section on a non-empty file")
+        return replace, len(replace), False
+
+    for finder, fuzzy in ((_find_exact, False), (_find_stripped, False), (_find_fuzzy, True)):
+        position = finder(lines, search, start)
+        if position is None and start:
+            position = finder(lines, search, 0)
+        if position is None:
+            continue
+        if finder is not _find_exact:
+            search_line = _first_text_line(search)
+            target_line = _first_text_line(lines[position:position + len(search)])
+            if search_line is not None and target_line is not None:
+                replace = _reindent(replace, _indent(search_line), _indent(target_line))
+        new_lines = lines[:position] + replace + lines[position + len(search):]
+        return new_lines, position + len(replace), fuzzy
+
+    preview = hunk.search.strip().splitlines()[0][:80]
+    raise PatchError(f"SEARCH block not found: {preview!r}")
+
+
+def apply_hunks(original: str, hunks: List[Hunk]) -> Tuple[str, int]:
+    """Apply hunks in order; returns (content, number of fuzzy-anchored hunks)"""
+    newline = '\r\n' if '\r\n' in original else '\n'
+    text = original.replace('\r\n', '\n')
+    trailing_newline = text.endswith('\n')
+    lines = text[:-1].split('\n') if trailing_newline else (text.split('\n') if text else [])
+
+    position = 0
+    fuzzy_hunks = 0
+    for hunk in hunks:
+        lines, position, fuzzy = apply_hunk(lines, hunk, position)
+        fuzzy_hunks += fuzzy
+
+    content = '\n'.join(lines) + ('\n' if trailing_newline else '')
+    return content.replace('\n', newline), fuzzy_hunks
+
+
+# ==================== Validation ====================
+
+BRACKET_PAIRS = ('{}', '()', '[]')
+HTML_CLOSING_TAGS = ('</html>', '</head>', '</body>')
+HTML_DOCUMENT_MARKERS = ('<!doctype', '<html')
+
+
+def check_full_content(path: str, original: str, content: str) -> Optional[str]:
+    """
+    Reason a fenced block is not plausibly the whole file, or None. Models
+    often show an example snippet without SEARCH/REPLACE blocks; taking it as
+    the file would silently truncate it.
+    """
+    original_lines = len(original.strip().splitlines())
+    content_lines = len(content.strip().splitlines())
+    if original_lines >= EDIT_FULL_MIN_LINES and content_lines < original_lines * EDIT_FULL_MIN_RATIO:
+        return f"code block looks like a snippet ({content_lines} of {original_lines} lines)"
+    if os.path.splitext(path)[1].lower() in ('.html', '.htm'):
+        lower_original, lower_content = original.lower(), content.lower()
+        for marker in HTML_DOCUMENT_MARKERS:
+            if marker in lower_original and marker not in lower_content:
+                return f"code block is not a complete document (no {marker})"
+    return None
+
+
+def validate_edit(path: str, original: str, content: str) -> Optional[str]:
+    """Reason the edited content is unusable, or None"""
+    if original.strip() and not content.strip():
+        return "edit emptied the file"
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.json':
+        try:
+            json.loads(content)
+        except ValueError as e:
+            return f"invalid JSON: {e}"
+    elif extension == '.py':
+        try:
+            compile(content, path, 'exec')
+        except SyntaxError as e:
+            return f"invalid Python: {e.msg} (line {e.lineno})"
+    else:
+        # Brackets that balanced before must still balance
+        for opening, closing in BRACKET_PAIRS:
+            before = original.count(opening) - original.count(closing)
+            after = content.count(opening) - content.count(closing)
+            if before == 0 and after != 0:
+                return f"unbalanced '{opening}{closing}' after edit"
+        if extension in ('.html', '.htm'):
+            lower_original, lower_content = original.lower(), content.lower()
+            for tag in HTML_CLOSING_TAGS:
+                if tag in lower_original and tag not in lower_content:
+                    return f"edit removed {tag}"
+    return None
+
+
+def apply_edit_response(original: str, response: str, path: str) -> PatchResult:
+    """Parse a model response in the edit protocol and apply it to `original`"""
+    parsed = parse_edit_response(response)
+    if parsed.hunks:
+        try:
+            content, fuzzy_hunks = apply_hunks(original, parsed.hunks)
+        except PatchError as e:
+            return PatchResult(None, "failed", str(e))
+        error = validate_edit(path, original, content)
+        if error:
+            return PatchResult(None, "failed", error)
+        return PatchResult(content, "patch", None, fuzzy_hunks)
+
+    if parsed.full_content is not None:
+        error = (check_full_content(path, original, parsed.full_content)
+                 or validate_edit(path, original, parsed.full_content))
+        if error:
+            return PatchResult(None, "failed", error)
+        return PatchResult(parsed.full_content, "full")
+
+    return PatchResult(None, "failed", "no SEARCH/REPLACE blocks, diff or code block in response")
@@ -0,0 +1,215 @@
+# Container File Sync
+# Bulk file injection into containers: changed files are packed into a single
+# tar (in memory, or a temp file for large payloads) and sent with one
+# put_archive call. A content-hash manifest per container, cached here and
+# stored inside the container, means repeated syncs only send deltas
+
+from collections import OrderedDict
+from prometheus_client import Counter
+from typing import Dict, Optional, Union
+import asyncio
+import hashlib
+import io
+import json
+import logging
+import os
+import posixpath
+import tarfile
+import tempfile
+import time
+import weakref
+
+import docker
+
+logger = logging.getLogger(__name__)
+
+# Payloads above this size are spooled to a temp file instead of memory (bytes)
+CONTAINER_SYNC_MEMORY_BYTES = int(os.environ.get('CONTAINER_SYNC_MEMORY_BYTES', str(8 * 1024 * 1024)))
+CONTAINER_SYNC_MAX_MANIFESTS = int(os.environ.get('CONTAINER_SYNC_MAX_MANIFESTS', '1024'))
+# Kept in the container so a new API process can pick up where the last one left off
+MANIFEST_PATH = '/tmp/.autowebiq-sync-manifest.json'
+# Paths per `rm` exec when pruning, well below ARG_MAX
+RM_BATCH = 200
+
+SYNC_FILES = Counter(
+    'container_sync_files_total',
+    'Files handled by container syncs (sent, unchanged, deleted)',
+    ['result']
+)
+SYNC_BYTES = Counter(
+    'container_sync_bytes_total',
+    'Tar bytes sent to containers with put_archive'
+)
+
+
+def normalize_path(path: str) -> str:
+    """Relative POSIX path inside the sync root; rejects absolute paths and '..' escapes"""
+    normalized = posixpath.normpath(path.replace('\\', '/'))
+    if normalized.startswith('/') or normalized == '.' or normalized.split('/')[0] == '..':
+        raise ValueError(f"Invalid file path: {path}")
+    return normalized
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_hash(path: str) -> Optional[str]:
+    """sha256 of a host file, or None if it can't be read"""
+    try:
+        with open(path, 'rb') as handle:
+            return content_hash(handle.read())
+    except OSError:
+        return None
+
+
+def build_archive(entries: Dict[str, bytes], fileobj) -> int:
+    """
+    Write a tar of {archive path: content} to fileobj, with directory entries
+    for the parents, owned by this process's uid/gid so bind-mounted files
+    stay writable from the host. Returns the archive size.
+    """
+    now = time.time()
+    uid, gid = os.getuid(), os.getgid()
+    directories = set()
+    with tarfile.open(fileobj=fileobj, mode='w') as tar:
+        for name in sorted(entries):
+            parent = posixpath.dirname(name)
+            missing = []
+            while parent and parent not in directories:
+                missing.append(parent)
+                directories.add(parent)
+                parent = posixpath.dirname(parent)
+            # Top-level directories (workspace, tmp) already exist; only create nested ones
+            for directory in reversed(missing):
+                if '/' not in directory:
+                    continue
+                info = tarfile.TarInfo(directory)
+                info.type = tarfile.DIRTYPE
+                info.mode, info.mtime, info.uid, info.gid = 0o755, now, uid, gid
+                tar.addfile(info)
+
+            data = entries[name]
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mode = 0o755 if name.endswith('.sh') else 0o644
+            info.mtime, info.uid, info.gid = now, uid, gid
+            tar.addfile(info, io.BytesIO(data))
+    return fileobj.tell()
+
+
+class ContainerFileSync:
+    """
+    Per-container manifests of {absolute path: sha256} for files written by
+    sync(). Files edited behind its back are only seen when the caller passes
+    the host side of a bind mount as host_root (their host copy is hashed
+    too); otherwise pass force=True to resend everything.
+    """
+
+    def __init__(self, max_manifests: int = CONTAINER_SYNC_MAX_MANIFESTS):
+        self.max_manifests = max_manifests
+        self._manifests: "OrderedDict[str, Dict[str, str]]" = OrderedDict()
+        # One sync at a time per container, so manifests are never based on stale state
+        self._locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+    def _lock(self, container_id: str) -> asyncio.Lock:
+        lock = self._locks.get(container_id)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._locks[container_id] = lock
+        return lock
+
+    def _remember(self, container_id: str, manifest: Dict[str, str]):
+        self._manifests[container_id] = manifest
+        self._manifests.move_to_end(container_id)
+        while len(self._manifests) > self.max_manifests:
+            self._manifests.popitem(last=False)
+
+    def forget(self, container_id: str):
+        self._manifests.pop(container_id, None)
+
+    @staticmethod
+    def _read_manifest(container) -> Dict[str, str]:
+        """Manifest stored in the container by an earlier sync, or {} if there is none"""
+        try:
+            stream, _ = container.get_archive(MANIFEST_PATH)
+            with tarfile.open(fileobj=io.BytesIO(b''.join(stream))) as tar:
+                member = tar.next()
+                return json.loads(tar.extractfile(member).read())
+        except docker.errors.NotFound:
+            return {}
+        except Exception as e:
+            logger.warning(f"Unreadable sync manifest in {container.name}, resending all files: {e}")
+            return {}
+
+    @staticmethod
+    def _push(container, files: Dict[str, Union[str, bytes]], dest: str, prune: bool,
+              manifest: Dict[str, str], host_root: Optional[str]) -> Dict:
+        changed: Dict[str, bytes] = {}
+        wanted = set()
+        updated = dict(manifest)
+        for path, content in files.items():
+            data = content.encode('utf-8') if isinstance(content, str) else content
+            relative = normalize_path(path)
+            target = posixpath.join(dest, relative)
+            wanted.add(target)
+            digest = content_hash(data)
+            if manifest.get(target) != digest or (
+                    host_root is not None and file_hash(os.path.join(host_root, relative)) != digest):
+                changed[target] = data
+                updated[target] = digest
+
+        removed = []
+        if prune:
+            prefix = dest.rstrip('/') + '/'
+            removed = sorted(path for path in manifest if path.startswith(prefix) and path not in wanted)
+            for path in removed:
+                del updated[path]
+
+        sent = 0
+        if changed or removed:
+            entries = {path.lstrip('/'): data for path, data in changed.items()}
+            entries[MANIFEST_PATH.lstrip('/')] = json.dumps(updated, separators=(',', ':')).encode()
+            payload = sum(len(data) for data in entries.values())
+            spool = io.BytesIO() if payload < CONTAINER_SYNC_MEMORY_BYTES else tempfile.TemporaryFile()
+            with spool:
+                sent = build_archive(entries, spool)
+                spool.seek(0)
+                if not container.put_archive('/', spool):
+                    raise RuntimeError(f"put_archive into {container.name} was rejected")
+            for start in range(0, len(removed), RM_BATCH):
+                container.exec_run(['rm', '-f', '--', *removed[start:start + RM_BATCH]])
+
+        SYNC_FILES.labels('sent').inc(len(changed))
+        SYNC_FILES.labels('unchanged').inc(len(files) - len(changed))
+        SYNC_FILES.labels('deleted').inc(len(removed))
+        SYNC_BYTES.inc(sent)
+        return {
+            "manifest": updated,
+            "files_sent": len(changed),
+            "files_unchanged": len(files) - len(changed),
+            "files_deleted": len(removed),
+            "bytes_sent": sent,
+        }
+
+    async def sync(self, container, files: Dict[str, Union[str, bytes]], dest: str = '/workspace',
+                   prune: bool = False, force: bool = False, host_root: Optional[str] = None) -> Dict:
+        """
+        Write `files` ({path relative to dest: content}) into a running
+        container in one put_archive call, skipping files whose content the
+        container already has. With prune=True, files from earlier syncs under
+        dest that are not in `files` are deleted. host_root is the host
+        directory bind-mounted at dest, if any: files whose host copy differs
+        (edited outside sync) are resent even when the manifest matches.
+        """
+        async with self._lock(container.id):
+            manifest: Optional[Dict[str, str]] = None if force else self._manifests.get(container.id)
+            if manifest is None:
+                manifest = {} if force else await asyncio.to_thread(self._read_manifest, container)
+            result = await asyncio.to_thread(self._push, container, files, dest, prune, manifest, host_root)
+            self._remember(container.id, result.pop("manifest"))
+        return {"status": "success", **result}
+
+
+# Global instance
+container_sync = ContainerFileSync()
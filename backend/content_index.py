@@ -0,0 +1,375 @@
+# Workspace Content Index
+# Per-workspace trigram index over text files for substring and regex search
+# with line-level hits; kept current from API writes and the file tree index
+
+from array import array
+from async_fs import run_io
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import fnmatch
+import logging
+import os
+import re
+import threading
+
+logger = logging.getLogger(__name__)
+
+FS_SEARCH_MAX_WORKSPACES = int(os.environ.get('FS_SEARCH_MAX_WORKSPACES', '64'))
+# Approximate memory per workspace (file text + postings); files past the cap
+# stay searchable by reading them from disk
+FS_SEARCH_MAX_BYTES = int(os.environ.get('FS_SEARCH_MAX_BYTES', str(64 * 1024 * 1024)))
+FS_SEARCH_MAX_FILE_BYTES = int(os.environ.get('FS_SEARCH_MAX_FILE_BYTES', str(1024 * 1024)))
+MAX_LINE_PREVIEW = 200
+POSTING_BYTES = 4
+
+
+def trigrams(text: str) -> Set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def read_text_file(path: str) -> Optional[str]:
+    """File contents as text, or None for binary/oversized/unreadable files"""
+    try:
+        if os.path.getsize(path) > FS_SEARCH_MAX_FILE_BYTES:
+            return None
+        with open(path, 'rb') as f:
+            raw = f.read()
+    except OSError:
+        return None
+    if b'\0' in raw[:8192]:
+        return None
+    try:
+        return raw.decode('utf-8')
+    except UnicodeDecodeError:
+        return None
+
+
+# Inline flags such as (?x) or (?i:...), and escapes that spell a character
+# by code (\x41, \u0041, \N{...}, \101) or a group reference (\1)
+INLINE_FLAGS_RE = re.compile(r'\(\?[aiLmsux-]')
+CHARACTER_ESCAPE_RE = re.compile(r'\\[xuUN0-9]')
+
+
+def required_literals(pattern: str) -> List[str]:
+    """
+    Literal runs every match of `pattern` must contain (conservative).
+    Alternations and group contents are skipped, so the result may be empty
+    (meaning: no trigram filtering), but it never excludes a real match.
+    Patterns with inline flags (verbose mode changes what is literal) or
+    numeric/named character escapes are not filtered at all.
+    """
+    if '|' in pattern or INLINE_FLAGS_RE.search(pattern) or CHARACTER_ESCAPE_RE.search(pattern):
+        return []
+    literals: List[str] = []
+    current = ''
+    depth = 0
+    i = 0
+
+    def flush():
+        nonlocal current
+        if current:
+            literals.append(current)
+        current = ''
+
+    while i < len(pattern):
+        char = pattern[i]
+        if char == '\\':
+            escaped = pattern[i + 1:i + 2]
+            if depth == 0 and escaped and not escaped.isalnum():
+                current += escaped
+            else:
+                flush()
+            i += 2
+            continue
+        if char == '[':
+            # Character classes are skipped whole, also inside groups, so a
+            # bracket or parenthesis in the class is not taken for syntax
+            flush()
+            end = i + 1
+            if pattern[end:end + 1] == '^':
+                end += 1
+            if pattern[end:end + 1] == ']':
+                end += 1
+            while end < len(pattern) and pattern[end] != ']':
+                end += 2 if pattern[end] == '\\' else 1
+            i = end
+        elif char == '(':
+            flush()
+            depth += 1
+        elif char == ')':
+            depth = max(depth - 1, 0)
+        elif depth > 0:
+            pass
+        elif char in '*?':
+            current = current[:-1]  # Preceding character is optional
+            flush()
+        elif char == '{':
+            current = current[:-1]
+            flush()
+            end = pattern.find('}', i)
+            i = len(pattern) if end == -1 else end
+        elif char in '.^$+':
+            flush()
+        else:
+            current += char
+        i += 1
+    flush()
+    return [literal for literal in literals if len(literal) >= 3]
+
+
+class WorkspaceContentIndex:
+    """
+    Trigram index of one workspace's text files (lower-cased, so it serves
+    both case-sensitive and insensitive queries; hits are verified).
+
+    Files get a fresh id on every (re)index and posting arrays are append-only,
+    so updates never rewrite postings; stale ids are skipped and compacted
+    away once they dominate. All access goes through the I/O pool under a lock.
+    """
+
+    def __init__(self, root: str, max_bytes: int = FS_SEARCH_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.ids: Dict[str, int] = {}
+        self.paths: Dict[int, str] = {}
+        self.texts: Dict[int, str] = {}
+        self.costs: Dict[int, int] = {}
+        self.postings: Dict[str, array] = {}
+        self.sizes: Dict[str, int] = {}
+        self.mtimes: Dict[str, float] = {}
+        # Text files skipped because of the memory cap; searched from disk
+        self.unindexed: Set[str] = set()
+        self.next_id = 0
+        self.bytes_used = 0
+        self.live_postings = 0
+        self.dead_postings = 0
+        self.tree_etag: Optional[str] = None
+
+    # ==================== Updates (blocking, lock held by caller) ====================
+
+    def index_file(self, rel: str, size: Optional[int] = None, mtime: Optional[float] = None):
+        self.remove_file(rel)
+        full_path = os.path.join(self.root, rel)
+        if size is None or mtime is None:
+            try:
+                stat = os.stat(full_path)
+            except OSError:
+                return
+            size, mtime = stat.st_size, stat.st_mtime
+        self.sizes[rel] = size
+        self.mtimes[rel] = mtime
+        text = read_text_file(full_path)
+        if text is None:
+            return
+        grams = trigrams(text.lower())
+        cost = len(text) + POSTING_BYTES * len(grams)
+        if self.bytes_used + cost > self.max_bytes:
+            self.unindexed.add(rel)
+            return
+
+        file_id = self.next_id
+        self.next_id += 1
+        for gram in grams:
+            posting = self.postings.get(gram)
+            if posting is None:
+                posting = self.postings[gram] = array('I')
+            posting.append(file_id)
+        self.ids[rel] = file_id
+        self.paths[file_id] = rel
+        self.texts[file_id] = text
+        self.costs[file_id] = cost
+        self.bytes_used += cost
+        self.live_postings += len(grams)
+
+    def remove_file(self, rel: str):
+        self.sizes.pop(rel, None)
+        self.mtimes.pop(rel, None)
+        self.unindexed.discard(rel)
+        file_id = self.ids.pop(rel, None)
+        if file_id is None:
+            return
+        text = self.texts.pop(file_id)
+        del self.paths[file_id]
+        cost = self.costs.pop(file_id)
+        self.bytes_used -= cost
+        grams = (cost - len(text)) // POSTING_BYTES
+        self.live_postings -= grams
+        self.dead_postings += grams
+        if self.dead_postings > max(self.live_postings, 10000):
+            self._compact()
+
+    def remove_prefix(self, rel: str):
+        """Remove a file or every file under a directory"""
+        prefix = rel.rstrip('/') + '/'
+        for path in [p for p in self.sizes if p == rel or p.startswith(prefix)]:
+            self.remove_file(path)
+
+    def _compact(self):
+        self.postings = {}
+        for file_id, text in self.texts.items():
+            for gram in trigrams(text.lower()):
+                posting = self.postings.get(gram)
+                if posting is None:
+                    posting = self.postings[gram] = array('I')
+                posting.append(file_id)
+        self.dead_postings = 0
+
+    def sync(self, files: Dict[str, Tuple[int, float]], tree_etag: str):
+        """Reconcile with the tree index: (re)index new or modified files, drop missing ones"""
+        for rel, (size, mtime) in files.items():
+            if self.sizes.get(rel) != size or self.mtimes.get(rel) != mtime:
+                self.index_file(rel, size, mtime)
+        for rel in [p for p in self.sizes if p not in files]:
+            self.remove_file(rel)
+        self.tree_etag = tree_etag
+
+    # ==================== Search (blocking, lock held by caller) ====================
+
+    def _candidates(self, literals: Iterable[str]) -> List[int]:
+        result: Optional[Set[int]] = None
+        grams = set()
+        for literal in literals:
+            grams |= trigrams(literal.lower())
+        # Intersect smallest postings first
+        for gram in sorted(grams, key=lambda g: len(self.postings.get(g, ()))):
+            posting = self.postings.get(gram)
+            if posting is None:
+                return []
+            if result is None:
+                result = {file_id for file_id in posting if file_id in self.paths}
+            else:
+                result.intersection_update(posting)
+            if not result:
+                return []
+        if result is None:
+            return list(self.paths)
+        return list(result)
+
+    def search(self, query: str, regex: bool = False, case_sensitive: bool = False,
+               path_glob: str = "*", max_results: int = 200) -> Dict:
+        flags = re.MULTILINE | (0 if case_sensitive else re.IGNORECASE)
+        matcher = re.compile(query if regex else re.escape(query), flags)
+        literals = required_literals(query) if regex else ([query] if len(query) >= 3 else [])
+
+        candidates = sorted(self._candidates(literals), key=lambda file_id: self.paths[file_id])
+        sources = [(self.paths[file_id], self.texts[file_id]) for file_id in candidates]
+        # Files over the memory cap are verified straight from disk
+        sources += [(rel, None) for rel in sorted(self.unindexed)]
+
+        hits = []
+        files_scanned = 0
+        for rel, text in sources:
+            if path_glob != "*" and not fnmatch.fnmatch(rel, path_glob):
+                continue
+            if text is None:
+                text = read_text_file(os.path.join(self.root, rel))
+                if text is None:
+                    continue
+            files_scanned += 1
+            for line_number, column, line in self._matching_lines(matcher, text):
+                hits.append({
+                    "path": rel,
+                    "line": line_number,
+                    "column": column,
+                    "text": line[:MAX_LINE_PREVIEW]
+                })
+                if len(hits) >= max_results:
+                    return {"hits": hits, "truncated": True, "files_scanned": files_scanned}
+        return {"hits": hits, "truncated": False, "files_scanned": files_scanned}
+
+    @staticmethod
+    def _matching_lines(matcher, text: str):
+        """
+        Yield (line_number, column, line) for lines containing a match.
+        Searches the whole text in C and counts newlines incrementally instead
+        of running the pattern line by line; a hit is confirmed on its own
+        line so patterns never match across line breaks.
+        """
+        position = 0
+        line_number = 1
+        counted_to = 0
+        while True:
+            match = matcher.search(text, position)
+            if match is None:
+                return
+            line_start = text.rfind('\n', 0, match.start()) + 1
+            line_end = text.find('\n', match.start())
+            if line_end == -1:
+                line_end = len(text)
+            line_number += text.count('\n', counted_to, line_start)
+            counted_to = line_start
+            line = text[line_start:line_end]
+            line_match = matcher.search(line)
+            if line_match is not None:
+                yield line_number, line_match.start() + 1, line
+            position = line_end + 1
+            if position > len(text):
+                return
+
+
+class ContentIndexRegistry:
+    """LRU of workspace content indexes"""
+
+    def __init__(self, max_workspaces: int = FS_SEARCH_MAX_WORKSPACES):
+        self.max_workspaces = max_workspaces
+        self._indexes: "OrderedDict[str, WorkspaceContentIndex]" = OrderedDict()
+        self._registry_lock = threading.Lock()
+
+    def _get(self, root: str) -> WorkspaceContentIndex:
+        with self._registry_lock:
+            index = self._indexes.get(root)
+            if index is None:
+                index = self._indexes[root] = WorkspaceContentIndex(root)
+                while len(self._indexes) > self.max_workspaces:
+                    self._indexes.popitem(last=False)
+            else:
+                self._indexes.move_to_end(root)
+            return index
+
+    async def run_synced(self, tree_index, func):
+        """
+        Bring the index up to date with `tree_index` (a WorkspaceTreeIndex),
+        then call func(index) on the I/O pool with the index lock held.
+        """
+        index = self._get(tree_index.root)
+        etag = tree_index.etag
+        files = None
+        if index.tree_etag != etag:
+            files = {}
+            for rel in tree_index.files():
+                node = tree_index.nodes[rel]
+                files[rel] = (node["size"], node["modified"])
+
+        def run():
+            with index.lock:
+                if files is not None:
+                    index.sync(files, etag)
+                return func(index)
+
+        return await run_io(run)
+
+    async def search(self, tree_index, query: str, **options) -> Dict:
+        return await self.run_synced(tree_index, lambda index: index.search(query, **options))
+
+    async def file_written(self, root: str, rel: str):
+        index = self._indexes.get(root)
+        if index is None:
+            return
+
+        def run():
+            with index.lock:
+                index.index_file(os.path.normpath(rel.strip('/')))
+
+        await run_io(run)
+
+    async def file_deleted(self, root: str, rel: str):
+        index = self._indexes.get(root)
+        if index is None:
+            return
+
+        def run():
+            with index.lock:
+                index.remove_prefix(os.path.normpath(rel.strip('/')))
+
+        await run_io(run)
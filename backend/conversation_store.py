@@ -0,0 +1,316 @@
+# Conversation Context Store
+# Bounded iterative-chat contexts shared by every API worker: Redis holds a
+# compact serialized context per project, each process keeps a byte-budgeted
+# LRU validated by a version counter, and old turns are rolled into a summary
+
+from collections import OrderedDict
+from datetime import datetime
+from prometheus_client import Counter
+from redis.exceptions import RedisError
+from typing import Dict, List, Optional, Tuple
+import logging
+import orjson
+import os
+import re
+
+logger = logging.getLogger(__name__)
+
+IC_CONTEXT_TTL = int(os.environ.get('IC_CONTEXT_TTL', str(7 * 86400)))
+IC_CONTEXT_CACHE_MAX_ENTRIES = int(os.environ.get('IC_CONTEXT_CACHE_MAX_ENTRIES', '1000'))
+# Approximate in-process budget, measured as serialized bytes
+IC_CONTEXT_CACHE_MAX_BYTES = int(os.environ.get('IC_CONTEXT_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+# Raw turns kept per context; older ones are folded into the summary
+IC_CONTEXT_RECENT_MESSAGES = int(os.environ.get('IC_CONTEXT_RECENT_MESSAGES', '20'))
+IC_CONTEXT_SUMMARY_MAX_CHARS = int(os.environ.get('IC_CONTEXT_SUMMARY_MAX_CHARS', '2000'))
+IC_CONTEXT_FILE_HISTORY = int(os.environ.get('IC_CONTEXT_FILE_HISTORY', '50'))
+# Full transcript kept for the history endpoint
+IC_HISTORY_MAX_MESSAGES = int(os.environ.get('IC_HISTORY_MAX_MESSAGES', '500'))
+# Attempts to save a context that another worker saved concurrently
+IC_CONTEXT_SAVE_ATTEMPTS = 5
+SUMMARY_LINE_CHARS = 160
+
+CONTEXT_LOOKUPS = Counter(
+    'chat_context_lookups_total',
+    'Conversation context loads by source (local, redis, new)',
+    ['source']
+)
+
+# Compare-and-set: the blob is written (with a version bump) only if the
+# stored version is still the one the context was loaded at; -1 otherwise
+SAVE_CONTEXT_SCRIPT = """
+local current = tonumber(redis.call('HGET', KEYS[1], 'v') or '0')
+if current ~= tonumber(ARGV[3]) then
+    return -1
+end
+redis.call('HSET', KEYS[1], 'v', current + 1, 'd', ARGV[1])
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return current + 1
+"""
+
+
+def summarize_turn(message: Dict) -> str:
+    """One line per rolled-up turn: role and the first sentence, whitespace collapsed"""
+    text = re.sub(r'\s+', ' ', message["content"]).strip()
+    sentence = re.split(r'(?<=[.!?])\s', text, maxsplit=1)[0]
+    if len(sentence) > SUMMARY_LINE_CHARS:
+        sentence = sentence[:SUMMARY_LINE_CHARS - 1] + "…"
+    return f"{message['role']}: {sentence}"
+
+
+class ConversationContext:
+    """Manages conversation context for iterative development"""
+
+    def __init__(self, project_id: str, user_id: str):
+        self.project_id = project_id
+        self.user_id = user_id
+        self.messages: List[Dict] = []
+        self.summary = ""
+        self.project_state: Dict = {}
+        self.file_history: List[Dict] = []
+        self.created_at = datetime.utcnow()
+        # Stored version this context is based on (0: not stored yet)
+        self.version = 0
+        # Changes since the last save, replayed onto a newer stored copy on conflict
+        self.unsaved_messages: List[Dict] = []
+        self.unsaved_file_changes: List[Dict] = []
+        self.unsaved_state: Dict = {}
+
+    def add_message(self, role: str, content: str, metadata: Optional[Dict] = None):
+        """Add a message to conversation history"""
+        message = {
+            "role": role,
+            "content": content,
+            "timestamp": datetime.utcnow().isoformat(),
+            "metadata": metadata or {}
+        }
+        self.messages.append(message)
+        self.unsaved_messages.append(message)
+        self._roll_up()
+
+    def _roll_up(self):
+        """Fold turns beyond IC_CONTEXT_RECENT_MESSAGES into the running summary"""
+        overflow = len(self.messages) - IC_CONTEXT_RECENT_MESSAGES
+        if overflow <= 0:
+            return
+        lines = self.summary.splitlines() if self.summary else []
+        lines.extend(summarize_turn(message) for message in self.messages[:overflow])
+        del self.messages[:overflow]
+        # Oldest summary lines go first once the summary is over budget
+        while lines and sum(len(line) + 1 for line in lines) > IC_CONTEXT_SUMMARY_MAX_CHARS:
+            lines.pop(0)
+        self.summary = "\n".join(lines)
+
+    def add_file_change(self, entry: Dict):
+        self.file_history.append(entry)
+        del self.file_history[:-IC_CONTEXT_FILE_HISTORY]
+        self.unsaved_file_changes.append(entry)
+
+    def get_context_summary(self, last_n: int = 10) -> str:
+        """Get summary of recent conversation (older turns come from the rolled-up summary)"""
+        recent = self.messages[-last_n:]
+        summary = []
+
+        if self.summary:
+            summary.append(f"Earlier conversation (summarized):\n{self.summary}\n")
+
+        for msg in recent:
+            role = msg["role"]
+            content = msg["content"][:200]  # Truncate long messages
+            summary.append(f"{role}: {content}")
+
+        return "\n".join(summary)
+
+    def update_project_state(self, state: Dict):
+        """Update current project state"""
+        self.project_state.update(state)
+        self.project_state["updated_at"] = datetime.utcnow().isoformat()
+        self.unsaved_state.update(state, updated_at=self.project_state["updated_at"])
+
+    @property
+    def has_unsaved_changes(self) -> bool:
+        return bool(self.unsaved_messages or self.unsaved_file_changes or self.unsaved_state)
+
+    def rebase(self, latest: "ConversationContext"):
+        """Replay the unsaved changes on top of a newer stored copy of this context"""
+        self.messages = latest.messages + self.unsaved_messages
+        self.summary = latest.summary
+        self._roll_up()
+        self.file_history = (latest.file_history + self.unsaved_file_changes)[-IC_CONTEXT_FILE_HISTORY:]
+        self.project_state = {**latest.project_state, **self.unsaved_state}
+        self.created_at = latest.created_at
+        self.version = latest.version
+
+    def mark_saved(self, messages: int, file_changes: int):
+        """Forget the first `messages` and `file_changes` unsaved changes (now stored)"""
+        del self.unsaved_messages[:messages]
+        del self.unsaved_file_changes[:file_changes]
+        self.unsaved_state = {}
+
+    def to_bytes(self) -> bytes:
+        return orjson.dumps({
+            "p": self.project_id,
+            "u": self.user_id,
+            "m": self.messages,
+            "s": self.summary,
+            "ps": self.project_state,
+            "fh": self.file_history,
+            "c": self.created_at.isoformat(),
+        })
+
+    @classmethod
+    def from_bytes(cls, raw) -> "ConversationContext":
+        data = orjson.loads(raw)
+        context = cls(data["p"], data["u"])
+        context.messages = data["m"]
+        context.summary = data["s"]
+        context.project_state = data["ps"]
+        context.file_history = data["fh"]
+        context.created_at = datetime.fromisoformat(data["c"])
+        return context
+
+
+class ConversationStore:
+    """
+    Conversation contexts keyed by (user, project), loaded lazily.
+
+    Redis is the source of truth; the local LRU only saves the transfer and
+    decode: a cached context is reused while its version still matches the
+    one in Redis. Saves are compare-and-set on the loaded version; when
+    another worker saved first, the turn's changes are replayed onto the
+    newer copy, so concurrent turns on one project don't overwrite each
+    other. Without Redis the store degrades to the local LRU alone.
+    """
+
+    def __init__(self, redis_client, max_entries: int = IC_CONTEXT_CACHE_MAX_ENTRIES,
+                 max_bytes: int = IC_CONTEXT_CACHE_MAX_BYTES, ttl: int = IC_CONTEXT_TTL):
+        self.redis = redis_client
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        # key -> (version, serialized size, context)
+        self._local: "OrderedDict[str, Tuple[int, int, ConversationContext]]" = OrderedDict()
+        self.bytes_used = 0
+        self._save_context = redis_client.register_script(SAVE_CONTEXT_SCRIPT)
+
+    @staticmethod
+    def _key(user_id: str, project_id: str) -> str:
+        return f"chatctx:{user_id}:{project_id}"
+
+    @staticmethod
+    def _history_key(user_id: str, project_id: str) -> str:
+        return f"chathist:{user_id}:{project_id}"
+
+    # ==================== Local LRU ====================
+
+    def _set_local(self, key: str, version: int, size: int, context: ConversationContext):
+        self._drop_local(key)
+        self._local[key] = (version, size, context)
+        self.bytes_used += size
+        while self._local and (len(self._local) > self.max_entries or self.bytes_used > self.max_bytes):
+            _, (_, evicted_size, _) = self._local.popitem(last=False)
+            self.bytes_used -= evicted_size
+
+    def _drop_local(self, key: str):
+        entry = self._local.pop(key, None)
+        if entry is not None:
+            self.bytes_used -= entry[1]
+
+    # ==================== Load / Save ====================
+
+    async def load(self, project_id: str, user_id: str) -> ConversationContext:
+        """Context for the project, creating an empty one if none is stored"""
+        key = self._key(user_id, project_id)
+        cached = self._local.get(key)
+        try:
+            version = await self.redis.hget(key, 'v')
+            if version is not None and cached is not None and cached[0] == int(version):
+                self._local.move_to_end(key)
+                CONTEXT_LOOKUPS.labels('local').inc()
+                return cached[2]
+            if cached is not None and cached[2].has_unsaved_changes:
+                # An earlier save failed: replay its changes onto the stored copy
+                context = cached[2]
+                context.rebase(await self._fetch(key) or ConversationContext(project_id, user_id))
+                self._set_local(key, context.version, len(context.to_bytes()), context)
+                CONTEXT_LOOKUPS.labels('local').inc()
+                return context
+            if version is not None:
+                raw = await self.redis.hget(key, 'd')
+                if raw is not None:
+                    context = ConversationContext.from_bytes(raw)
+                    context.version = int(version)
+                    self._set_local(key, context.version, len(raw), context)
+                    CONTEXT_LOOKUPS.labels('redis').inc()
+                    return context
+            self._drop_local(key)
+        except RedisError as e:
+            logger.warning(f"Conversation store read failed for {key}, using local copy: {e}")
+            if cached is not None:
+                self._local.move_to_end(key)
+                CONTEXT_LOOKUPS.labels('local').inc()
+                return cached[2]
+
+        CONTEXT_LOOKUPS.labels('new').inc()
+        return ConversationContext(project_id, user_id)
+
+    async def _fetch(self, key: str) -> Optional[ConversationContext]:
+        """Stored context straight from Redis, bypassing the local LRU"""
+        version, raw = await self.redis.hmget(key, ['v', 'd'])
+        if version is None or raw is None:
+            return None
+        context = ConversationContext.from_bytes(raw)
+        context.version = int(version)
+        return context
+
+    async def save(self, context: ConversationContext):
+        """Persist the context and append its new messages to the transcript"""
+        key = self._key(context.user_id, context.project_id)
+        try:
+            for _ in range(IC_CONTEXT_SAVE_ATTEMPTS):
+                messages = list(context.unsaved_messages)
+                file_changes = len(context.unsaved_file_changes)
+                raw = context.to_bytes()
+                version = await self._save_context(keys=[key], args=[raw, self.ttl, context.version])
+                if version != -1:
+                    break
+                # Another worker saved since this context was loaded
+                latest = await self._fetch(key)
+                if latest is None:
+                    latest = ConversationContext(context.project_id, context.user_id)
+                context.rebase(latest)
+            else:
+                raise RedisError(f"context changed concurrently {IC_CONTEXT_SAVE_ATTEMPTS} times")
+            context.version = int(version)
+            context.mark_saved(len(messages), file_changes)
+            if messages:
+                history_key = self._history_key(context.user_id, context.project_id)
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    pipe.rpush(history_key, *(orjson.dumps(message) for message in messages))
+                    pipe.ltrim(history_key, -IC_HISTORY_MAX_MESSAGES, -1)
+                    pipe.expire(history_key, self.ttl)
+                    await pipe.execute()
+        except RedisError as e:
+            logger.warning(f"Conversation store write failed for {key}: {e}")
+            # Keep it locally under a version Redis will never report; the
+            # next load or save replays the unsaved changes onto Redis' copy
+            version = -1
+            del context.unsaved_messages[:-IC_HISTORY_MAX_MESSAGES]
+            del context.unsaved_file_changes[:-IC_CONTEXT_FILE_HISTORY]
+        self._set_local(key, int(version), len(raw), context)
+
+    async def history(self, project_id: str, user_id: str) -> List[Dict]:
+        """Full transcript (up to IC_HISTORY_MAX_MESSAGES messages)"""
+        try:
+            raw_messages = await self.redis.lrange(self._history_key(user_id, project_id), 0, -1)
+            return [orjson.loads(raw) for raw in raw_messages]
+        except RedisError as e:
+            logger.warning(f"Conversation history read failed: {e}")
+            return (await self.load(project_id, user_id)).messages
+
+    async def delete(self, project_id: str, user_id: str):
+        key = self._key(user_id, project_id)
+        self._drop_local(key)
+        try:
+            await self.redis.delete(key, self._history_key(user_id, project_id))
+        except RedisError as e:
+            logger.warning(f"Conversation store delete failed for {key}: {e}")
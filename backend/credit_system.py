@@ -4,7 +4,9 @@
 from datetime import datetime, timezone
 from typing import Dict, Optional, List
 from enum import Enum
+from pymongo import ReturnDocument
 import logging
+import uuid
 
 logger = logging.getLogger(__name__)
 
@@ -215,11 +217,18 @@ class CreditManager:
                 'remaining_balance': int
             }
         """
-        # Get current balance
-        current_balance = await self.get_user_balance(user_id)
+        # Check and decrement in one round trip - the filter only matches
+        # while the balance covers the amount, so concurrent builds can't oversell
+        now = datetime.now(timezone.utc).isoformat()
+        user = await self.db.users.find_one_and_update(
+            {"id": user_id, "credits": {"$gte": amount}},
+            {"$inc": {"credits": -amount}, "$set": {"updated_at": now}},
+            projection={"_id": 0, "credits": 1},
+            return_document=ReturnDocument.AFTER
+        )
         
-        # Check if sufficient
-        if current_balance < amount:
+        if user is None:
+            current_balance = await self.get_user_balance(user_id)
             logger.warning(f"Insufficient credits for user {user_id}: {current_balance} < {amount}")
             return {
                 'status': 'insufficient',
@@ -228,8 +237,10 @@ class CreditManager:
                 'shortfall': amount - current_balance
             }
         
+        new_balance = user['credits']
+        
         # Create transaction record
-        transaction_id = f"txn_{datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S')}_{user_id[:8]}"
+        transaction_id = f"txn_{datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S')}_{user_id[:8]}_{uuid.uuid4().hex[:8]}"
         transaction = {
             'id': transaction_id,
             'user_id': user_id,
@@ -238,23 +249,17 @@ class CreditManager:
             'operation': operation,
             'status': CreditStatus.PENDING.value,
             'metadata': metadata or {},
-            'created_at': datetime.now(timezone.utc).isoformat(),
-            'updated_at': datetime.now(timezone.utc).isoformat()
+            'balance_after': new_balance,
+            'created_at': now,
+            'updated_at': now
         }
         
-        # Insert transaction
-        await self.db.credit_transactions.insert_one(transaction)
-        
-        # Deduct credits
-        result = await self.db.users.update_one(
-            {"id": user_id},
-            {
-                "$inc": {"credits": -amount},
-                "$set": {"updated_at": datetime.now(timezone.utc).isoformat()}
-            }
-        )
-        
-        new_balance = current_balance - amount
+        try:
+            await self.db.credit_transactions.insert_one(transaction)
+        except Exception:
+            # No ledger entry means no reservation - give the credits back
+            await self.db.users.update_one({"id": user_id}, {"$inc": {"credits": amount}})
+            raise
         
         logger.info(f"Reserved {amount} credits for user {user_id} (operation: {operation})")
         
@@ -262,7 +267,7 @@ class CreditManager:
             'status': 'success',
             'transaction_id': transaction_id,
             'reserved_amount': amount,
-            'previous_balance': current_balance,
+            'previous_balance': new_balance + amount,
             'remaining_balance': new_balance
         }
     
@@ -328,7 +333,7 @@ class CreditManager:
         """
         Refund credits to user (on failure or partial completion)
         """
-        transaction_id = f"ref_{datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S')}_{user_id[:8]}"
+        transaction_id = f"ref_{datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S')}_{user_id[:8]}_{uuid.uuid4().hex[:8]}"
         transaction = {
             'id': transaction_id,
             'user_id': user_id,
@@ -345,15 +350,17 @@ class CreditManager:
         await self.db.credit_transactions.insert_one(transaction)
         
         # Add credits back
-        await self.db.users.update_one(
+        user = await self.db.users.find_one_and_update(
             {"id": user_id},
             {
                 "$inc": {"credits": amount},
                 "$set": {"updated_at": datetime.now(timezone.utc).isoformat()}
-            }
+            },
+            projection={"_id": 0, "credits": 1},
+            return_document=ReturnDocument.AFTER
         )
         
-        new_balance = await self.get_user_balance(user_id)
+        new_balance = user.get('credits', 0) if user else 0
         
         logger.info(f"Refunded {amount} credits to user {user_id} (reason: {reason})")
         
@@ -1,11 +1,14 @@
 # Credit System v2 - PostgreSQL Version
 # Manages credits with PostgreSQL transactions
 
-from sqlalchemy import select, update
+from sqlalchemy import event, insert, literal, null, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from database import User, CreditTransaction
+from user_stats import record_ledger_entry
+from auth_cache import principal_cache
 from typing import Optional, Dict
 from datetime import datetime, timezone
+import asyncio
 import uuid
 from enum import Enum
 
@@ -22,12 +25,34 @@ class TransactionStatus(str, Enum):
     REFUNDED = "refunded"
     FAILED = "failed"
 
+# Invalidation tasks started from after_commit hooks, referenced until done
+_invalidation_tasks = set()
+
+def _invalidate_committed_users(session):
+    """after_commit hook: drop cached principals of users whose credits changed"""
+    loop = asyncio.get_running_loop()
+    for user_id in session.info.pop('credit_users', ()):
+        task = loop.create_task(principal_cache.invalidate_user(user_id))
+        _invalidation_tasks.add(task)
+        task.add_done_callback(_invalidation_tasks.discard)
+
 class CreditManagerV2:
     """PostgreSQL-based credit management system"""
     
     def __init__(self, session: AsyncSession):
         self.session = session
     
+    def _invalidate_after_commit(self, user_id: str):
+        """
+        Invalidate the user's cached principals once the caller commits.
+        Invalidating before the commit would let a concurrent request re-cache
+        the old balance for the whole cache TTL.
+        """
+        session = self.session.sync_session
+        if not event.contains(session, 'after_commit', _invalidate_committed_users):
+            event.listen(session, 'after_commit', _invalidate_committed_users)
+        session.info.setdefault('credit_users', set()).add(user_id)
+    
     async def get_user_credits(self, user_id: str) -> Optional[int]:
         """Get user's current credit balance"""
         result = await self.session.execute(
@@ -49,56 +74,65 @@ class CreditManagerV2:
         Returns:
             Dict with status, balance_before, balance_after, transaction_id
         """
-        # Get current balance
-        result = await self.session.execute(
-            select(User).where(User.id == user_id)
-        )
-        user = result.scalar_one_or_none()
+        now = datetime.now(timezone.utc)
+        transaction_id = str(uuid.uuid4())
+        users = User.__table__
+        ledger = CreditTransaction.__table__
         
-        if not user:
-            raise ValueError(f"User {user_id} not found")
-        
-        balance_before = user.credits
+        # Conditional decrement and ledger insert in one statement: the UPDATE
+        # only matches while the balance covers the amount (so concurrent
+        # builds can't oversell) and the INSERT only fires if it matched
+        debit = (
+            update(users)
+            .where(users.c.id == user_id, users.c.credits >= amount)
+            .values(credits=users.c.credits - amount, updated_at=now)
+            .returning(users.c.credits)
+            .cte('debit')
+        )
+        record = (
+            insert(ledger)
+            .from_select(
+                ['id', 'user_id', 'transaction_type', 'amount', 'balance_before',
+                 'balance_after', 'status', 'description', 'extra_data', 'created_at'],
+                select(
+                    literal(transaction_id, ledger.c.id.type),
+                    literal(user_id, ledger.c.user_id.type),
+                    literal(TransactionType.DEDUCTION.value, ledger.c.transaction_type.type),
+                    literal(-amount, ledger.c.amount.type),
+                    debit.c.credits + amount,
+                    debit.c.credits,
+                    literal(TransactionStatus.COMPLETED.value, ledger.c.status.type),
+                    literal(description, ledger.c.description.type),
+                    literal(extra_data, ledger.c.extra_data.type) if extra_data is not None else null(),
+                    literal(now, ledger.c.created_at.type)
+                )
+            )
+            .returning(ledger.c.balance_after)
+        )
+        result = await self.session.execute(record)
+        balance_after = result.scalar_one_or_none()
         
-        if balance_before < amount:
+        if balance_after is None:
+            balance = await self.get_user_credits(user_id)
+            if balance is None:
+                raise ValueError(f"User {user_id} not found")
             return {
                 'status': 'insufficient_credits',
-                'balance': balance_before,
+                'balance': balance,
                 'required': amount,
-                'message': f'Insufficient credits. Need {amount}, have {balance_before}'
+                'message': f'Insufficient credits. Need {amount}, have {balance}'
             }
         
-        # Deduct credits
-        balance_after = balance_before - amount
-        await self.session.execute(
-            update(User)
-            .where(User.id == user_id)
-            .values(credits=balance_after, updated_at=datetime.now(timezone.utc))
-        )
-        
-        # Create transaction record
-        transaction = CreditTransaction(
-            id=str(uuid.uuid4()),
-            user_id=user_id,
-            transaction_type=TransactionType.DEDUCTION,
-            amount=-amount,
-            balance_before=balance_before,
-            balance_after=balance_after,
-            status=TransactionStatus.COMPLETED,
-            description=description,
-            extra_data=extra_data,
-            created_at=datetime.now(timezone.utc)
-        )
-        
-        self.session.add(transaction)
-        await self.session.flush()
+        balance_before = balance_after + amount
+        await record_ledger_entry(self.session, user_id, TransactionType.DEDUCTION.value, amount)
+        self._invalidate_after_commit(user_id)
         
         return {
             'status': 'success',
             'balance_before': balance_before,
             'balance_after': balance_after,
             'amount_deducted': amount,
-            'transaction_id': transaction.id,
+            'transaction_id': transaction_id,
             'message': f'Successfully deducted {amount} credits'
         }
     
@@ -151,6 +185,7 @@ class CreditManagerV2:
         
         self.session.add(transaction)
         await self.session.flush()
+        self._invalidate_after_commit(user_id)
         
         return {
             'status': 'success',
@@ -1,6 +1,7 @@
 # Emergent-Style Gradual Credit System
 from datetime import datetime, timezone
 from fastapi import HTTPException
+from pymongo import ReturnDocument
 from config import db, CREDIT_COSTS
 import uuid
 
@@ -13,18 +14,21 @@ async def get_user_credits(user_id: str) -> int:
 
 async def deduct_credits(user_id: str, amount: int, action: str) -> dict:
     """Deduct credits and record transaction (Emergent-style gradual deduction)"""
-    # Get current balance
-    current_balance = await get_user_credits(user_id)
+    # Check and decrement in one round trip - the filter only matches while
+    # the balance covers the amount, so concurrent agents can't overspend
+    user = await db.users.find_one_and_update(
+        {'id': user_id, 'credits': {'$gte': amount}},
+        {'$inc': {'credits': -amount}},
+        projection={'_id': 0, 'credits': 1},
+        return_document=ReturnDocument.AFTER
+    )
     
-    if current_balance < amount:
+    if user is None:
+        # Raises 404 for unknown users
+        await get_user_credits(user_id)
         raise HTTPException(status_code=402, detail='Insufficient credits')
     
-    # Deduct credits
-    new_balance = current_balance - amount
-    await db.users.update_one(
-        {'id': user_id},
-        {'$set': {'credits': new_balance}}
-    )
+    new_balance = user['credits']
     
     # Record transaction
     transaction = {
@@ -32,11 +36,16 @@ async def deduct_credits(user_id: str, amount: int, action: str) -> dict:
         'user_id': user_id,
         'amount': -amount,
         'action': action,
-        'balance_before': current_balance,
+        'balance_before': new_balance + amount,
         'balance_after': new_balance,
         'created_at': datetime.now(timezone.utc).isoformat()
     }
-    await db.transactions.insert_one(transaction)
+    try:
+        await db.transactions.insert_one(transaction)
+    except Exception:
+        # No ledger entry means no deduction - give the credits back
+        await db.users.update_one({'id': user_id}, {'$inc': {'credits': amount}})
+        raise
     
     return {
         'credits_deducted': amount,
@@ -1,11 +1,13 @@
 # Database Helper Functions for PostgreSQL
 # Common queries used across endpoints
 
-from sqlalchemy import select, update as sql_update, delete
+from sqlalchemy import select, update as sql_update, delete, insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional, List, Dict
 from database import User, Project, ProjectMessage, CreditTransaction, UserSession
 from datetime import datetime, timezone
+from user_stats import record_project_created, record_project_status_change, record_ledger_entry
+from auth_cache import principal_cache
 
 async def get_user_by_email(db: AsyncSession, email: str) -> Optional[User]:
     """Get user by email"""
@@ -36,6 +38,7 @@ async def update_user_credits(db: AsyncSession, user_id: str, new_credits: int)
         sql_update(User).where(User.id == user_id).values(credits=new_credits)
     )
     await db.commit()
+    await principal_cache.invalidate_user(user_id)
     return True
 
 async def get_user_projects(db: AsyncSession, user_id: str, limit: int = 50) -> List[Project]:
@@ -57,12 +60,23 @@ async def create_project(db: AsyncSession, project_data: Dict) -> Project:
     """Create a new project"""
     project = Project(**project_data)
     db.add(project)
+    await record_project_created(db, project.user_id, project.status)
     await db.commit()
     await db.refresh(project)
     return project
 
 async def update_project(db: AsyncSession, project_id: str, updates: Dict) -> bool:
     """Update a project"""
+    if 'status' in updates:
+        # Lock the row so the stats delta matches the status actually replaced
+        result = await db.execute(
+            select(Project.user_id, Project.status)
+            .where(Project.id == project_id)
+            .with_for_update()
+        )
+        current = result.one_or_none()
+        if current:
+            await record_project_status_change(db, current.user_id, current.status, updates['status'])
     await db.execute(
         sql_update(Project).where(Project.id == project_id).values(**updates)
     )
@@ -78,13 +92,13 @@ async def get_project_messages(db: AsyncSession, project_id: str) -> List[Projec
     )
     return result.scalars().all()
 
-async def create_message(db: AsyncSession, message_data: Dict) -> ProjectMessage:
-    """Create a new message"""
-    message = ProjectMessage(**message_data)
-    db.add(message)
+async def create_messages(db: AsyncSession, messages_data: List[Dict]) -> int:
+    """Create many messages with a single multi-row INSERT and one commit"""
+    if not messages_data:
+        return 0
+    await db.execute(insert(ProjectMessage), messages_data)
     await db.commit()
-    await db.refresh(message)
-    return message
+    return len(messages_data)
 
 async def get_user_transactions(db: AsyncSession, user_id: str, limit: int = 50) -> List[CreditTransaction]:
     """Get credit transactions for a user"""
@@ -100,6 +114,7 @@ async def create_transaction(db: AsyncSession, transaction_data: Dict) -> Credit
     """Create a credit transaction"""
     transaction = CreditTransaction(**transaction_data)
     db.add(transaction)
+    await record_ledger_entry(db, transaction.user_id, transaction.transaction_type, transaction.amount)
     await db.commit()
     await db.refresh(transaction)
     return transaction
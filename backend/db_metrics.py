@@ -0,0 +1,188 @@
+# Database Instrumentation
+# Prometheus metrics and slow-query logging for SQLAlchemy and Motor
+
+from prometheus_client import Counter, Gauge, Histogram
+from pymongo import monitoring
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from typing import Any, Dict
+import logging
+import os
+import re
+import time
+
+logger = logging.getLogger("db.slow_query")
+
+# Statements slower than this are logged with their parameter shapes
+DB_SLOW_QUERY_MS = float(os.environ.get('DB_SLOW_QUERY_MS', '500'))
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# ==================== Metrics ====================
+
+SQL_STATEMENT_LATENCY = Histogram(
+    'db_sql_statement_seconds',
+    'SQL statement latency by normalized statement',
+    ['engine', 'statement'],
+    buckets=LATENCY_BUCKETS
+)
+SQL_SLOW_STATEMENTS = Counter(
+    'db_sql_slow_statements_total',
+    'SQL statements slower than DB_SLOW_QUERY_MS',
+    ['engine']
+)
+POOL_CHECKOUT_WAIT = Histogram(
+    'db_pool_checkout_wait_seconds',
+    'Time spent waiting for a pooled connection',
+    ['engine'],
+    buckets=LATENCY_BUCKETS
+)
+POOL_TIMEOUTS = Counter(
+    'db_pool_checkout_timeouts_total',
+    'Connection checkouts that timed out waiting for the pool',
+    ['engine']
+)
+POOL_IN_USE = Gauge('db_pool_connections_in_use', 'Checked-out connections', ['engine'])
+POOL_OVERFLOW = Gauge('db_pool_overflow_connections', 'Connections open beyond pool_size', ['engine'])
+
+MONGO_COMMAND_LATENCY = Histogram(
+    'db_mongo_command_seconds',
+    'MongoDB command latency by command and collection',
+    ['command', 'collection'],
+    buckets=LATENCY_BUCKETS
+)
+MONGO_COMMAND_FAILURES = Counter(
+    'db_mongo_command_failures_total',
+    'Failed MongoDB commands',
+    ['command', 'collection']
+)
+MONGO_SLOW_COMMANDS = Counter(
+    'db_mongo_slow_commands_total',
+    'MongoDB commands slower than DB_SLOW_QUERY_MS',
+    ['command']
+)
+
+# ==================== Helpers ====================
+
+_WHITESPACE = re.compile(r'\s+')
+_IN_LIST = re.compile(r'\bIN\s*\((?:[^()]|\([^()]*\))*\)', re.IGNORECASE)
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+_POSITIONAL_PARAM = re.compile(r'\$\d+')
+
+
+def normalize_sql(statement: str, max_length: int = 200) -> str:
+    """Collapse a SQL statement into a low-cardinality metric label"""
+    normalized = _WHITESPACE.sub(' ', statement).strip()
+    normalized = _STRING_LITERAL.sub('?', normalized)
+    normalized = _IN_LIST.sub('IN (...)', normalized)
+    normalized = _POSITIONAL_PARAM.sub('?', normalized)
+    normalized = _NUMBER_LITERAL.sub('?', normalized)
+    return normalized[:max_length]
+
+
+def parameter_shape(parameters: Any) -> Any:
+    """Describe bound parameters by type only, so values never reach the logs"""
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (dict, list, tuple)):
+            return {'executemany': len(parameters), 'row': parameter_shape(parameters[0])}
+        return [type(value).__name__ for value in parameters]
+    return type(parameters).__name__
+
+
+# ==================== SQLAlchemy ====================
+
+class InstrumentedAsyncPool(AsyncAdaptedQueuePool):
+    """Queue pool that records checkout wait time and timeouts"""
+
+    metrics_label = 'default'
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            POOL_TIMEOUTS.labels(self.metrics_label).inc()
+            raise
+        finally:
+            POOL_CHECKOUT_WAIT.labels(self.metrics_label).observe(time.perf_counter() - start)
+
+
+def instrument_engine(async_engine, label: str):
+    """Attach statement timing and pool gauges to an AsyncEngine"""
+    sync_engine = async_engine.sync_engine
+    pool = sync_engine.pool
+
+    if isinstance(pool, InstrumentedAsyncPool):
+        pool.metrics_label = label
+        POOL_IN_USE.labels(label).set_function(pool.checkedout)
+        POOL_OVERFLOW.labels(label).set_function(lambda: max(pool.overflow(), 0))
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get('query_start')
+        if not starts:
+            return
+        elapsed = time.perf_counter() - starts.pop()
+        SQL_STATEMENT_LATENCY.labels(label, normalize_sql(statement)).observe(elapsed)
+
+        if elapsed * 1000 >= DB_SLOW_QUERY_MS:
+            SQL_SLOW_STATEMENTS.labels(label).inc()
+            logger.warning(
+                f"Slow SQL ({elapsed * 1000:.1f} ms) on {label}: "
+                f"{normalize_sql(statement, max_length=1000)} params={parameter_shape(parameters)}"
+            )
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _handle_error(exception_context):
+        conn = exception_context.connection
+        if conn is not None and conn.info.get('query_start'):
+            conn.info['query_start'].pop()
+
+    return async_engine
+
+
+# ==================== Motor / PyMongo ====================
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Records MongoDB command latency and logs slow commands"""
+
+    def __init__(self):
+        # request_id -> 'database.collection', filled in on command start
+        self._collections: Dict[int, str] = {}
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = '-'
+        self._collections[event.request_id] = f"{event.database_name}.{collection}"
+
+    def succeeded(self, event):
+        collection = self._collections.pop(event.request_id, '-')
+        elapsed = event.duration_micros / 1_000_000
+        MONGO_COMMAND_LATENCY.labels(event.command_name, collection).observe(elapsed)
+
+        if elapsed * 1000 >= DB_SLOW_QUERY_MS:
+            MONGO_SLOW_COMMANDS.labels(event.command_name).inc()
+            logger.warning(
+                f"Slow MongoDB {event.command_name} on {collection} "
+                f"({elapsed * 1000:.1f} ms)"
+            )
+
+    def failed(self, event):
+        collection = self._collections.pop(event.request_id, '-')
+        MONGO_COMMAND_FAILURES.labels(event.command_name, collection).inc()
+        MONGO_COMMAND_LATENCY.labels(event.command_name, collection).observe(
+            event.duration_micros / 1_000_000
+        )
+
+
+# Shared listener for every Motor client in the process
+mongo_command_listener = MongoCommandListener()
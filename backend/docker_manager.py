@@ -3,11 +3,14 @@
 
 import docker
 import os
+import asyncio
 import logging
-from typing import Dict, Optional
+from typing import Dict, Optional, Union
 import random
 import string
 
+from container_sync import container_sync
+
 logger = logging.getLogger(__name__)
 
 class DockerManager:
@@ -97,26 +100,31 @@ class DockerManager:
     async def _write_code_to_container(self, container, frontend_code: str, backend_code: str):
         """Write generated code to container"""
         try:
-            # Write frontend code (index.html)
-            container.exec_run(
-                f"sh -c 'echo {self._escape_code(frontend_code)} > /workspace/frontend/index.html'"
-            )
-            
-            # Write backend code if exists
+            files = {"frontend/index.html": frontend_code}
             if backend_code:
-                container.exec_run(
-                    f"sh -c 'echo {self._escape_code(backend_code)} > /workspace/backend/server.py'"
-                )
+                files["backend/server.py"] = backend_code
+            result = await container_sync.sync(container, files)
             
-            # Restart services
-            container.exec_run("supervisorctl restart all")
+            # Restart services only when something changed
+            if result["files_sent"]:
+                await asyncio.to_thread(container.exec_run, "supervisorctl restart all")
             
         except Exception as e:
             logger.error(f"Failed to write code to container: {e}")
     
-    def _escape_code(self, code: str) -> str:
-        """Escape code for shell command"""
-        return code.replace("'", "'\\''")
+    async def sync_files(self, container_name: str, files: Dict[str, Union[str, bytes]], prune: bool = False,
+                         force: bool = False) -> Dict:
+        """Push files (paths relative to /workspace) into a container; only changed files are sent unless force"""
+        try:
+            container = await asyncio.to_thread(self.client.containers.get, container_name)
+            result = await container_sync.sync(container, files, prune=prune, force=force)
+            if result["files_sent"] or result["files_deleted"]:
+                await asyncio.to_thread(container.exec_run, "supervisorctl restart all")
+            logger.info(f"Synced {result['files_sent']} changed files ({result['bytes_sent']} bytes) to {container_name}")
+            return result
+        except Exception as e:
+            logger.error(f"Failed to sync files to container: {e}")
+            return {"status": "error", "message": str(e)}
     
     async def stop_container(self, container_name: str) -> Dict:
         """Stop a container"""
@@ -146,6 +154,7 @@ class DockerManager:
             container = self.client.containers.get(container_name)
             container.stop()
             container.remove()
+            container_sync.forget(container.id)
             logger.info(f"Container {container_name} deleted")
             return {"status": "success", "message": "Container deleted"}
         except Exception as e:
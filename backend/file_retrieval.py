@@ -0,0 +1,235 @@
+# File Retrieval
+# Local relevance ranking of workspace files for chat requests: BM25 over code
+# identifiers plus path, file-type and recent-edit signals, packed into a
+# token budget so prompts carry only the files (or chunks) that matter
+
+from collections import Counter, OrderedDict
+from content_index import FS_SEARCH_MAX_WORKSPACES, ContentIndexRegistry, WorkspaceContentIndex
+from typing import Callable, Dict, List, Optional, Tuple
+import math
+import os
+import re
+import threading
+
+IC_RETRIEVAL_TOP_K = int(os.environ.get('IC_RETRIEVAL_TOP_K', '8'))
+# Budget for file contents in one prompt, estimated at ~4 characters per token
+IC_CONTEXT_TOKEN_BUDGET = int(os.environ.get('IC_CONTEXT_TOKEN_BUDGET', '12000'))
+IC_CHUNK_LINES = int(os.environ.get('IC_CHUNK_LINES', '60'))
+CHARS_PER_TOKEN = 4
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+PATH_WEIGHT = 2.0
+TYPE_WEIGHT = 1.5
+RECENT_WEIGHT = 3.0
+RECENT_DECAY = 0.6
+MENTION_WEIGHT = 10.0
+
+WORD_RE = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+# camelCase / PascalCase / ACRONYMCase pieces
+SUBWORD_RE = re.compile(r'[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+')
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "but", "by", "can", "could", "do", "for", "from",
+    "have", "how", "i", "if", "in", "into", "is", "it", "its", "me", "my", "of", "on", "or",
+    "our", "please", "should", "so", "that", "the", "their", "then", "there", "this", "to",
+    "we", "what", "when", "where", "which", "with", "would", "you", "your",
+    "add", "change", "create", "edit", "fix", "make", "modify", "update", "use", "want",
+}
+
+# Request words that say which kind of file (per _detect_file_type) is meant
+TYPE_HINTS = {
+    "frontend": {
+        "animation", "button", "color", "colour", "component", "css", "design", "font", "footer",
+        "form", "header", "icon", "image", "layout", "mobile", "modal", "navbar", "page",
+        "responsive", "screen", "style", "theme", "ui",
+    },
+    "backend": {
+        "api", "auth", "backend", "database", "db", "endpoint", "model", "query", "route",
+        "schema", "server", "sql", "webhook",
+    },
+    "test": {"coverage", "spec", "test", "tests"},
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Identifier-aware tokens: `fetchUserOrders` and `fetch_user_orders` both
+    yield fetch/user/orders, plus the whole identifier lower-cased
+    """
+    tokens = []
+    for word in WORD_RE.findall(text):
+        pieces = [piece.lower() for part in word.split('_') for piece in SUBWORD_RE.findall(part)]
+        tokens.extend(piece for piece in pieces if len(piece) > 1)
+        whole = word.lower().strip('_')
+        if len(pieces) > 1 and whole:
+            tokens.append(whole)
+    return tokens
+
+
+def query_terms(text: str) -> List[str]:
+    seen = []
+    for token in tokenize(text):
+        if token not in STOPWORDS and token not in seen:
+            seen.append(token)
+    return seen
+
+
+class FileRetriever:
+    """
+    Ranks a workspace's files against a request. Term statistics come from
+    the texts already held by the workspace content index and are cached per
+    index file id, so after the first request only changed files are
+    re-tokenized.
+    """
+
+    def __init__(self, content_index: ContentIndexRegistry, detect_type: Callable[[str], str]):
+        self.content_index = content_index
+        self.detect_type = detect_type
+        # root -> file id -> (term frequencies, document length)
+        self._stats: "OrderedDict[str, Dict[int, Tuple[Counter, int]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    # ==================== Ranking (blocking, index lock held) ====================
+
+    def _document_stats(self, index: WorkspaceContentIndex) -> Dict[int, Tuple[Counter, int]]:
+        with self._lock:
+            cached = self._stats.get(index.root, {})
+            stats = {}
+            for file_id, text in index.texts.items():
+                entry = cached.get(file_id)
+                if entry is None:
+                    tokens = tokenize(text)
+                    entry = (Counter(tokens), len(tokens))
+                stats[file_id] = entry
+            self._stats[index.root] = stats
+            self._stats.move_to_end(index.root)
+            while len(self._stats) > FS_SEARCH_MAX_WORKSPACES:
+                self._stats.popitem(last=False)
+            return stats
+
+    def _rank(self, index: WorkspaceContentIndex, request: str,
+              recent_files: List[str]) -> List[Dict]:
+        terms = query_terms(request)
+        stats = self._document_stats(index)
+        documents = len(stats) or 1
+        average_length = sum(length for _, length in stats.values()) / documents or 1.0
+        frequencies = {
+            term: sum(1 for counts, _ in stats.values() if term in counts) for term in terms
+        }
+        idf = {
+            term: math.log(1 + (documents - df + 0.5) / (df + 0.5)) for term, df in frequencies.items()
+        }
+
+        request_lower = request.lower()
+        request_words = set(tokenize(request))
+        wanted_types = {kind for kind, hints in TYPE_HINTS.items() if hints & request_words}
+        recency = {}
+        for position, path in enumerate(recent_files):
+            recency.setdefault(path, RECENT_WEIGHT * RECENT_DECAY ** position)
+
+        ranked = []
+        # Binary and over-cap files have no text but can still match on path
+        for rel in index.sizes:
+            file_id = index.ids.get(rel)
+            counts, length = stats[file_id] if file_id is not None else (Counter(), 0)
+
+            content_score = 0.0
+            for term in terms:
+                tf = counts.get(term, 0)
+                if tf:
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * length / average_length)
+                    content_score += idf[term] * tf * (BM25_K1 + 1) / (tf + norm)
+
+            path_tokens = set(tokenize(rel))
+            path_score = PATH_WEIGHT * sum(idf[term] for term in terms if term in path_tokens)
+
+            file_type = self.detect_type(rel)
+            type_score = TYPE_WEIGHT if file_type in wanted_types else 0.0
+
+            mention_score = 0.0
+            if rel.lower() in request_lower or os.path.basename(rel).lower() in request_lower:
+                mention_score = MENTION_WEIGHT
+
+            score = content_score + path_score + type_score + recency.get(rel, 0.0) + mention_score
+            ranked.append({
+                "path": rel,
+                "score": round(score, 3),
+                "type": file_type,
+                "size": index.sizes[rel],
+                "text": index.texts.get(file_id) if file_id is not None else None,
+            })
+
+        ranked.sort(key=lambda item: (-item["score"], item["path"]))
+        return ranked
+
+    # ==================== Context Packing ====================
+
+    @staticmethod
+    def best_chunks(text: str, terms: List[str], max_chars: int, chunk_lines: int = IC_CHUNK_LINES) -> str:
+        """
+        The highest-scoring line windows of `text` that fit in max_chars,
+        in file order and labelled with their line ranges
+        """
+        lines = text.splitlines()
+        windows = []
+        for start in range(0, len(lines), chunk_lines):
+            chunk = lines[start:start + chunk_lines]
+            counts = Counter(tokenize("\n".join(chunk)))
+            hits = sum(counts.get(term, 0) for term in terms)
+            windows.append((hits, start, chunk))
+
+        selected = []
+        used = 0
+        for hits, start, chunk in sorted(windows, key=lambda window: (-window[0], window[1])):
+            body = "\n".join(chunk)
+            if used + len(body) > max_chars:
+                continue
+            selected.append((start, chunk, body))
+            used += len(body)
+            if hits == 0 and selected:
+                break  # Only one unmatched window, for orientation
+
+        parts = []
+        for start, chunk, body in sorted(selected):
+            parts.append(f"... lines {start + 1}-{start + len(chunk)} ...\n{body}")
+        return "\n".join(parts)
+
+    def pack(self, ranked: List[Dict], request: str, top_k: int = IC_RETRIEVAL_TOP_K,
+             token_budget: int = IC_CONTEXT_TOKEN_BUDGET) -> Dict[str, str]:
+        """
+        Contents for the top_k matching files: whole files while they fit,
+        otherwise their most relevant chunks, within token_budget
+        """
+        terms = query_terms(request)
+        remaining = token_budget * CHARS_PER_TOKEN
+        selected = [item for item in ranked[:top_k] if item["text"] is not None and item["score"] > 0]
+        context = {}
+        for position, item in enumerate(selected):
+            if remaining <= 0:
+                break
+            text = item["text"]
+            # Split what is left evenly over the files still to come
+            share = remaining // (len(selected) - position)
+            if len(text) <= remaining and len(text) <= max(share, remaining // 2):
+                context[item["path"]] = text
+            else:
+                excerpt = self.best_chunks(text, terms, share)
+                if not excerpt:
+                    continue
+                context[item["path"]] = excerpt
+            remaining -= len(context[item["path"]])
+        return context
+
+    # ==================== Public API ====================
+
+    async def rank(self, tree_index, request: str, file_history: Optional[List[Dict]] = None) -> List[Dict]:
+        """
+        Every file in the workspace scored against `request`, best first.
+        file_history entries ({"file", ...}, oldest first) boost recently
+        edited files.
+        """
+        recent_files = [entry["file"] for entry in reversed(file_history or []) if entry.get("file")]
+        return await self.content_index.run_synced(
+            tree_index, lambda index: self._rank(index, request, recent_files)
+        )
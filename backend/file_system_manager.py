@@ -1,11 +1,23 @@
 # File System Manager for AutoWebIQ Workspaces
 # Handles file operations within user workspaces
+# All filesystem syscalls run on the async_fs I/O pool, never on the event loop
 
 import os
 import json
+import re
+import shutil
+import fnmatch
 from typing import Dict, List, Optional
 from pathlib import Path
+from urllib.parse import urlencode
 import mimetypes
+from async_fs import run_io, scan_directory, iter_file_chunks
+from file_tree_index import FileTreeRegistry
+from content_index import ContentIndexRegistry
+
+# Files larger than this (or not UTF-8) are streamed via /api/files/raw
+# instead of being inlined in the JSON response
+FS_INLINE_MAX_BYTES = int(os.environ.get('FS_INLINE_MAX_BYTES', str(1024 * 1024)))
 
 class FileSystemManager:
     """
@@ -15,6 +27,8 @@ class FileSystemManager:
     
     def __init__(self, base_path: str = "/tmp/workspaces"):
         self.base_path = base_path
+        self.tree_index = FileTreeRegistry()
+        self.content_index = ContentIndexRegistry()
         os.makedirs(base_path, exist_ok=True)
     
     def _get_workspace_path(self, user_id: str, project_id: str) -> Path:
@@ -45,59 +59,106 @@ class FileSystemManager:
             {
                 "status": "success" | "error",
                 "content": str,
-                "encoding": str,
+                "encoding": "utf-8" | "stream",
                 "size": int,
-                "mime_type": str
+                "mime_type": str,
+                "stream_url": str  # only for encoding "stream"
             }
+        
+        Binary files and files over FS_INLINE_MAX_BYTES come back with empty
+        content and a stream_url to fetch them in chunks.
         """
         try:
             workspace_path = self._get_workspace_path(user_id, project_id)
-            full_path = self._validate_path(workspace_path, file_path)
-            
-            if not full_path.exists():
-                return {
-                    "status": "error",
-                    "message": "File not found"
-                }
-            
-            if not full_path.is_file():
-                return {
-                    "status": "error",
-                    "message": "Path is not a file"
-                }
-            
-            # Detect MIME type
-            mime_type, _ = mimetypes.guess_type(str(full_path))
-            
-            # Read file
-            with open(full_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
+            return await run_io(self._read_file_sync, workspace_path, project_id, file_path)
+        except Exception as e:
             return {
-                "status": "success",
-                "content": content,
-                "encoding": "utf-8",
-                "size": full_path.stat().st_size,
-                "mime_type": mime_type or "text/plain"
+                "status": "error",
+                "message": f"Failed to read file: {str(e)}"
             }
-            
-        except UnicodeDecodeError:
-            # Try reading as binary
-            with open(full_path, 'rb') as f:
-                content = f.read()
-            
+    
+    def _read_file_sync(self, workspace_path: Path, project_id: str, file_path: str) -> Dict:
+        full_path = self._validate_path(workspace_path, file_path)
+        
+        if not full_path.exists():
             return {
-                "status": "success",
-                "content": content.hex(),  # Return hex for binary files
-                "encoding": "binary",
-                "size": full_path.stat().st_size,
-                "mime_type": mime_type or "application/octet-stream"
+                "status": "error",
+                "message": "File not found"
             }
+        
+        if not full_path.is_file():
+            return {
+                "status": "error",
+                "message": "Path is not a file"
+            }
+        
+        # Detect MIME type
+        mime_type, _ = mimetypes.guess_type(str(full_path))
+        size = full_path.stat().st_size
+        
+        if size <= FS_INLINE_MAX_BYTES:
+            with open(full_path, 'rb') as f:
+                raw = f.read()
+            try:
+                return {
+                    "status": "success",
+                    "content": raw.decode('utf-8'),
+                    "encoding": "utf-8",
+                    "size": size,
+                    "mime_type": mime_type or "text/plain"
+                }
+            except UnicodeDecodeError:
+                pass
+        
+        return {
+            "status": "success",
+            "content": "",
+            "encoding": "stream",
+            "size": size,
+            "mime_type": mime_type or "application/octet-stream",
+            "stream_url": "/api/files/raw?" + urlencode({"project_id": project_id, "file_path": file_path})
+        }
+    
+    async def open_file_stream(
+        self,
+        user_id: str,
+        project_id: str,
+        file_path: str
+    ) -> Dict:
+        """
+        Open a workspace file for chunked streaming.
+        
+        Returns {"status": "success", "chunks": AsyncIterator[bytes], "size", "mime_type"}
+        or {"status": "error", "message"}.
+        """
+        workspace_path = self._get_workspace_path(user_id, project_id)
+        
+        def stat_file():
+            full_path = self._validate_path(workspace_path, file_path)
+            if not full_path.is_file():
+                return None, None
+            return full_path, full_path.stat().st_size
+        
+        try:
+            full_path, size = await run_io(stat_file)
         except Exception as e:
             return {
                 "status": "error",
-                "message": f"Failed to read file: {str(e)}"
+                "message": f"Failed to open file: {str(e)}"
+            }
+        if full_path is None:
+            return {
+                "status": "error",
+                "message": "File not found"
             }
+        
+        mime_type, _ = mimetypes.guess_type(str(full_path))
+        return {
+            "status": "success",
+            "chunks": iter_file_chunks(str(full_path)),
+            "size": size,
+            "mime_type": mime_type or "application/octet-stream"
+        }
     
     async def write_file(
         self,
@@ -110,8 +171,7 @@ class FileSystemManager:
         Write content to a file in workspace.
         Creates parent directories if needed.
         """
-        try:
-            workspace_path = self._get_workspace_path(user_id, project_id)
+        def write():
             full_path = self._validate_path(workspace_path, file_path)
             
             # Create parent directories
@@ -121,10 +181,18 @@ class FileSystemManager:
             with open(full_path, 'w', encoding='utf-8') as f:
                 f.write(content)
             
+            return full_path.stat().st_size
+        
+        try:
+            workspace_path = self._get_workspace_path(user_id, project_id)
+            size = await run_io(write)
+            self.tree_index.notify_changed(str(workspace_path), file_path)
+            await self.content_index.file_written(str(workspace_path), file_path)
+            
             return {
                 "status": "success",
                 "message": "File saved successfully",
-                "size": full_path.stat().st_size
+                "size": size
             }
             
         except Exception as e:
@@ -140,21 +208,28 @@ class FileSystemManager:
         file_path: str
     ) -> Dict:
         """Delete a file from workspace"""
-        try:
-            workspace_path = self._get_workspace_path(user_id, project_id)
+        def delete():
             full_path = self._validate_path(workspace_path, file_path)
             
             if not full_path.exists():
-                return {
-                    "status": "error",
-                    "message": "File not found"
-                }
+                return False
             
             if full_path.is_file():
                 full_path.unlink()
             elif full_path.is_dir():
-                import shutil
                 shutil.rmtree(full_path)
+            return True
+        
+        try:
+            workspace_path = self._get_workspace_path(user_id, project_id)
+            
+            if not await run_io(delete):
+                return {
+                    "status": "error",
+                    "message": "File not found"
+                }
+            self.tree_index.notify_changed(str(workspace_path), file_path)
+            await self.content_index.file_deleted(str(workspace_path), file_path)
             
             return {
                 "status": "success",
@@ -188,34 +263,38 @@ class FileSystemManager:
                 }]
             }
         """
-        try:
-            workspace_path = self._get_workspace_path(user_id, project_id)
+        def scan():
             full_path = self._validate_path(workspace_path, directory_path)
             
             if not full_path.exists():
-                return {
-                    "status": "error",
-                    "message": "Directory not found"
-                }
+                return "Directory not found", None
             
             if not full_path.is_dir():
+                return "Path is not a directory", None
+            
+            # Single scandir pass: type and stat for every entry in one pool call
+            return None, scan_directory(str(full_path))
+        
+        try:
+            workspace_path = self._get_workspace_path(user_id, project_id)
+            error, entries = await run_io(scan)
+            
+            if error:
                 return {
                     "status": "error",
-                    "message": "Path is not a directory"
+                    "message": error
                 }
             
-            files = []
-            for item in full_path.iterdir():
-                relative_path = item.relative_to(workspace_path)
-                
-                file_info = {
-                    "name": item.name,
-                    "path": str(relative_path),
-                    "type": "directory" if item.is_dir() else "file",
-                    "size": item.stat().st_size if item.is_file() else 0,
-                    "modified": item.stat().st_mtime
+            files = [
+                {
+                    "name": entry["name"],
+                    "path": os.path.relpath(entry["path"], workspace_path),
+                    "type": "directory" if entry["is_dir"] else "file",
+                    "size": entry["size"],
+                    "modified": entry["modified"]
                 }
-                files.append(file_info)
+                for entry in entries
+            ]
             
             # Sort: directories first, then files alphabetically
             files.sort(key=lambda x: (x["type"] != "directory", x["name"].lower()))
@@ -238,11 +317,14 @@ class FileSystemManager:
         directory_path: str
     ) -> Dict:
         """Create a new directory"""
-        try:
-            workspace_path = self._get_workspace_path(user_id, project_id)
+        def create():
             full_path = self._validate_path(workspace_path, directory_path)
-            
             full_path.mkdir(parents=True, exist_ok=True)
+        
+        try:
+            workspace_path = self._get_workspace_path(user_id, project_id)
+            await run_io(create)
+            self.tree_index.notify_changed(str(workspace_path), directory_path)
             
             return {
                 "status": "success",
@@ -255,63 +337,55 @@ class FileSystemManager:
                 "message": f"Failed to create directory: {str(e)}"
             }
     
+    async def get_tree_index(self, user_id: str, project_id: str):
+        """Warm WorkspaceTreeIndex for the workspace, or None if it does not exist"""
+        return await self.tree_index.get(str(self._get_workspace_path(user_id, project_id)))
+    
     async def get_file_tree(
         self,
         user_id: str,
         project_id: str,
-        max_depth: int = 5
+        max_depth: int = 5,
+        path: str = "",
+        since_version: Optional[str] = None
     ) -> Dict:
         """
-        Get complete file tree structure.
+        Get file tree structure for the file explorer UI.
         
-        Returns nested structure for file explorer UI.
+        Served from the workspace's tree index (kept current by inotify or
+        polling). `path` selects a subtree; `version` changes whenever the
+        tree does, and passing it back as `since_version` returns
+        {"status": "not_modified"} instead of the tree.
         """
         try:
             workspace_path = self._get_workspace_path(user_id, project_id)
+            if path:
+                self._validate_path(workspace_path, path)
+            index = await self.tree_index.get(str(workspace_path))
             
-            if not workspace_path.exists():
+            if index is None:
                 return {
                     "status": "error",
                     "message": "Workspace not found"
                 }
             
-            def build_tree(path: Path, current_depth: int = 0) -> Dict:
-                """Recursively build file tree"""
-                if current_depth >= max_depth:
-                    return None
-                
-                relative_path = path.relative_to(workspace_path)
-                
-                node = {
-                    "name": path.name if path != workspace_path else "root",
-                    "path": str(relative_path) if path != workspace_path else "",
-                    "type": "directory" if path.is_dir() else "file"
+            if since_version and since_version == index.etag:
+                return {
+                    "status": "not_modified",
+                    "version": index.etag
                 }
-                
-                if path.is_file():
-                    node["size"] = path.stat().st_size
-                    node["extension"] = path.suffix
-                elif path.is_dir():
-                    node["children"] = []
-                    try:
-                        for item in sorted(path.iterdir(), key=lambda x: (not x.is_dir(), x.name.lower())):
-                            # Skip hidden files and common ignore patterns
-                            if item.name.startswith('.') or item.name in ['node_modules', '__pycache__', 'venv', 'dist', 'build']:
-                                continue
-                            
-                            child = build_tree(item, current_depth + 1)
-                            if child:
-                                node["children"].append(child)
-                    except PermissionError:
-                        pass
-                
-                return node
             
-            tree = build_tree(workspace_path)
+            tree = index.render(path, max_depth)
+            if tree is None:
+                return {
+                    "status": "error",
+                    "message": "Directory not found"
+                }
             
             return {
                 "status": "success",
-                "tree": tree
+                "tree": tree,
+                "version": index.etag
             }
             
         except Exception as e:
@@ -325,37 +399,65 @@ class FileSystemManager:
         user_id: str,
         project_id: str,
         query: str,
-        file_pattern: str = "*"
+        file_pattern: str = "*",
+        content: bool = False,
+        regex: bool = False,
+        case_sensitive: bool = False,
+        max_results: int = 200
     ) -> Dict:
         """
-        Search for files matching pattern.
+        Search for files.
+        
+        By default matches file names against `query`. With content=True (or
+        regex=True) searches file contents through the workspace trigram index
+        and returns line-level hits: [{"path", "line", "column", "text"}].
+        `file_pattern` is a glob applied to names / relative paths.
         """
+        if not query:
+            return {
+                "status": "error",
+                "message": "Query is required"
+            }
         try:
             workspace_path = self._get_workspace_path(user_id, project_id)
+            index = await self.tree_index.get(str(workspace_path))
             
-            if not workspace_path.exists():
+            if index is None:
                 return {
                     "status": "error",
                     "message": "Workspace not found"
                 }
             
-            results = []
+            if content or regex:
+                try:
+                    found = await self.content_index.search(
+                        index, query, regex=regex, case_sensitive=case_sensitive,
+                        path_glob=file_pattern, max_results=max_results
+                    )
+                except re.error as e:
+                    return {
+                        "status": "error",
+                        "message": f"Invalid regex: {str(e)}"
+                    }
+                return {
+                    "status": "success",
+                    "results": found["hits"],
+                    "count": len(found["hits"]),
+                    "truncated": found["truncated"]
+                }
             
-            for file_path in workspace_path.rglob(file_pattern):
-                if file_path.is_file():
-                    relative_path = file_path.relative_to(workspace_path)
-                    
-                    # Skip ignored directories
-                    if any(part in ['node_modules', '__pycache__', 'venv', '.git'] for part in relative_path.parts):
-                        continue
-                    
-                    # Check if filename matches query
-                    if query.lower() in file_path.name.lower():
-                        results.append({
-                            "name": file_path.name,
-                            "path": str(relative_path),
-                            "size": file_path.stat().st_size
-                        })
+            results = []
+            for rel in sorted(index.files()):
+                node = index.nodes[rel]
+                if not fnmatch.fnmatch(node["name"], file_pattern):
+                    continue
+                # Check if filename matches query
+                if query.lower() in node["name"].lower():
+                    results.append({
+                        "name": node["name"],
+                        "path": rel,
+                        "size": node["size"]
+                    })
             
             return {
                 "status": "success",
@@ -0,0 +1,440 @@
+# Workspace File Tree Index
+# Per-workspace in-memory tree built once, then kept current by inotify
+# (ctypes, no extra dependency) or directory-mtime polling as a fallback
+
+from async_fs import run_io, scan_directory
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+import asyncio
+import ctypes
+import ctypes.util
+import logging
+import os
+import struct
+import sys
+import uuid
+
+logger = logging.getLogger(__name__)
+
+FS_TREE_MAX_WORKSPACES = int(os.environ.get('FS_TREE_MAX_WORKSPACES', '256'))
+FS_TREE_POLL_INTERVAL = float(os.environ.get('FS_TREE_POLL_INTERVAL', '2'))
+# Events are coalesced for this long before affected directories are rescanned
+FS_TREE_DEBOUNCE = float(os.environ.get('FS_TREE_DEBOUNCE', '0.05'))
+
+IGNORED_NAMES = {'node_modules', '__pycache__', 'venv', 'dist', 'build'}
+
+# inotify(7) constants
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE |
+              IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+EVENT_HEADER = struct.Struct('iIII')
+
+
+def is_ignored(name: str) -> bool:
+    return name.startswith('.') or name in IGNORED_NAMES
+
+
+def join(parent: str, name: str) -> str:
+    return f"{parent}/{name}" if parent else name
+
+
+class Inotify:
+    """Minimal non-blocking inotify wrapper over libc"""
+
+    _libc = None
+
+    def __init__(self):
+        if Inotify._libc is None:
+            Inotify._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = Inotify._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+
+    def add_watch(self, path: str, mask: int = WATCH_MASK) -> int:
+        wd = Inotify._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), path)
+        return wd
+
+    def read_events(self) -> List[Tuple[int, int, str]]:
+        """Drain pending events as (wd, mask, name)"""
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return events
+            offset = 0
+            while offset + EVENT_HEADER.size <= len(data):
+                wd, mask, _cookie, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = data[offset:offset + length].rstrip(b'\0').decode(errors='surrogateescape')
+                offset += length
+                events.append((wd, mask, name))
+
+    def close(self):
+        os.close(self.fd)
+
+
+def scan_subtree(root: str, rel: str) -> Tuple[Dict[str, Dict], Dict[str, Set[str]], Dict[str, float]]:
+    """Walk a directory (blocking): returns nodes, children per directory and directory mtimes"""
+    nodes: Dict[str, Dict] = {}
+    children: Dict[str, Set[str]] = {}
+    mtimes: Dict[str, float] = {rel: os.stat(os.path.join(root, rel)).st_mtime}
+    pending = [rel]
+    while pending:
+        directory = pending.pop()
+        names = set()
+        try:
+            entries = scan_directory(os.path.join(root, directory))
+        except (PermissionError, FileNotFoundError, NotADirectoryError):
+            entries = []
+        for entry in entries:
+            if is_ignored(entry["name"]):
+                continue
+            child = join(directory, entry["name"])
+            names.add(entry["name"])
+            nodes[child] = node_from_entry(child, entry)
+            if entry["is_dir"]:
+                mtimes[child] = entry["modified"]
+                pending.append(child)
+        children[directory] = names
+    return nodes, children, mtimes
+
+
+def node_from_entry(rel: str, entry: Dict) -> Dict:
+    if entry["is_dir"]:
+        return {"name": entry["name"], "path": rel, "type": "directory"}
+    return {
+        "name": entry["name"],
+        "path": rel,
+        "type": "file",
+        "size": entry["size"],
+        # Size alone misses same-length edits; content indexes compare both
+        "modified": entry["modified"],
+        "extension": os.path.splitext(entry["name"])[1],
+    }
+
+
+def stat_mtimes(root: str, directories: List[str]) -> Dict[str, Optional[float]]:
+    mtimes = {}
+    for directory in directories:
+        try:
+            mtimes[directory] = os.stat(os.path.join(root, directory)).st_mtime
+        except OSError:
+            mtimes[directory] = None
+    return mtimes
+
+
+class WorkspaceTreeIndex:
+    """
+    In-memory tree of one workspace.
+
+    Mutations are computed on the I/O pool and applied on the event loop.
+    Every applied change bumps `version`; rendered subtrees are memoized per
+    (path, depth) until the next change.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.generation = uuid.uuid4().hex[:8]
+        self.version = 0
+        self.valid = True
+        self.nodes: Dict[str, Dict] = {}
+        self.children: Dict[str, Set[str]] = {}
+        self.dir_mtimes: Dict[str, float] = {}
+        self._rendered: Dict[Tuple[str, int], Tuple[int, Dict]] = {}
+        self._dirty: Set[str] = set()
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self._inotify: Optional[Inotify] = None
+        self._watches: Dict[int, str] = {}
+        self._poller: Optional[asyncio.Task] = None
+
+    @property
+    def etag(self) -> str:
+        return f"{self.generation}-{self.version}"
+
+    # ==================== Build & Watch ====================
+
+    async def build(self):
+        nodes, children, mtimes = await run_io(scan_subtree, self.root, "")
+        self.nodes, self.children, self.dir_mtimes = nodes, children, mtimes
+        self.version += 1
+        self._rendered.clear()
+        self._start_watching()
+
+    def _start_watching(self):
+        if self._inotify is None and self._poller is None and sys.platform.startswith('linux'):
+            try:
+                self._inotify = Inotify()
+                asyncio.get_running_loop().add_reader(self._inotify.fd, self._on_inotify)
+            except OSError as e:
+                logger.warning(f"inotify unavailable ({e}); polling {self.root}")
+                self._inotify = None
+        if self._inotify is not None:
+            try:
+                for directory in self.children:
+                    self._watch(directory)
+                return
+            except OSError as e:
+                # Usually ENOSPC: fs.inotify.max_user_watches exhausted
+                logger.warning(f"inotify watch failed ({e}); polling {self.root}")
+                self._stop_inotify()
+        if self._poller is None:
+            self._poller = asyncio.get_running_loop().create_task(self._poll())
+
+    def _watch(self, directory: str):
+        wd = self._inotify.add_watch(os.path.join(self.root, directory))
+        self._watches[wd] = directory
+
+    def _stop_inotify(self):
+        if self._inotify is not None:
+            asyncio.get_running_loop().remove_reader(self._inotify.fd)
+            self._inotify.close()
+            self._inotify = None
+            self._watches.clear()
+
+    def close(self):
+        self.valid = False
+        self._stop_inotify()
+        if self._poller:
+            self._poller.cancel()
+            self._poller = None
+        if self._flush_handle:
+            self._flush_handle.cancel()
+
+    def _on_inotify(self):
+        for wd, mask, _name in self._inotify.read_events():
+            if mask & IN_Q_OVERFLOW:
+                # Events were dropped: rescan everything we know about
+                self.mark_dirty(*self.children)
+                continue
+            directory = self._watches.get(wd)
+            if directory is None:
+                continue
+            if mask & IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                if directory == "":
+                    self.valid = False  # Workspace itself is gone; the registry rebuilds
+                continue
+            self.mark_dirty(directory)
+
+    async def _poll(self):
+        while self.valid:
+            await asyncio.sleep(FS_TREE_POLL_INTERVAL)
+            try:
+                mtimes = await run_io(stat_mtimes, self.root, list(self.dir_mtimes))
+            except Exception as e:
+                logger.warning(f"File tree poll failed for {self.root}: {e}")
+                continue
+            if mtimes.get("") is None:
+                self.valid = False
+                return
+            changed = [d for d, mtime in mtimes.items() if mtime != self.dir_mtimes.get(d)]
+            # In-place edits don't touch the directory mtime, so stat the files too
+            files = self.files()
+            try:
+                file_mtimes = await run_io(stat_mtimes, self.root, files)
+            except Exception as e:
+                logger.warning(f"File tree poll failed for {self.root}: {e}")
+                file_mtimes = {}
+            changed.extend(
+                os.path.dirname(rel) for rel, mtime in file_mtimes.items()
+                if rel in self.nodes and mtime != self.nodes[rel].get("modified")
+            )
+            if changed:
+                self.mark_dirty(*changed)
+
+    # ==================== Incremental Updates ====================
+
+    def mark_dirty(self, *directories: str):
+        """Schedule a rescan of the given directories (relative paths)"""
+        self._dirty.update(directories)
+        if self._flush_handle is None:
+            loop = asyncio.get_running_loop()
+            self._flush_handle = loop.call_later(FS_TREE_DEBOUNCE, self._start_flush)
+
+    def _start_flush(self):
+        self._flush_handle = None
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.get_running_loop().create_task(self.flush())
+
+    async def flush(self):
+        """Apply all pending rescans now"""
+        while self._dirty:
+            # Parents first, so a rescanned parent can replace its whole subtree
+            for directory in sorted(self._dirty, key=lambda d: d.count('/') if d else -1):
+                self._dirty.discard(directory)
+                if directory in self.children:
+                    await self._rescan(directory)
+
+    async def _rescan(self, directory: str):
+        try:
+            entries = await run_io(scan_directory, os.path.join(self.root, directory))
+            mtime = (await run_io(stat_mtimes, self.root, [directory]))[directory]
+        except (FileNotFoundError, NotADirectoryError):
+            self._remove_subtree(directory)
+            self._bump()
+            return
+
+        current = {entry["name"]: entry for entry in entries if not is_ignored(entry["name"])}
+        previous = self.children.get(directory, set())
+        changed = False
+
+        for name in previous - current.keys():
+            self._remove_subtree(join(directory, name))
+            changed = True
+
+        for name, entry in current.items():
+            rel = join(directory, name)
+            node = node_from_entry(rel, entry)
+            if entry["is_dir"] and rel not in self.children:
+                # New (or replaced) directory: index its whole subtree
+                self._remove_subtree(rel)
+                nodes, children, mtimes = await run_io(scan_subtree, self.root, rel)
+                self.nodes.update(nodes)
+                self.children.update(children)
+                self.dir_mtimes.update(mtimes)
+                if self._inotify is not None:
+                    for subdirectory in children:
+                        try:
+                            self._watch(subdirectory)
+                        except OSError as e:
+                            logger.warning(f"inotify watch failed for {subdirectory}: {e}")
+                changed = True
+            elif not entry["is_dir"] and rel in self.children:
+                self._remove_subtree(rel)
+                changed = True
+            if self.nodes.get(rel) != node:
+                self.nodes[rel] = node
+                changed = True
+
+        self.children[directory] = set(current)
+        if mtime is not None:
+            self.dir_mtimes[directory] = mtime
+        if changed:
+            self._bump()
+
+    def _remove_subtree(self, rel: str):
+        self.nodes.pop(rel, None)
+        self.dir_mtimes.pop(rel, None)
+        for name in self.children.pop(rel, ()):
+            self._remove_subtree(join(rel, name))
+
+    def _bump(self):
+        self.version += 1
+        self._rendered.clear()
+
+    # ==================== Lazy Rendering ====================
+
+    def render(self, path: str = "", max_depth: int = 5) -> Optional[Dict]:
+        """
+        Nested tree for `path`, same shape as the original get_file_tree.
+        Directories whose children were cut off by `max_depth` carry
+        "truncated": True so the UI can fetch them lazily.
+        """
+        path = path.strip('/')
+        cached = self._rendered.get((path, max_depth))
+        if cached is not None and cached[0] == self.version:
+            return cached[1]
+
+        if path and self.nodes.get(path, {}).get("type") != "directory":
+            return None
+        root = {
+            "name": os.path.basename(path) if path else "root",
+            "path": path,
+            "type": "directory",
+            "children": self._render_children(path, 0, max_depth),
+        }
+        self._rendered[(path, max_depth)] = (self.version, root)
+        return root
+
+    def _render_children(self, directory: str, depth: int, max_depth: int) -> List[Dict]:
+        rendered = []
+        if depth + 1 >= max_depth:
+            return rendered
+        names = sorted(
+            self.children.get(directory, ()),
+            key=lambda name: (self.nodes[join(directory, name)]["type"] != "directory", name.lower())
+        )
+        for name in names:
+            node = dict(self.nodes[join(directory, name)])
+            if node["type"] == "directory":
+                node["children"] = self._render_children(node["path"], depth + 1, max_depth)
+                if depth + 2 >= max_depth and self.children.get(node["path"]):
+                    node["truncated"] = True
+            rendered.append(node)
+        return rendered
+
+    def files(self) -> List[str]:
+        """All indexed file paths"""
+        return [rel for rel, node in self.nodes.items() if node["type"] == "file"]
+
+
+class FileTreeRegistry:
+    """LRU of workspace indexes; building is single-flight per workspace"""
+
+    def __init__(self, max_workspaces: int = FS_TREE_MAX_WORKSPACES):
+        self.max_workspaces = max_workspaces
+        self._indexes: "OrderedDict[str, WorkspaceTreeIndex]" = OrderedDict()
+        self._building: Dict[str, asyncio.Future] = {}
+
+    async def get(self, root: str) -> Optional[WorkspaceTreeIndex]:
+        """Warm index for `root`, or None when the workspace does not exist"""
+        index = self._indexes.get(root)
+        if index is not None and index.valid:
+            self._indexes.move_to_end(root)
+            if index._dirty:
+                await index.flush()
+            return index
+        if index is not None:
+            index.close()
+            del self._indexes[root]
+
+        if root in self._building:
+            return await asyncio.shield(self._building[root])
+
+        future = asyncio.get_running_loop().create_future()
+        self._building[root] = future
+        try:
+            index = None
+            if await run_io(os.path.isdir, root):
+                index = WorkspaceTreeIndex(root)
+                await index.build()
+                self._indexes[root] = index
+                while len(self._indexes) > self.max_workspaces:
+                    _, evicted = self._indexes.popitem(last=False)
+                    evicted.close()
+            future.set_result(index)
+            return index
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()
+            raise
+        finally:
+            del self._building[root]
+
+    def notify_changed(self, root: str, rel_path: str):
+        """Record a write made through the API so the next read sees it without waiting for events"""
+        index = self._indexes.get(root)
+        if index is None:
+            return
+        # Rescan the nearest indexed ancestor (parents may have been created by the write)
+        directory = os.path.dirname(os.path.normpath(rel_path.strip('/')))
+        while directory and directory not in index.children:
+            directory = os.path.dirname(directory)
+        index.mark_dirty(directory)
@@ -8,6 +8,7 @@ from datetime import datetime
 import redis.asyncio as redis
 from database import AsyncSessionLocal, mongo_db
 from sqlalchemy import text
+from health_prober import estimated_pg_counts, estimated_mongo_counts
 
 async def check_service_health():
     """Check health of all production services"""
@@ -31,13 +32,11 @@ async def check_service_health():
             version = result.scalar()
             print(f"✅ Connected: {version[:50]}...")
             
-            # Get table counts
-            result = await session.execute(text("SELECT COUNT(*) FROM users"))
-            users = result.scalar()
-            result = await session.execute(text("SELECT COUNT(*) FROM projects"))
-            projects = result.scalar()
-            result = await session.execute(text("SELECT COUNT(*) FROM credit_transactions"))
-            transactions = result.scalar()
+            # Estimated table counts (planner statistics, no full scans)
+            counts = await estimated_pg_counts(session)
+            users = counts.get('users', 0)
+            projects = counts.get('projects', 0)
+            transactions = counts.get('credit_transactions', 0)
             
             print(f"   Users: {users}")
             print(f"   Projects: {projects}")
@@ -59,8 +58,9 @@ async def check_service_health():
     print("-"*70)
     try:
         await mongo_db.command('ping')
-        templates = await mongo_db.templates.count_documents({})
-        components = await mongo_db.components.count_documents({})
+        counts = await estimated_mongo_counts(mongo_db, ['templates', 'components'])
+        templates = counts['templates']
+        components = counts['components']
         
         print(f"✅ Connected")
         print(f"   Templates: {templates}")
@@ -0,0 +1,193 @@
+# Health Prober
+# Probes MongoDB, PostgreSQL, Redis, Celery and Docker concurrently in the
+# background; health endpoints read the cached snapshot instead of hitting
+# the dependencies on every Kubernetes probe
+
+from datetime import datetime, timezone
+from prometheus_client import Gauge
+from sqlalchemy import bindparam, text
+from typing import Awaitable, Callable, Dict, List, Optional
+import asyncio
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+HEALTH_PROBE_INTERVAL = float(os.environ.get('HEALTH_PROBE_INTERVAL', '10'))
+HEALTH_PROBE_TIMEOUT = float(os.environ.get('HEALTH_PROBE_TIMEOUT', '3'))
+# Checks whose failure makes the pod unready (the others are reported only)
+HEALTH_REQUIRED_CHECKS = [
+    name.strip() for name in os.environ.get('HEALTH_REQUIRED_CHECKS', 'mongodb').split(',') if name.strip()
+]
+# A snapshot older than this means the prober itself is stuck
+HEALTH_STALE_AFTER = float(os.environ.get('HEALTH_STALE_AFTER', str(HEALTH_PROBE_INTERVAL * 3)))
+
+PG_COUNTED_TABLES = ['users', 'projects', 'credit_transactions']
+MONGO_COUNTED_COLLECTIONS = ['users', 'projects', 'templates', 'components']
+
+HEALTH_CHECK_UP = Gauge(
+    'health_check_up',
+    'Result of the last background health probe (1 = healthy)',
+    ['check']
+)
+HEALTH_CHECK_LATENCY = Gauge(
+    'health_check_latency_seconds',
+    'Duration of the last background health probe',
+    ['check']
+)
+
+# Partitioned tables have no rows of their own; their estimate is the sum of their partitions
+ESTIMATED_COUNTS_SQL = text("""
+    SELECT c.relname,
+           GREATEST(c.reltuples, 0)::bigint + COALESCE((
+               SELECT SUM(GREATEST(p.reltuples, 0))::bigint
+               FROM pg_inherits i JOIN pg_class p ON p.oid = i.inhrelid
+               WHERE i.inhparent = c.oid
+           ), 0) AS estimate
+    FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE n.nspname = current_schema()
+      AND c.relkind IN ('r', 'p')
+      AND c.relname IN :names
+""").bindparams(bindparam('names', expanding=True))
+
+
+async def estimated_pg_counts(conn, tables: List[str] = PG_COUNTED_TABLES) -> Dict[str, int]:
+    """Row counts from planner statistics (pg_class.reltuples) instead of COUNT(*)"""
+    result = await conn.execute(ESTIMATED_COUNTS_SQL, {'names': tables})
+    return {name: int(estimate) for name, estimate in result.all()}
+
+
+async def estimated_mongo_counts(mongo_db, collections: List[str] = MONGO_COUNTED_COLLECTIONS) -> Dict[str, int]:
+    """Document counts from collection metadata (no collection scan)"""
+    counts = await asyncio.gather(*(mongo_db[name].estimated_document_count() for name in collections))
+    return dict(zip(collections, counts))
+
+
+class HealthProber:
+    """Runs named async checks on an interval and caches the results"""
+
+    def __init__(self, interval: float = HEALTH_PROBE_INTERVAL, timeout: float = HEALTH_PROBE_TIMEOUT,
+                 required: List[str] = HEALTH_REQUIRED_CHECKS):
+        self.interval = interval
+        self.timeout = timeout
+        self.required = required
+        self.checks: Dict[str, Callable[[], Awaitable[Dict]]] = {}
+        # Replaced wholesale after each round, so readers never see a partial update
+        self.snapshot: Dict = {'status': 'starting', 'checks': {}, 'checked_at': None}
+        self.last_round: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def register(self, name: str, check: Callable[[], Awaitable[Dict]]):
+        """A check returns a dict of details, or raises when unhealthy"""
+        self.checks[name] = check
+
+    async def _run_check(self, name: str, check) -> Dict:
+        start = time.perf_counter()
+        try:
+            details = await asyncio.wait_for(check(), timeout=self.timeout)
+            result = {'status': 'healthy', **(details or {})}
+        except asyncio.TimeoutError:
+            result = {'status': 'timeout', 'error': f"no response within {self.timeout}s"}
+        except Exception as e:
+            result = {'status': 'error', 'error': str(e)}
+        elapsed = time.perf_counter() - start
+        result['latency_ms'] = round(elapsed * 1000, 1)
+        result['checked_at'] = datetime.now(timezone.utc).isoformat()
+        HEALTH_CHECK_UP.labels(name).set(1 if result['status'] == 'healthy' else 0)
+        HEALTH_CHECK_LATENCY.labels(name).set(elapsed)
+        return result
+
+    async def probe_once(self):
+        names = list(self.checks)
+        results = await asyncio.gather(*(self._run_check(name, self.checks[name]) for name in names))
+        checks = dict(zip(names, results))
+        healthy = all(result['status'] == 'healthy' for result in results)
+        ready = all(checks.get(name, {}).get('status') == 'healthy' for name in self.required)
+        self.snapshot = {
+            'status': 'healthy' if healthy else 'degraded' if ready else 'unhealthy',
+            'checks': checks,
+            'checked_at': datetime.now(timezone.utc).isoformat(),
+        }
+        self.last_round = time.monotonic()
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.probe_once()
+            except Exception as e:
+                logger.error(f"Health probe round failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    # ==================== O(1) Reads ====================
+
+    def is_stale(self) -> bool:
+        return self.last_round is None or time.monotonic() - self.last_round > HEALTH_STALE_AFTER
+
+    def readiness(self) -> Dict:
+        """Ready when every required check passed in a recent round"""
+        snapshot = self.snapshot
+        failing = [
+            name for name in self.required
+            if snapshot['checks'].get(name, {}).get('status') != 'healthy'
+        ]
+        return {
+            'ready': not failing and not self.is_stale(),
+            'failing': failing,
+            'stale': self.is_stale(),
+            'checked_at': snapshot['checked_at'],
+        }
+
+
+def create_health_prober(mongo_db, redis_client, docker_manager) -> HealthProber:
+    """Prober with the standard dependency checks for the API server"""
+    prober = HealthProber()
+
+    async def check_mongodb():
+        await mongo_db.command('ping')
+        return {'estimated_counts': await estimated_mongo_counts(mongo_db)}
+
+    async def check_postgresql():
+        from database import engine
+        async with engine.connect() as conn:
+            return {'estimated_counts': await estimated_pg_counts(conn)}
+
+    async def check_redis():
+        await redis_client.ping()
+        info = await redis_client.info('memory')
+        return {'memory': info.get('used_memory_human')}
+
+    async def check_celery():
+        from celery_app import celery_app
+        # control.ping blocks; bound it below the probe timeout so the thread finishes
+        replies = await asyncio.to_thread(celery_app.control.ping, timeout=max(prober.timeout / 2, 0.5))
+        if not replies:
+            raise RuntimeError("no workers responded")
+        return {'workers': len(replies)}
+
+    async def check_docker():
+        if not docker_manager.is_docker_available():
+            raise RuntimeError("Docker client not initialized")
+        await asyncio.to_thread(docker_manager.client.ping)
+        return {}
+
+    prober.register('mongodb', check_mongodb)
+    prober.register('postgresql', check_postgresql)
+    prober.register('redis', check_redis)
+    prober.register('celery', check_celery)
+    prober.register('docker', check_docker)
+    return prober
@@ -0,0 +1,742 @@
+# Hot Credit Balance Ledger
+# Holds user credit balances in Redis. Reserve/commit/refund run as atomic Lua
+# scripts that mirror CreditManager's PENDING -> COMPLETED / REFUNDED states;
+# every state change is appended to a Redis stream and persisted write-behind
+# to MongoDB or PostgreSQL.
+
+import redis.asyncio as redis
+from redis.exceptions import RedisError, ResponseError
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+CREDIT_LEDGER_STREAM = os.environ.get('CREDIT_LEDGER_STREAM', 'credits:ledger')
+CREDIT_LEDGER_GROUP = 'ledger-persisters'
+CREDIT_LEDGER_BATCH = int(os.environ.get('CREDIT_LEDGER_BATCH', '100'))
+# Entries unacked this long (crashed consumer, reserve not persisted yet) are reclaimed
+CREDIT_LEDGER_CLAIM_IDLE_MS = int(os.environ.get('CREDIT_LEDGER_CLAIM_IDLE_MS', '30000'))
+# How long settled transaction state is kept in Redis
+CREDIT_TXN_TTL = int(os.environ.get('CREDIT_TXN_TTL', str(7 * 24 * 3600)))
+# Event ids remembered per Mongo user document to make balance updates idempotent
+CREDIT_LEDGER_APPLIED_MARKERS = int(os.environ.get('CREDIT_LEDGER_APPLIED_MARKERS', '1000'))
+# Hydration retries while the persister is applying events for the same user
+HYDRATE_ATTEMPTS = 5
+# Commits/refunds that hit a Redis error are retried in the background this often (seconds)
+CREDIT_SETTLE_RETRY_INTERVAL = float(os.environ.get('CREDIT_SETTLE_RETRY_INTERVAL', '5'))
+
+TXN_PREFIX = "hot_"
+
+
+def balance_key(user_id: str) -> str:
+    return f"credits:{user_id}:balance"
+
+
+def inflight_key(user_id: str) -> str:
+    """Sum of deltas applied to the hot balance but not yet persisted"""
+    return f"credits:{user_id}:inflight"
+
+
+def txn_key(transaction_id: str) -> str:
+    return f"credits:txn:{transaction_id}"
+
+
+def applying_key(user_id: str) -> str:
+    """Stream entries being applied to the durable store (sorted set scored by start time, ms)"""
+    return f"credits:{user_id}:applying"
+
+
+def applied_key(user_id: str) -> str:
+    """Counter bumped each time a persisted delta is released from inflight"""
+    return f"credits:{user_id}:applied"
+
+
+# ==================== Lua Scripts ====================
+
+# KEYS: balance, inflight, txn, stream
+# ARGV: amount, txn_id, user_id, operation, metadata, now, txn_ttl
+RESERVE_SCRIPT = """
+local balance = redis.call('GET', KEYS[1])
+if not balance then return {-2, 0} end
+balance = tonumber(balance)
+local amount = tonumber(ARGV[1])
+if balance < amount then return {-1, balance} end
+local new_balance = redis.call('DECRBY', KEYS[1], amount)
+redis.call('INCRBY', KEYS[2], -amount)
+redis.call('HSET', KEYS[3], 'user_id', ARGV[3], 'amount', amount, 'status', 'pending', 'operation', ARGV[4])
+redis.call('EXPIRE', KEYS[3], ARGV[7])
+redis.call('XADD', KEYS[4], '*', 'event', 'reserve', 'txn_id', ARGV[2], 'user_id', ARGV[3],
+    'amount', amount, 'delta', -amount, 'balance_after', new_balance,
+    'operation', ARGV[4], 'metadata', ARGV[5], 'at', ARGV[6])
+return {1, new_balance}
+"""
+
+# KEYS: balance, inflight, txn, stream
+# ARGV: txn_id, actual_cost (-1 = full reservation), now
+COMMIT_SCRIPT = """
+local status = redis.call('HGET', KEYS[3], 'status')
+if not status then return {-2, 0, 0, 0} end
+if status ~= 'pending' then return {-1, 0, 0, 0} end
+local user_id = redis.call('HGET', KEYS[3], 'user_id')
+local reserved = tonumber(redis.call('HGET', KEYS[3], 'amount'))
+local actual = tonumber(ARGV[2])
+if actual < 0 or actual > reserved then actual = reserved end
+local refund = reserved - actual
+local new_balance = -1
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    new_balance = redis.call('INCRBY', KEYS[1], refund)
+end
+if refund > 0 then redis.call('INCRBY', KEYS[2], refund) end
+redis.call('HSET', KEYS[3], 'status', 'completed', 'actual_cost', actual, 'refund_amount', refund)
+redis.call('XADD', KEYS[4], '*', 'event', 'commit', 'txn_id', ARGV[1], 'user_id', user_id,
+    'amount', actual, 'delta', refund, 'balance_after', new_balance, 'at', ARGV[3])
+return {1, refund, new_balance, actual}
+"""
+
+# KEYS: balance, inflight, txn, stream
+# ARGV: txn_id, reason, now
+REFUND_SCRIPT = """
+local status = redis.call('HGET', KEYS[3], 'status')
+if not status then return {-2, 0, 0} end
+if status ~= 'pending' then return {-1, 0, 0} end
+local user_id = redis.call('HGET', KEYS[3], 'user_id')
+local amount = tonumber(redis.call('HGET', KEYS[3], 'amount'))
+local new_balance = -1
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    new_balance = redis.call('INCRBY', KEYS[1], amount)
+end
+redis.call('INCRBY', KEYS[2], amount)
+redis.call('HSET', KEYS[3], 'status', 'refunded')
+redis.call('XADD', KEYS[4], '*', 'event', 'refund', 'txn_id', ARGV[1], 'user_id', user_id,
+    'amount', amount, 'delta', amount, 'balance_after', new_balance,
+    'reason', ARGV[2], 'at', ARGV[3])
+return {1, amount, new_balance}
+"""
+
+# KEYS: balance, inflight, applying, applied
+# ARGV: durable_balance, applied counter seen before the durable read, now_ms, apply_timeout_ms
+# Refuses ({0, 0}) when an apply is in progress or finished since the durable
+# read: the durable balance and inflight would then disagree on that delta
+HYDRATE_SCRIPT = """
+local balance = redis.call('GET', KEYS[1])
+if balance then return {1, tonumber(balance)} end
+local since = tonumber(ARGV[3]) - tonumber(ARGV[4])
+if redis.call('ZCOUNT', KEYS[3], since, '+inf') > 0 then return {0, 0} end
+if (redis.call('GET', KEYS[4]) or '0') ~= ARGV[2] then return {0, 0} end
+local inflight = tonumber(redis.call('GET', KEYS[2]) or '0')
+balance = tonumber(ARGV[1]) + inflight
+redis.call('SET', KEYS[1], balance)
+return {1, balance}
+"""
+
+# KEYS: balance
+# ARGV: delta
+ADJUST_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then return nil end
+return redis.call('INCRBY', KEYS[1], ARGV[1])
+"""
+
+# KEYS: balance
+# ARGV: expected_current, new_value
+REPAIR_SCRIPT = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then return 0 end
+redis.call('SET', KEYS[1], ARGV[2])
+return 1
+"""
+
+
+# ==================== Durable Sinks ====================
+
+class MongoLedgerSink:
+    """
+    Persists ledger events into the V1 collections (users, credit_transactions).
+
+    apply() is idempotent without multi-document transactions: the balance
+    $inc and a marker for the event ("reserve:<txn>", "commit:<txn>", ...)
+    land in one update of the user document, which only matches while the
+    marker is absent. The transaction documents are written afterwards with
+    upserts / guarded updates, so an event interrupted at any step can be
+    redelivered and completes without moving the balance twice.
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    async def durable_balance(self, user_id: str) -> Optional[int]:
+        user = await self.db.users.find_one({"id": user_id}, {"_id": 0, "credits": 1})
+        if user is None:
+            return None
+        return user.get('credits', 0)
+
+    async def _apply_balance(self, user_id: str, marker: str, delta: int):
+        """$inc the balance once per marker (single-document update, so atomic)"""
+        await self.db.users.update_one(
+            {"id": user_id, "ledger_applied": {"$ne": marker}},
+            {
+                "$inc": {"credits": delta},
+                "$push": {"ledger_applied": {"$each": [marker], "$slice": -CREDIT_LEDGER_APPLIED_MARKERS}}
+            }
+        )
+
+    async def apply(self, event: Dict) -> bool:
+        """Persist one event; False means it can't be applied yet (retry later)"""
+        from credit_system import CreditStatus, TransactionType
+
+        txn_id = event['txn_id']
+        user_id = event['user_id']
+        delta = int(event['delta'])
+        now = event['at']
+        marker = f"{event['event']}:{txn_id}"
+
+        if event['event'] == 'reserve':
+            await self._apply_balance(user_id, marker, delta)
+            await self.db.credit_transactions.update_one(
+                {"id": txn_id},
+                {"$setOnInsert": {
+                    'id': txn_id,
+                    'user_id': user_id,
+                    'type': TransactionType.DEDUCTION.value,
+                    'amount': delta,
+                    'operation': event.get('operation'),
+                    'status': CreditStatus.PENDING.value,
+                    'metadata': json.loads(event.get('metadata') or '{}'),
+                    'balance_after': int(event['balance_after']),
+                    'created_at': now,
+                    'updated_at': now
+                }},
+                upsert=True
+            )
+            return True
+
+        # The reserve has to be persisted first; until then, retry later
+        if await self.db.credit_transactions.find_one({"id": txn_id}, {"_id": 1}) is None:
+            return False
+
+        if event['event'] == 'commit':
+            new_status = CreditStatus.COMPLETED.value
+            changes = {'actual_cost': int(event['amount']), 'refund_amount': delta}
+            reason = f"Partial refund for {txn_id}"
+        else:
+            new_status = CreditStatus.REFUNDED.value
+            changes = {'refund_amount': delta}
+            reason = event.get('reason') or "Refund"
+
+        if delta > 0:
+            await self._apply_balance(user_id, marker, delta)
+            await self.db.credit_transactions.update_one(
+                {"id": f"ref_{txn_id}"},
+                {"$setOnInsert": {
+                    'id': f"ref_{txn_id}",
+                    'user_id': user_id,
+                    'type': TransactionType.REFUND.value,
+                    'amount': delta,
+                    'reason': reason,
+                    'status': CreditStatus.COMPLETED.value,
+                    'metadata': {'original_transaction': txn_id},
+                    'created_at': now,
+                    'updated_at': now
+                }},
+                upsert=True
+            )
+        # Last, so a redelivered event still finds the balance/refund steps to (re)check
+        await self.db.credit_transactions.update_one(
+            {"id": txn_id, "status": CreditStatus.PENDING.value},
+            {"$set": {'status': new_status, 'updated_at': now, **changes}}
+        )
+        return True
+
+
+class PostgresLedgerSink:
+    """Persists ledger events into users / credit_transactions in PostgreSQL"""
+
+    def __init__(self, session_factory=None):
+        if session_factory is None:
+            from database import AsyncSessionLocal
+            session_factory = AsyncSessionLocal
+        self.session_factory = session_factory
+
+    async def durable_balance(self, user_id: str) -> Optional[int]:
+        from sqlalchemy import select
+        from database import User
+
+        async with self.session_factory() as session:
+            result = await session.execute(select(User.credits).where(User.id == user_id))
+            return result.scalar_one_or_none()
+
+    async def apply(self, event: Dict) -> bool:
+        from sqlalchemy import select, update
+        from sqlalchemy.dialects.postgresql import insert
+        from database import CreditTransaction, User
+        from credit_system_v2 import TransactionStatus, TransactionType
+        from user_stats import record_ledger_entry
+
+        txn_id = event['txn_id']
+        user_id = event['user_id']
+        delta = int(event['delta'])
+        now = datetime.fromisoformat(event['at'])
+
+        async with self.session_factory() as session:
+            if event['event'] == 'reserve':
+                balance_after = int(event['balance_after'])
+                result = await session.execute(
+                    insert(CreditTransaction)
+                    .values(
+                        id=txn_id,
+                        user_id=user_id,
+                        transaction_type=TransactionType.DEDUCTION.value,
+                        amount=delta,
+                        balance_before=balance_after - delta,
+                        balance_after=balance_after,
+                        status=TransactionStatus.PENDING.value,
+                        description=event.get('operation'),
+                        extra_data=json.loads(event.get('metadata') or '{}'),
+                        created_at=now
+                    )
+                    .on_conflict_do_nothing()
+                    .returning(CreditTransaction.id)
+                )
+                if result.scalar_one_or_none() is not None:
+                    await session.execute(
+                        update(User).where(User.id == user_id)
+                        .values(credits=User.credits + delta, updated_at=now)
+                    )
+                    await record_ledger_entry(session, user_id, TransactionType.DEDUCTION.value, -delta)
+                await session.commit()
+                return True
+
+            new_status = (TransactionStatus.COMPLETED if event['event'] == 'commit'
+                          else TransactionStatus.REFUNDED).value
+            result = await session.execute(
+                update(CreditTransaction)
+                .where(CreditTransaction.id == txn_id,
+                       CreditTransaction.status == TransactionStatus.PENDING.value)
+                .values(status=new_status)
+                .returning(CreditTransaction.id)
+            )
+            if result.scalar_one_or_none() is None:
+                exists = await session.execute(
+                    select(CreditTransaction.id).where(CreditTransaction.id == txn_id)
+                )
+                return exists.scalar_one_or_none() is not None
+
+            if delta > 0:
+                balance = await session.execute(
+                    update(User).where(User.id == user_id)
+                    .values(credits=User.credits + delta, updated_at=now)
+                    .returning(User.credits)
+                )
+                balance_after = balance.scalar_one()
+                session.add(CreditTransaction(
+                    id=str(uuid.uuid4()),
+                    user_id=user_id,
+                    transaction_type=TransactionType.REFUND.value,
+                    amount=delta,
+                    balance_before=balance_after - delta,
+                    balance_after=balance_after,
+                    status=TransactionStatus.COMPLETED.value,
+                    description=event.get('reason') or f"Partial refund for {txn_id}",
+                    extra_data={'original_transaction_id': txn_id},
+                    created_at=now
+                ))
+            await session.commit()
+            return True
+
+
+# ==================== Hot Ledger ====================
+
+class HotCreditLedger:
+    """
+    Credit reservations against a Redis-held balance.
+
+    The balance key is hydrated from the durable store on first use as
+    durable balance + inflight deltas, only when no persisted delta was
+    released in between (see HYDRATE_SCRIPT). Each operation is a single EVALSHA.
+    If Redis is unavailable, operations fall back to `fallback` (a
+    CreditManager), whose transaction ids don't carry the hot prefix. A
+    commit or refund of a hot reservation that hits a Redis error is queued
+    and retried in the background; the scripts only act on PENDING
+    reservations, so a retry of a settle that did land is a no-op.
+    """
+
+    def __init__(self, redis_client, sink, fallback=None, stream: str = CREDIT_LEDGER_STREAM):
+        self.redis = redis_client
+        self.sink = sink
+        self.fallback = fallback
+        self.stream = stream
+        self._reserve = redis_client.register_script(RESERVE_SCRIPT)
+        self._commit = redis_client.register_script(COMMIT_SCRIPT)
+        self._refund = redis_client.register_script(REFUND_SCRIPT)
+        self._hydrate = redis_client.register_script(HYDRATE_SCRIPT)
+        self._adjust = redis_client.register_script(ADJUST_SCRIPT)
+        self._repair = redis_client.register_script(REPAIR_SCRIPT)
+        # (script, keys, args) of settles waiting for Redis to come back
+        self._deferred: List = []
+        self._retrier: Optional[asyncio.Task] = None
+
+    def _keys(self, user_id: str, transaction_id: str) -> List[str]:
+        return [balance_key(user_id), inflight_key(user_id), txn_key(transaction_id), self.stream]
+
+    async def _load(self, user_id: str) -> Optional[int]:
+        keys = [balance_key(user_id), inflight_key(user_id), applying_key(user_id), applied_key(user_id)]
+        for attempt in range(HYDRATE_ATTEMPTS):
+            # Counter first: any release after this point makes the hydrate refuse
+            applied = await self.redis.get(applied_key(user_id)) or '0'
+            durable = await self.sink.durable_balance(user_id)
+            if durable is None:
+                return None
+            now_ms = int(time.time() * 1000)
+            ok, balance = await self._hydrate(keys=keys, args=[durable, applied, now_ms, CREDIT_LEDGER_CLAIM_IDLE_MS])
+            if ok:
+                return int(balance)
+            await asyncio.sleep(0.05 * (attempt + 1))
+        raise RedisError(f"Hot balance for {user_id} not hydrated: persister busy for that user")
+
+    async def get_balance(self, user_id: str) -> int:
+        """Current balance; a single GET once the user is hot"""
+        try:
+            balance = await self.redis.get(balance_key(user_id))
+            if balance is None:
+                balance = await self._load(user_id)
+            return int(balance or 0)
+        except RedisError as e:
+            logger.warning(f"Hot balance unavailable, reading durable store: {e}")
+            return await self.sink.durable_balance(user_id) or 0
+
+    async def reserve_credits(
+        self,
+        user_id: str,
+        amount: int,
+        operation: str,
+        metadata: Optional[Dict] = None
+    ) -> Dict:
+        """Atomically check and hold `amount` credits (status PENDING)"""
+        transaction_id = f"{TXN_PREFIX}{uuid.uuid4().hex}"
+        args = [amount, transaction_id, user_id, operation, json.dumps(metadata or {}, default=str),
+                datetime.now(timezone.utc).isoformat(), CREDIT_TXN_TTL]
+        try:
+            code, balance = await self._reserve(keys=self._keys(user_id, transaction_id), args=args)
+            if code == -2:
+                if await self._load(user_id) is None:
+                    code, balance = -1, 0
+                else:
+                    code, balance = await self._reserve(keys=self._keys(user_id, transaction_id), args=args)
+        except RedisError as e:
+            if self.fallback is None:
+                raise
+            logger.warning(f"Hot ledger unavailable, reserving in durable store: {e}")
+            return await self.fallback.reserve_credits(user_id, amount, operation, metadata)
+
+        if code != 1:
+            return {
+                'status': 'insufficient',
+                'required': amount,
+                'available': balance,
+                'shortfall': amount - balance
+            }
+
+        return {
+            'status': 'success',
+            'transaction_id': transaction_id,
+            'reserved_amount': amount,
+            'previous_balance': balance + amount,
+            'remaining_balance': balance
+        }
+
+    async def complete_transaction(
+        self,
+        user_id: str,
+        transaction_id: str,
+        actual_cost: Optional[int] = None
+    ) -> Dict:
+        """Settle a reservation (COMPLETED); refunds the unused part of it"""
+        if not transaction_id.startswith(TXN_PREFIX):
+            return await self.fallback.complete_transaction(transaction_id, actual_cost)
+
+        keys = self._keys(user_id, transaction_id)
+        args = [transaction_id, -1 if actual_cost is None else actual_cost, datetime.now(timezone.utc).isoformat()]
+        try:
+            code, refunded, balance, charged = await self._commit(keys=keys, args=args)
+        except RedisError as e:
+            logger.error(f"Commit of {transaction_id} failed, retrying in the background: {e}")
+            self._defer(self._commit, keys, args)
+            return {
+                'status': 'queued',
+                'transaction_id': transaction_id,
+                'actual_cost': actual_cost,
+                'refunded': 0,
+                'remaining_balance': None,
+                'message': 'Settlement queued until the credit store is reachable'
+            }
+        if code != 1:
+            return {'status': 'error', 'message': 'Transaction not found or already settled'}
+
+        return {
+            'status': 'success',
+            'transaction_id': transaction_id,
+            'reserved': charged + refunded,
+            'actual_cost': charged,
+            'refunded': refunded,
+            'remaining_balance': balance if balance >= 0 else await self.get_balance(user_id)
+        }
+
+    async def refund_transaction(self, user_id: str, transaction_id: str, reason: str) -> Dict:
+        """Release a whole reservation (REFUNDED); no-op if already settled"""
+        now = datetime.now(timezone.utc).isoformat()
+        if not transaction_id.startswith(TXN_PREFIX):
+            # Claim the PENDING reservation first, so only one refund credits it
+            transaction = await self.fallback.db.credit_transactions.find_one_and_update(
+                {"id": transaction_id, "status": "pending"},
+                {"$set": {"status": "refunded", "updated_at": now}}
+            )
+            if not transaction:
+                return {'status': 'error', 'message': 'Transaction not found or already settled'}
+            return await self.fallback.refund_credits(
+                user_id, abs(transaction['amount']), reason, {'transaction_id': transaction_id}
+            )
+
+        keys = self._keys(user_id, transaction_id)
+        args = [transaction_id, reason, now]
+        try:
+            code, refunded, balance = await self._refund(keys=keys, args=args)
+        except RedisError as e:
+            logger.error(f"Refund of {transaction_id} failed, retrying in the background: {e}")
+            self._defer(self._refund, keys, args)
+            return {
+                'status': 'queued',
+                'transaction_id': transaction_id,
+                'message': 'Refund queued until the credit store is reachable'
+            }
+        if code != 1:
+            return {'status': 'error', 'message': 'Transaction not found or already settled'}
+
+        return {
+            'status': 'success',
+            'transaction_id': transaction_id,
+            'refunded_amount': refunded,
+            'new_balance': balance if balance >= 0 else await self.get_balance(user_id)
+        }
+
+    def _defer(self, script, keys: List[str], args: List):
+        self._deferred.append((script, keys, args))
+        if self._retrier is None or self._retrier.done():
+            self._retrier = asyncio.get_running_loop().create_task(self._retry_deferred())
+
+    async def _retry_deferred(self):
+        while self._deferred:
+            await asyncio.sleep(CREDIT_SETTLE_RETRY_INTERVAL)
+            await self.retry_deferred()
+
+    async def retry_deferred(self) -> int:
+        """Run the queued commits/refunds once; returns how many are still queued"""
+        pending, self._deferred = self._deferred, []
+        for script, keys, args in pending:
+            try:
+                await script(keys=keys, args=args)
+            except RedisError as e:
+                logger.warning(f"Deferred settle of {args[0]} failed again: {e}")
+                self._deferred.append((script, keys, args))
+        return len(self._deferred)
+
+    async def stop(self):
+        """Stop background retries, giving queued settles a last try"""
+        if self._retrier:
+            self._retrier.cancel()
+            self._retrier = None
+        if self._deferred and await self.retry_deferred():
+            logger.error(f"{len(self._deferred)} credit settles not applied; their reservations stay pending")
+
+    async def adjust(self, user_id: str, delta: int):
+        """Mirror a credit change already written to the durable store (purchases etc.)"""
+        try:
+            await self._adjust(keys=[balance_key(user_id)], args=[delta])
+        except RedisError as e:
+            logger.warning(f"Hot balance adjust failed for {user_id}, invalidating: {e}")
+            await self.invalidate(user_id)
+
+    async def invalidate(self, user_id: str):
+        """Drop the hot balance so it is re-hydrated (after a durable $set)"""
+        try:
+            await self.redis.delete(balance_key(user_id))
+        except RedisError as e:
+            logger.error(f"Hot balance invalidate failed for {user_id}: {e}")
+
+    # ==================== Reconciliation ====================
+
+    async def reconcile(self, repair: bool = True) -> Dict:
+        """
+        Compare every hot balance with durable balance + inflight deltas.
+
+        Values are read twice around the durable read and a user is only
+        reported when both reads agree, so in-flight operations don't show
+        up as drift.
+        """
+        checked, drifted, repaired = 0, [], 0
+        async for key in self.redis.scan_iter(match="credits:*:balance", count=500):
+            user_id = key.split(':')[1]
+            first = await self.redis.mget(key, inflight_key(user_id))
+            durable = await self.sink.durable_balance(user_id)
+            second = await self.redis.mget(key, inflight_key(user_id))
+            checked += 1
+            if durable is None or first != second or first[0] is None:
+                continue
+
+            expected = durable + int(first[1] or 0)
+            if int(first[0]) == expected:
+                continue
+
+            drifted.append({'user_id': user_id, 'hot': int(first[0]), 'expected': expected})
+            logger.warning(f"Hot balance drift for {user_id}: hot={first[0]} expected={expected}")
+            if repair and await self._repair(keys=[key], args=[first[0], expected]):
+                repaired += 1
+
+        stream_pending = 0
+        try:
+            for group in await self.redis.xinfo_groups(self.stream):
+                if group['name'] == CREDIT_LEDGER_GROUP:
+                    stream_pending = group['pending'] + (group.get('lag') or 0)
+        except ResponseError:
+            pass  # stream not created yet
+
+        return {
+            'status': 'success',
+            'checked': checked,
+            'drifted': drifted,
+            'repaired': repaired,
+            'stream_pending': stream_pending
+        }
+
+
+# ==================== Write-Behind Persister ====================
+
+class LedgerStreamPersister:
+    """
+    Consumes the ledger stream (consumer group, one consumer per process)
+    and applies events to the durable sink. After a successful apply, the
+    inflight delta is released and the entry acked in one MULTI.
+    """
+
+    def __init__(self, redis_client, sink, stream: str = CREDIT_LEDGER_STREAM,
+                 batch: int = CREDIT_LEDGER_BATCH):
+        self.redis = redis_client
+        self.sink = sink
+        self.stream = stream
+        self.batch = batch
+        self.consumer = f"{socket.gethostname()}-{os.getpid()}"
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _ensure_group(self):
+        try:
+            await self.redis.xgroup_create(self.stream, CREDIT_LEDGER_GROUP, id='0', mkstream=True)
+        except ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+
+    async def _run(self):
+        while True:
+            try:
+                await self._ensure_group()
+                while True:
+                    await self.process_once(block_ms=1000)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ledger persister error: {e}")
+                await asyncio.sleep(1)
+
+    async def process_once(self, block_ms: int = 0) -> int:
+        """Apply one batch (reclaimed stale entries first); returns entries acked"""
+        _, entries, *_ = await self.redis.xautoclaim(
+            self.stream, CREDIT_LEDGER_GROUP, self.consumer,
+            min_idle_time=CREDIT_LEDGER_CLAIM_IDLE_MS, start_id='0-0', count=self.batch
+        )
+        if not entries:
+            response = await self.redis.xreadgroup(
+                CREDIT_LEDGER_GROUP, self.consumer, {self.stream: '>'},
+                count=self.batch, block=block_ms or None
+            )
+            entries = response[0][1] if response else []
+
+        acked = 0
+        for entry_id, event in entries:
+            if not event:
+                # Trimmed from the stream before it was acked
+                await self.redis.xack(self.stream, CREDIT_LEDGER_GROUP, entry_id)
+                continue
+            user_id = event['user_id']
+            # Hydration of this user waits until the delta is applied and released
+            await self.redis.zadd(applying_key(user_id), {entry_id: int(time.time() * 1000)})
+            try:
+                applied = await self.sink.apply(event)
+            except Exception as e:
+                logger.error(f"Ledger event {entry_id} ({event.get('event')} {event.get('txn_id')}) failed: {e}")
+                applied = False
+            if not applied:
+                # Left pending, reclaimed after CREDIT_LEDGER_CLAIM_IDLE_MS
+                await self.redis.zrem(applying_key(user_id), entry_id)
+                continue
+
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.incrby(inflight_key(user_id), -int(event['delta']))
+                pipe.incr(applied_key(user_id))
+                pipe.zrem(applying_key(user_id), entry_id)
+                pipe.xack(self.stream, CREDIT_LEDGER_GROUP, entry_id)
+                await pipe.execute()
+            acked += 1
+
+        if acked:
+            await self.trim()
+        return acked
+
+    async def trim(self):
+        """
+        Drop acked entries: everything below the oldest pending entry, or
+        below the group's last delivered id when nothing is pending (entries
+        after it have not been read yet).
+        """
+        pending = await self.redis.xpending(self.stream, CREDIT_LEDGER_GROUP)
+        if pending['pending']:
+            min_id = pending['min']
+        else:
+            groups = await self.redis.xinfo_groups(self.stream)
+            min_id = next(
+                (group['last-delivered-id'] for group in groups if group['name'] == CREDIT_LEDGER_GROUP), None
+            )
+        if min_id:
+            # Approximate trimming only removes whole macro-nodes, never entries at or after min_id
+            await self.redis.xtrim(self.stream, minid=min_id, approximate=True)
+
+
+def make_ledger_sink(kind: Optional[str] = None, mongo_db=None):
+    """Build the sink named by CREDIT_LEDGER_SINK ('mongo' or 'postgres')"""
+    kind = kind or os.environ.get('CREDIT_LEDGER_SINK', 'mongo')
+    if kind == 'postgres':
+        return PostgresLedgerSink()
+    if mongo_db is None:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        client = AsyncIOMotorClient(os.environ.get('MONGO_URL', 'mongodb://localhost:27017'))
+        mongo_db = client[os.environ.get('DB_NAME', 'autowebiq_db')]
+    return MongoLedgerSink(mongo_db)
+
+
+def create_redis_client():
+    return redis.from_url(os.environ.get('REDIS_URL', 'redis://localhost:6379/0'), decode_responses=True)
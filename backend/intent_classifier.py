@@ -0,0 +1,152 @@
+# Intent Classifier
+# Local, microsecond-scale classification of iterative chat requests
+# (modify_files / generate_new / clarification_needed / general): regex rule
+# features plus hashed word n-grams scored by a small linear model trained
+# offline (train_intent_classifier.py) on logged requests
+
+from prometheus_client import Counter
+from typing import Dict, List, NamedTuple, Optional
+import json
+import logging
+import math
+import os
+import re
+import zlib
+
+logger = logging.getLogger(__name__)
+# Requests with their final label, one JSON object per line, for offline training
+sample_logger = logging.getLogger("intent.samples")
+
+INTENT_LABELS = ["modify_files", "generate_new", "clarification_needed", "general"]
+INTENT_MODEL_PATH = os.environ.get('INTENT_MODEL_PATH') or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'intent_model.json'
+)
+# Predictions at or above this probability skip the LLM analyzer. The default (above 1.0) is shadow
+# mode: every request still goes to the LLM and only agreement is measured, because the shipped model
+# is fit on the seed set alone. Turn skipping on (e.g. 0.85) once the model has been retrained on
+# INTENT_SAMPLE_LOG data and train_intent_classifier.py --threshold reports acceptable accuracy there
+INTENT_CONFIDENCE_THRESHOLD = float(os.environ.get('INTENT_CONFIDENCE_THRESHOLD', '1.01'))
+# Share of skipped requests still sent to the LLM in the background to measure misclassifications
+INTENT_AUDIT_RATE = float(os.environ.get('INTENT_AUDIT_RATE', '0.05'))
+INTENT_SAMPLE_LOG = os.environ.get('INTENT_SAMPLE_LOG', '')
+FEATURE_BUCKETS = 4096
+
+INTENT_DECISIONS = Counter(
+    'intent_classifier_decisions_total',
+    'Local intent predictions by label and whether the LLM analyzer was skipped',
+    ['label', 'decision']
+)
+INTENT_AGREEMENT = Counter(
+    'intent_classifier_llm_agreement_total',
+    'Local vs LLM labels for requests seen by both (local != llm is a misclassification)',
+    ['local', 'llm', 'skipped']
+)
+
+WORD_RE = re.compile(r"[a-z0-9']+")
+
+RULES = {
+    "modify_verb": re.compile(
+        r"\b(change|make|update|fix|modify|edit|rename|replace|remove|delete|move|tweak|adjust|increase|decrease|"
+        r"align|center|resize|swap|correct|refactor|convert|hide|show)\b"
+    ),
+    "generate_verb": re.compile(r"\b(add|create|new|build|generate|implement|integrate|introduce|set up|setup|include)\b"),
+    "style_target": re.compile(
+        r"\b(color|colour|font|size|padding|margin|spacing|background|border|layout|style|css|responsive|mobile|dark mode)\b"
+    ),
+    "feature_noun": re.compile(
+        r"\b(page|form|section|feature|endpoint|api|component|modal|login|signup|auth|payment|search|dashboard|chart)\b"
+    ),
+    "question": re.compile(r"^(what|why|how|when|where|which|who|is|are|does|do|can|could|should|would)\b|\?\s*$"),
+    "explain": re.compile(r"\b(explain|difference|meaning|recommend|best practice|opinion|thoughts|suggest)\b"),
+    "vague": re.compile(r"^\W*(help|do it|something|anything|improve( it)?|make it better|fix it|better|hmm+|idk|ok|okay)\W*$"),
+    "greeting": re.compile(r"^\W*(hi|hello|hey|thanks|thank you|cool|great|nice)\b"),
+    "file_reference": re.compile(r"\b[\w/-]+\.(jsx?|tsx?|css|html|py|json|vue)\b"),
+    "quoted_value": re.compile(r"(['\"]).+?\1|#[0-9a-f]{3,6}\b|\b\d+(px|rem|em|%)"),
+}
+
+
+class IntentPrediction(NamedTuple):
+    label: str
+    confidence: float
+    probabilities: Dict[str, float]
+
+    @property
+    def confident(self) -> bool:
+        return self.confidence >= INTENT_CONFIDENCE_THRESHOLD
+
+
+def bucket(feature: str) -> int:
+    """Stable feature hash (Python's hash() is salted per process)"""
+    return zlib.crc32(feature.encode()) % FEATURE_BUCKETS
+
+
+def extract_features(message: str) -> List[str]:
+    text = message.lower().strip()
+    words = WORD_RE.findall(text)
+    features = [f"w:{word}" for word in words]
+    features += [f"b:{first}_{second}" for first, second in zip(words, words[1:])]
+    if words:
+        features.append(f"first:{words[0]}")
+    features.append(f"len:{min(len(words), 12) // 3}")
+    features += [f"r:{name}" for name, rule in RULES.items() if rule.search(text)]
+    return features
+
+
+class IntentClassifier:
+    """Multinomial logistic regression over hashed features; disabled until a model is loaded"""
+
+    def __init__(self, model_path: Optional[str] = INTENT_MODEL_PATH):
+        self.labels = INTENT_LABELS
+        self.weights: Optional[Dict[str, Dict[int, float]]] = None
+        self.bias: Dict[str, float] = {}
+        if model_path:
+            self.load(model_path)
+        sample_logger.propagate = False
+        if INTENT_SAMPLE_LOG and not sample_logger.handlers:
+            handler = logging.FileHandler(INTENT_SAMPLE_LOG)
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            sample_logger.addHandler(handler)
+            sample_logger.setLevel(logging.INFO)
+
+    def load(self, model_path: str):
+        try:
+            with open(model_path) as f:
+                model = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Intent model not loaded from {model_path}, every request goes to the LLM: {e}")
+            return
+        self.labels = model["labels"]
+        self.weights = {
+            label: {int(index): weight for index, weight in weights.items()}
+            for label, weights in model["weights"].items()
+        }
+        self.bias = model["bias"]
+
+    def predict(self, message: str) -> IntentPrediction:
+        if self.weights is None:
+            return IntentPrediction("general", 0.0, {})
+        indexes = [bucket(feature) for feature in extract_features(message)]
+        scores = {}
+        for label in self.labels:
+            weights = self.weights[label]
+            scores[label] = self.bias.get(label, 0.0) + sum(weights.get(index, 0.0) for index in indexes)
+        top = max(scores.values())
+        exps = {label: math.exp(score - top) for label, score in scores.items()}
+        total = sum(exps.values())
+        probabilities = {label: value / total for label, value in exps.items()}
+        label = max(probabilities, key=probabilities.get)
+        return IntentPrediction(label, probabilities[label], probabilities)
+
+    @staticmethod
+    def record_decision(prediction: IntentPrediction, skipped: bool):
+        INTENT_DECISIONS.labels(prediction.label, 'skipped_llm' if skipped else 'deferred').inc()
+
+    @staticmethod
+    def record_llm_label(message: str, prediction: IntentPrediction, llm_label: str, skipped: bool):
+        """Compare with the LLM's label and log the pair as a training sample"""
+        if llm_label not in INTENT_LABELS:
+            return
+        INTENT_AGREEMENT.labels(prediction.label, llm_label, str(skipped).lower()).inc()
+        if prediction.label != llm_label and skipped:
+            logger.info(f"Intent misclassified as {prediction.label} ({prediction.confidence:.2f}), LLM said {llm_label}")
+        sample_logger.info(json.dumps({"message": message, "label": llm_label}))
@@ -5,47 +5,15 @@ import asyncio
 from typing import Dict, List, Optional
 from datetime import datetime
 import json
+import random
+import time
 from model_router import get_model_router
 from file_system_manager import get_file_system_manager
-
-class ConversationContext:
-    """Manages conversation context for iterative development"""
-    
-    def __init__(self, project_id: str, user_id: str):
-        self.project_id = project_id
-        self.user_id = user_id
-        self.messages: List[Dict] = []
-        self.project_state: Dict = {}
-        self.file_history: List[Dict] = []
-        self.created_at = datetime.utcnow()
-    
-    def add_message(self, role: str, content: str, metadata: Optional[Dict] = None):
-        """Add a message to conversation history"""
-        message = {
-            "role": role,
-            "content": content,
-            "timestamp": datetime.utcnow().isoformat(),
-            "metadata": metadata or {}
-        }
-        self.messages.append(message)
-    
-    def get_context_summary(self, last_n: int = 10) -> str:
-        """Get summary of recent conversation"""
-        recent = self.messages[-last_n:]
-        summary = []
-        
-        for msg in recent:
-            role = msg["role"]
-            content = msg["content"][:200]  # Truncate long messages
-            summary.append(f"{role}: {content}")
-        
-        return "\n".join(summary)
-    
-    def update_project_state(self, state: Dict):
-        """Update current project state"""
-        self.project_state.update(state)
-        self.project_state["updated_at"] = datetime.utcnow().isoformat()
-
+from file_retrieval import FileRetriever, IC_RETRIEVAL_TOP_K
+from code_patch import EDIT_PROTOCOL_INSTRUCTIONS, apply_edit_response, record_edit
+from conversation_store import ConversationContext, ConversationStore
+from intent_classifier import INTENT_AUDIT_RATE, IntentClassifier, IntentPrediction
+from redis_cache import cache
 
 class IterativeChatManager:
     """
@@ -56,16 +24,14 @@ class IterativeChatManager:
     def __init__(self):
         self.router = get_model_router()
         self.fs_manager = get_file_system_manager()
-        self.contexts: Dict[str, ConversationContext] = {}
+        self.contexts = ConversationStore(cache.redis)
+        self.retriever = FileRetriever(self.fs_manager.content_index, self._detect_file_type)
+        self.intent_classifier = IntentClassifier()
+        self._audit_tasks = set()
     
-    def get_or_create_context(self, project_id: str, user_id: str) -> ConversationContext:
+    async def get_or_create_context(self, project_id: str, user_id: str) -> ConversationContext:
         """Get or create conversation context for a project"""
-        key = f"{user_id}_{project_id}"
-        
-        if key not in self.contexts:
-            self.contexts[key] = ConversationContext(project_id, user_id)
-        
-        return self.contexts[key]
+        return await self.contexts.load(project_id, user_id)
     
     async def process_iterative_request(
         self,
@@ -85,11 +51,25 @@ class IterativeChatManager:
         
         The system understands context and makes precise changes.
         """
-        context = self.get_or_create_context(project_id, user_id)
+        context = await self.get_or_create_context(project_id, user_id)
         
         # Add user message to context
         context.add_message("user", message)
         
+        try:
+            return await self._process(project_id, user_id, message, db, context)
+        finally:
+            await self.contexts.save(context)
+    
+    async def _process(
+        self,
+        project_id: str,
+        user_id: str,
+        message: str,
+        db,
+        context: ConversationContext
+    ) -> Dict:
+        """Handle one request against the loaded context (saved by the caller)"""
         try:
             # Get project from database
             project = await db.projects.find_one({"id": project_id, "user_id": user_id})
@@ -99,19 +79,21 @@ class IterativeChatManager:
                     "message": "Project not found"
                 }
             
-            # Get current project files
-            files = await self._get_project_files(project_id, user_id)
+            # Rank project files against the request; only the top ones are loaded
+            ranked = await self._rank_project_files(project_id, user_id, message, context)
+            relevant = [item["path"] for item in ranked[:IC_RETRIEVAL_TOP_K]]
+            files = self.retriever.pack(ranked, message)
             
             # Update context with current state
             context.update_project_state({
-                "files": list(files.keys()),
-                "file_count": len(files),
-                "has_frontend": any("frontend" in f for f in files.keys()),
-                "has_backend": any("backend" in f for f in files.keys())
+                "files": relevant,
+                "file_count": len(ranked),
+                "has_frontend": any("frontend" in item["path"] for item in ranked),
+                "has_backend": any("backend" in item["path"] for item in ranked)
             })
             
             # Analyze the request and determine action
-            action = await self._analyze_request(message, context, files)
+            action = await self._analyze_request(message, context, ranked)
             
             if action["type"] == "modify_files":
                 # Modify specific files
@@ -119,8 +101,8 @@ class IterativeChatManager:
                     project_id,
                     user_id,
                     message,
-                    action["files_to_modify"],
-                    files,
+                    action.get("files_to_modify", []),
+                    {item["path"] for item in ranked},
                     context
                 )
                 
@@ -183,34 +165,27 @@ class IterativeChatManager:
                 "message": error_msg
             }
     
-    async def _get_project_files(self, project_id: str, user_id: str) -> Dict[str, str]:
-        """Get all current project files"""
-        files = {}
-        
-        # Get file tree
-        tree_result = await self.fs_manager.get_file_tree(user_id, project_id)
-        
-        if tree_result["status"] == "success":
-            # Recursively collect all files
-            async def collect_files(node, current_path=""):
-                if node["type"] == "file":
-                    file_path = node["path"]
-                    file_result = await self.fs_manager.read_file(user_id, project_id, file_path)
-                    if file_result["status"] == "success":
-                        files[file_path] = file_result["content"]
-                elif node["type"] == "directory" and "children" in node:
-                    for child in node["children"]:
-                        await collect_files(child, current_path)
-            
-            await collect_files(tree_result["tree"])
-        
-        return files
+    async def _rank_project_files(
+        self,
+        project_id: str,
+        user_id: str,
+        message: str,
+        context: ConversationContext
+    ) -> List[Dict]:
+        """
+        All project files scored against the request (best first), from the
+        workspace indexes instead of reading every file
+        """
+        tree_index = await self.fs_manager.get_tree_index(user_id, project_id)
+        if tree_index is None:
+            return []
+        return await self.retriever.rank(tree_index, message, context.file_history)
     
     async def _analyze_request(
         self,
         message: str,
         context: ConversationContext,
-        files: Dict[str, str]
+        ranked: List[Dict]
     ) -> Dict:
         """
         Analyze user request to determine action type.
@@ -221,7 +196,77 @@ class IterativeChatManager:
                 "files_to_modify": List[str],
                 "confidence": float
             }
+        
+        A local classifier answers first; the LLM analyzer only runs when it
+        is not confident (or no file matches a modify request). With the
+        default threshold (shadow mode) the LLM always runs and the local
+        label is only compared against it.
         """
+        prediction = self.intent_classifier.predict(message)
+        targets = self._likely_targets(ranked)
+        if prediction.confident and (prediction.label != "modify_files" or targets):
+            self.intent_classifier.record_decision(prediction, skipped=True)
+            if random.random() < INTENT_AUDIT_RATE:
+                self._audit_prediction(message, context, ranked, prediction)
+            analysis = {
+                "type": prediction.label,
+                "reasoning": "local intent classifier",
+                "confidence": round(prediction.confidence, 3)
+            }
+            if prediction.label == "modify_files":
+                analysis["files_to_modify"] = targets
+            return analysis
+        
+        self.intent_classifier.record_decision(prediction, skipped=False)
+        analysis = await self._classify_with_llm(message, context, ranked)
+        if analysis:
+            self.intent_classifier.record_llm_label(message, prediction, analysis.get("type"), skipped=False)
+            return analysis
+        
+        # Fallback to simple keyword matching
+        message_lower = message.lower()
+        
+        if any(word in message_lower for word in ["change", "modify", "update", "fix", "make", "edit"]):
+            return {
+                "type": "modify_files",
+                "files_to_modify": targets,
+                "confidence": 0.5
+            }
+        elif any(word in message_lower for word in ["add", "create", "new", "generate"]):
+            return {
+                "type": "generate_new",
+                "confidence": 0.5
+            }
+        else:
+            return {
+                "type": "general",
+                "confidence": 0.3
+            }
+    
+    def _audit_prediction(
+        self,
+        message: str,
+        context: ConversationContext,
+        ranked: List[Dict],
+        prediction: IntentPrediction
+    ):
+        """Classify a skipped request with the LLM in the background to measure misclassifications"""
+        async def audit():
+            analysis = await self._classify_with_llm(message, context, ranked)
+            if analysis:
+                self.intent_classifier.record_llm_label(message, prediction, analysis.get("type"), skipped=True)
+        
+        task = asyncio.get_running_loop().create_task(audit())
+        self._audit_tasks.add(task)
+        task.add_done_callback(self._audit_tasks.discard)
+    
+    async def _classify_with_llm(
+        self,
+        message: str,
+        context: ConversationContext,
+        ranked: List[Dict]
+    ) -> Optional[Dict]:
+        """LLM classification, or None if the call or its JSON failed"""
         # Use Gemini for analysis (good at understanding context)
         system_message = """You are an expert at understanding developer requests.
 Analyze the user's message and determine what they want to do.
@@ -241,18 +286,19 @@ Types:
 - general: General question/discussion"""
 
         conversation_summary = context.get_context_summary()
-        available_files = "\n".join(files.keys())
+        candidates = ranked[:IC_RETRIEVAL_TOP_K]
+        available_files = "\n".join(f"{item['path']} ({item['type']})" for item in candidates)
         
         prompt = f"""User request: "{message}"
 
 Recent conversation:
 {conversation_summary}
 
-Available files:
+Most relevant files (best match first, {len(candidates)} of {len(ranked)}):
 {available_files}
 
 Project state:
-- Files: {len(files)}
+- Files: {len(ranked)}
 - Frontend: {context.project_state.get('has_frontend', False)}
 - Backend: {context.project_state.get('has_backend', False)}
 
@@ -271,30 +317,22 @@ Analyze this request and classify it."""
             json_match = re.search(r'\{.*\}', response, re.DOTALL)
             if json_match:
                 analysis = json.loads(json_match.group())
+                if analysis.get("type") == "modify_files" and not analysis.get("files_to_modify"):
+                    analysis["files_to_modify"] = self._likely_targets(ranked)
                 return analysis
         
         except Exception as e:
             print(f"Analysis failed: {e}")
         
-        # Fallback to simple keyword matching
-        message_lower = message.lower()
-        
-        if any(word in message_lower for word in ["change", "modify", "update", "fix", "make", "edit"]):
-            return {
-                "type": "modify_files",
-                "files_to_modify": list(files.keys())[:3],  # Guess first 3 files
-                "confidence": 0.5
-            }
-        elif any(word in message_lower for word in ["add", "create", "new", "generate"]):
-            return {
-                "type": "generate_new",
-                "confidence": 0.5
-            }
-        else:
-            return {
-                "type": "general",
-                "confidence": 0.3
-            }
+        return None
+    
+    @staticmethod
+    def _likely_targets(ranked: List[Dict], limit: int = 3) -> List[str]:
+        """Best-ranked text files with a positive score"""
+        return [
+            item["path"] for item in ranked
+            if item["score"] > 0 and item["text"] is not None
+        ][:limit]
     
     async def _modify_files(
         self,
@@ -302,20 +340,27 @@ Analyze this request and classify it."""
         user_id: str,
         request: str,
         files_to_modify: List[str],
-        current_files: Dict[str, str],
+        existing_paths: set,
         context: ConversationContext
     ) -> Dict:
         """
         Modify specific files based on user request.
         Uses Claude Sonnet 4 for code modifications.
+        Only the files being modified are read in full. The model returns
+        SEARCH/REPLACE edits; the whole file is regenerated only when the
+        edits do not apply cleanly.
         """
         changes = []
         
         for file_path in files_to_modify:
-            if file_path not in current_files:
+            if file_path not in existing_paths:
+                continue
+            
+            file_result = await self.fs_manager.read_file(user_id, project_id, file_path)
+            if file_result["status"] != "success" or file_result.get("encoding") != "utf-8":
                 continue
             
-            current_content = current_files[file_path]
+            current_content = file_result["content"]
             file_type = self._detect_file_type(file_path)
             
             # Use appropriate model based on file type
@@ -326,6 +371,17 @@ Analyze this request and classify it."""
             else:
                 task_type = "content"   # Gemini
             
+            edit_system_message = f"""You are an expert developer. Modify the given file based on the user's request.
+
+CRITICAL RULES:
+1. Preserve all existing functionality unless specifically asked to change
+2. Maintain code style and formatting
+3. Ensure the changes are minimal and focused
+
+{EDIT_PROTOCOL_INSTRUCTIONS}
+
+Current file: {file_path}"""
+
             system_message = f"""You are an expert developer. Modify the given file based on the user's request.
 
 CRITICAL RULES:
@@ -339,7 +395,7 @@ Current file: {file_path}"""
 
             conversation_context = context.get_context_summary(last_n=5)
             
-            prompt = f"""User request: "{request}"
+            file_prompt = f"""User request: "{request}"
 
 Recent context:
 {conversation_context}
@@ -348,21 +404,38 @@ Current file content:
 ```
 {current_content}
 ```
-
-Modify this file to fulfill the user's request. Return the complete modified file."""
+"""
 
             try:
-                modified_content = await self.router.generate_completion(
+                started = time.perf_counter()
+                response = await self.router.generate_completion(
                     task_type=task_type,
-                    prompt=prompt,
-                    system_message=system_message,
+                    prompt=file_prompt + "\nReturn the SEARCH/REPLACE blocks that fulfill the user's request.",
+                    system_message=edit_system_message,
                     session_id=f"modify_{project_id}_{datetime.utcnow().timestamp()}"
                 )
+                edit = apply_edit_response(current_content, response, file_path)
+                record_edit("iterative_chat", edit.mode, response, time.perf_counter() - started)
+                edit_mode = edit.mode
+                modified_content = edit.content
                 
-                # Clean up response (remove markdown code blocks)
-                import re
-                modified_content = re.sub(r'^```[a-z]*\n', '', modified_content, flags=re.MULTILINE)
-                modified_content = re.sub(r'\n```$', '', modified_content, flags=re.MULTILINE)
+                if modified_content is None:
+                    # Fall back to regenerating the whole file
+                    print(f"Patch for {file_path} failed ({edit.error}), regenerating the file")
+                    started = time.perf_counter()
+                    modified_content = await self.router.generate_completion(
+                        task_type=task_type,
+                        prompt=file_prompt + "\nModify this file to fulfill the user's request. Return the complete modified file.",
+                        system_message=system_message,
+                        session_id=f"modify_{project_id}_{datetime.utcnow().timestamp()}"
+                    )
+                    record_edit("iterative_chat", "fallback", modified_content, time.perf_counter() - started)
+                    edit_mode = "fallback"
+                    
+                    # Clean up response (remove markdown code blocks)
+                    import re
+                    modified_content = re.sub(r'^```[a-z]*\n', '', modified_content, flags=re.MULTILINE)
+                    modified_content = re.sub(r'\n```$', '', modified_content, flags=re.MULTILINE)
                 
                 # Write modified file
                 write_result = await self.fs_manager.write_file(
@@ -376,11 +449,12 @@ Modify this file to fulfill the user's request. Return the complete modified fil
                     changes.append({
                         "file": file_path,
                         "action": "modified",
-                        "size": write_result.get("size", 0)
+                        "size": write_result.get("size", 0),
+                        "edit_mode": edit_mode
                     })
                     
                     # Track in history
-                    context.file_history.append({
+                    context.add_file_change({
                         "file": file_path,
                         "action": "modified",
                         "timestamp": datetime.utcnow().isoformat(),
@@ -416,10 +490,10 @@ Modify this file to fulfill the user's request. Return the complete modified fil
         project_id: str,
         user_id: str,
         request: str,
-        existing_files: Dict[str, str],
+        relevant_files: Dict[str, str],
         context: ConversationContext
     ) -> Dict:
-        """Generate new files/features"""
+        """Generate new files/features; relevant_files is the packed retrieval context"""
         # Use appropriate agent based on request
         # For now, simplified implementation
         
@@ -434,7 +508,10 @@ Return file paths and their contents as JSON:
   "description": "What was created"
 }"""
 
-        existing_structure = "\n".join(existing_files.keys())
+        existing_structure = "\n".join(context.project_state.get("files", []))
+        relevant_code = "\n\n".join(
+            f"--- {path} ---\n{content}" for path, content in relevant_files.items()
+        )
         conversation_context = context.get_context_summary(last_n=5)
         
         prompt = f"""User request: "{request}"
@@ -442,9 +519,12 @@ Return file paths and their contents as JSON:
 Recent context:
 {conversation_context}
 
-Existing project structure:
+Most relevant existing files ({context.project_state.get('file_count', 0)} in project):
 {existing_structure}
 
+Relevant existing code:
+{relevant_code}
+
 Generate new files to fulfill this request. Return as JSON."""
 
         try:
@@ -552,14 +632,11 @@ Respond helpfully."""
     
     async def get_conversation_history(self, project_id: str, user_id: str) -> List[Dict]:
         """Get full conversation history"""
-        context = self.get_or_create_context(project_id, user_id)
-        return context.messages
+        return await self.contexts.history(project_id, user_id)
     
     async def clear_context(self, project_id: str, user_id: str):
         """Clear conversation context"""
-        key = f"{user_id}_{project_id}"
-        if key in self.contexts:
-            del self.contexts[key]
+        await self.contexts.delete(project_id, user_id)
 
 
 # Singleton instance
@@ -0,0 +1,160 @@
+# Credit Ledger Partition Management
+# Creates monthly partitions of credit_transactions ahead of time and
+# detaches partitions that fall outside the retention window
+
+from sqlalchemy import text
+from datetime import date, datetime, timezone
+from typing import List, Optional
+import asyncio
+import os
+import re
+
+PARENT_TABLE = "credit_transactions"
+DEFAULT_PARTITION = f"{PARENT_TABLE}_default"
+
+# Partitions to keep created ahead of the current month
+LEDGER_PARTITION_MONTHS_AHEAD = int(os.environ.get('LEDGER_PARTITION_MONTHS_AHEAD', '3'))
+# Months of history kept attached; 0 keeps everything
+LEDGER_RETENTION_MONTHS = int(os.environ.get('LEDGER_RETENTION_MONTHS', '0'))
+
+_PARTITION_NAME = re.compile(rf"^{PARENT_TABLE}_y(\d{{4}})m(\d{{2}})$")
+
+
+def month_start(value: datetime) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + (month.month - 1) + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{PARENT_TABLE}_y{month.year:04d}m{month.month:02d}"
+
+
+async def is_partitioned(conn) -> bool:
+    """True when credit_transactions is a declaratively partitioned table"""
+    # relkind is a "char", which asyncpg returns as bytes; compare it as text.
+    # to_regclass resolves the name through search_path like the DDL below does
+    result = await conn.execute(text(
+        "SELECT relkind::text FROM pg_class WHERE oid = to_regclass(:name)"
+    ), {'name': PARENT_TABLE})
+    return result.scalar() == 'p'
+
+
+async def list_partitions(conn) -> List[str]:
+    result = await conn.execute(text("""
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE pg_inherits.inhparent = to_regclass(:name)
+        ORDER BY child.relname
+    """), {'name': PARENT_TABLE})
+    return [row[0] for row in result]
+
+
+async def create_month_partition(conn, month: date) -> str:
+    """Create the partition for one month (no-op if it already exists)"""
+    name = partition_name(month)
+    await conn.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {PARENT_TABLE} "
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+    ))
+    return name
+
+
+async def ensure_partitions(conn, months_ahead: int = LEDGER_PARTITION_MONTHS_AHEAD, start: Optional[date] = None) -> List[str]:
+    """
+    Make sure partitions exist from `start` (default: this month) through
+    `months_ahead` months in the future, plus a DEFAULT partition that
+    catches rows outside every range (e.g. imported history).
+    """
+    current = month_start(datetime.now(timezone.utc))
+    month = start or current
+    created = []
+    while month <= add_months(current, months_ahead):
+        created.append(await create_month_partition(conn, month))
+        month = add_months(month, 1)
+    await conn.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF {PARENT_TABLE} DEFAULT"
+    ))
+    return created
+
+
+async def detach_old_partitions(conn, retain_months: int = LEDGER_RETENTION_MONTHS) -> List[str]:
+    """
+    Detach monthly partitions older than the retention window.
+
+    Detached partitions stay in the database as ordinary tables so they can be
+    archived or dropped separately.
+    """
+    if retain_months <= 0:
+        return []
+    cutoff = add_months(month_start(datetime.now(timezone.utc)), -retain_months)
+    detached = []
+    for name in await list_partitions(conn):
+        match = _PARTITION_NAME.match(name)
+        if not match:
+            continue
+        month = date(int(match.group(1)), int(match.group(2)), 1)
+        if month < cutoff:
+            await conn.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}"))
+            detached.append(name)
+    return detached
+
+
+async def manage_partitions(engine) -> dict:
+    """Create upcoming partitions and detach expired ones (safe to run repeatedly)"""
+    async with engine.begin() as conn:
+        if not await is_partitioned(conn):
+            print(f"⚠️  {PARENT_TABLE} is not partitioned - run ledger_partitions.py --convert")
+            return {'status': 'skipped', 'reason': 'not_partitioned'}
+        created = await ensure_partitions(conn)
+        detached = await detach_old_partitions(conn)
+    return {'status': 'success', 'ensured': created, 'detached': detached}
+
+
+async def convert_to_partitioned(engine):
+    """
+    One-off conversion of an existing unpartitioned ledger.
+
+    Renames the old table, creates the partitioned table with monthly
+    partitions covering all existing rows, copies the data and drops the old
+    table, all in one transaction.
+    """
+    from database import Base, CreditTransaction
+
+    async with engine.begin() as conn:
+        if await is_partitioned(conn):
+            print(f"✅ {PARENT_TABLE} is already partitioned")
+            return
+
+        legacy = f"{PARENT_TABLE}_legacy"
+        await conn.execute(text(f"ALTER TABLE {PARENT_TABLE} RENAME TO {legacy}"))
+        # Free the old index names so the new table can reuse them
+        for index in ('ix_credit_transactions_user_id', 'ix_credit_transactions_transaction_type',
+                      'ix_credit_transactions_status', 'ix_credit_transactions_created_at'):
+            await conn.execute(text(f"DROP INDEX IF EXISTS {index}"))
+
+        await conn.run_sync(
+            lambda sync_conn: Base.metadata.create_all(sync_conn, tables=[CreditTransaction.__table__])
+        )
+
+        oldest = (await conn.execute(text(f"SELECT MIN(created_at) FROM {legacy}"))).scalar()
+        start = month_start(oldest) if oldest else None
+        await ensure_partitions(conn, start=start)
+
+        await conn.execute(text(f"INSERT INTO {PARENT_TABLE} SELECT * FROM {legacy}"))
+        await conn.execute(text(f"DROP TABLE {legacy}"))
+    print(f"✅ Converted {PARENT_TABLE} to monthly partitions")
+
+
+if __name__ == "__main__":
+    import sys
+    from database import engine
+
+    if '--convert' in sys.argv:
+        asyncio.run(convert_to_partitioned(engine))
+    else:
+        print(asyncio.run(manage_partitions(engine)))
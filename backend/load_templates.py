@@ -4,6 +4,7 @@ import asyncio
 import os
 from motor.motor_asyncio import AsyncIOMotorClient
 from template_data import TEMPLATES, COMPONENTS
+from catalog_cache import bump_catalog_version
 
 async def load_templates():
     """Load all templates into MongoDB"""
@@ -38,6 +39,9 @@ async def load_templates():
     
     print("✅ Indexes created")
     
+    # Served catalogs are rebuilt on every process
+    await bump_catalog_version("templates", "components")
+    
     # List loaded templates
     print("\n📋 Loaded Templates:")
     templates = await db.templates.find({}, {"template_id": 1, "name": 1, "category": 1}).to_list(length=None)
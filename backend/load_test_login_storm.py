@@ -0,0 +1,118 @@
+# Load Test: Login Storm
+# Measures latency of an unrelated endpoint while a burst of logins hits the
+# server, to check bcrypt no longer stalls the event loop
+
+import argparse
+import asyncio
+import httpx
+import statistics
+import time
+import uuid
+from collections import Counter
+
+BASE_URL = "http://localhost:8001"
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    if not samples:
+        return {'p50': 0.0, 'p95': 0.0, 'p99': 0.0, 'max': 0.0}
+    return {
+        'p50': statistics.median(samples),
+        'p95': samples[max(int(len(samples) * 0.95) - 1, 0)],
+        'p99': samples[max(int(len(samples) * 0.99) - 1, 0)],
+        'max': samples[-1],
+    }
+
+
+async def probe(client: httpx.AsyncClient, path: str, stop: asyncio.Event, interval: float):
+    """Hit `path` repeatedly until stopped; returns latencies in ms"""
+    latencies = []
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            await client.get(f"{BASE_URL}{path}")
+        except httpx.HTTPError:
+            pass
+        latencies.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(interval)
+    return latencies
+
+
+async def login_storm(client: httpx.AsyncClient, email: str, password: str, total: int, concurrency: int):
+    """Fire `total` logins with at most `concurrency` in flight; returns status counts"""
+    statuses = Counter()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            try:
+                response = await client.post(f"{BASE_URL}/api/auth/login",
+                                             json={"email": email, "password": password})
+                statuses[response.status_code] += 1
+            except httpx.HTTPError:
+                statuses['error'] += 1
+
+    await asyncio.gather(*(one() for _ in range(total)))
+    return statuses
+
+
+async def measure(client, path: str, seconds: float, interval: float, storm=None):
+    stop = asyncio.Event()
+    probe_task = asyncio.create_task(probe(client, path, stop, interval))
+    statuses = None
+    start = time.perf_counter()
+    if storm:
+        statuses = await storm
+    remaining = seconds - (time.perf_counter() - start)
+    if remaining > 0:
+        await asyncio.sleep(remaining)
+    stop.set()
+    return await probe_task, statuses
+
+
+async def main():
+    global BASE_URL
+    parser = argparse.ArgumentParser(description="Probe endpoint latency during a login storm")
+    parser.add_argument('--base-url', default=BASE_URL)
+    parser.add_argument('--probe-path', default="/api/health")
+    parser.add_argument('--logins', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--seconds', type=float, default=10.0, help="Duration of each phase")
+    parser.add_argument('--interval', type=float, default=0.02, help="Delay between probe requests")
+    args = parser.parse_args()
+    BASE_URL = args.base_url
+
+    email = f"loadtest-{uuid.uuid4().hex[:8]}@example.com"
+    password = "LoadTest!12345"
+
+    limits = httpx.Limits(max_connections=args.concurrency + 10)
+    async with httpx.AsyncClient(timeout=60.0, limits=limits) as client:
+        response = await client.post(f"{BASE_URL}/api/auth/register", json={
+            "username": "loadtest", "email": email, "password": password
+        })
+        if response.status_code != 200:
+            print(f"❌ Could not register load test user: {response.status_code} {response.text}")
+            return
+
+        print(f"📏 Baseline: probing {args.probe_path} for {args.seconds:.0f}s...")
+        baseline, _ = await measure(client, args.probe_path, args.seconds, args.interval)
+
+        print(f"🌪️  Storm: {args.logins} logins ({args.concurrency} concurrent) while probing...")
+        during, statuses = await measure(
+            client, args.probe_path, args.seconds, args.interval,
+            storm=login_storm(client, email, password, args.logins, args.concurrency)
+        )
+
+    print("\n" + "=" * 64)
+    print(f"{'Phase':<12} {'requests':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    print("=" * 64)
+    for name, samples in (("baseline", baseline), ("storm", during)):
+        p = percentiles(samples)
+        print(f"{name:<12} {len(samples):>9} {p['p50']:>9.1f} {p['p95']:>9.1f} {p['p99']:>9.1f} {p['max']:>9.1f}")
+    print("=" * 64)
+    print(f"Login responses: {dict(statuses)} (429 = hashing pool saturated, shed by design)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
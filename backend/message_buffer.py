@@ -0,0 +1,155 @@
+# Message Write-Behind Buffer
+# Batches chat/project message writes per project (insert_many or one
+# multi-row INSERT) instead of one insert and commit per message
+
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger(__name__)
+
+class MongoMessageSink:
+    """Writes buffered message documents with one insert_many per batch"""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def write(self, rows: List[Dict]):
+        try:
+            await self.collection.insert_many(rows, ordered=False)
+        except BulkWriteError as e:
+            # A retried batch keeps the _ids insert_many assigned on the first
+            # attempt, so rows that already landed show up as duplicate keys
+            if any(error.get('code') != 11000 for error in e.details.get('writeErrors', [])):
+                raise
+        # insert_many adds _id to each dict - drop it so callers can still return them
+        for row in rows:
+            row.pop('_id', None)
+
+
+class PostgresMessageSink:
+    """Writes buffered ProjectMessage rows with one multi-row INSERT per batch"""
+
+    def __init__(self, session_factory=None):
+        self.session_factory = session_factory
+
+    async def write(self, rows: List[Dict]):
+        from db_helpers import create_messages
+        if self.session_factory is None:
+            from database import AsyncSessionLocal
+            self.session_factory = AsyncSessionLocal
+        async with self.session_factory() as session:
+            await create_messages(session, rows)
+
+
+class MessageWriteBuffer:
+    """
+    Async write-behind buffer for project messages.
+
+    Rows are collected per project and written in one batch when the project
+    reaches `max_batch` rows, when `flush_interval` elapses, or when a
+    terminal message arrives. A failed batch goes back to the front of the
+    queue and is retried on the next flush, up to `max_retries` times.
+    Terminal messages are written synchronously: their write errors reach the
+    caller. Call close() on shutdown to drain everything.
+    """
+
+    def __init__(self, sink, max_batch: int = 50, flush_interval: float = 1.0, max_retries: int = 5):
+        self.sink = sink
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.pending: Dict[str, List[Dict]] = {}
+        self.failures: Dict[str, int] = {}  # project_id -> consecutive failed flushes
+        self._lock = asyncio.Lock()
+        self._flusher: Optional[asyncio.Task] = None
+        self._closed = False
+
+    async def add(self, project_id: str, row: Dict, terminal: bool = False):
+        """Queue a message row; flushes the project's batch when full, writes terminal rows synchronously"""
+        if terminal or self._closed:
+            await self.write_now(project_id, row)
+            return
+
+        self._ensure_flusher()
+        self.pending.setdefault(project_id, []).append(row)
+
+        if len(self.pending[project_id]) >= self.max_batch:
+            await self.flush(project_id)
+
+    async def write_now(self, project_id: str, row: Dict):
+        """Write a row together with the project's pending rows; raises if the write fails"""
+        async with self._lock:
+            rows = self.pending.pop(project_id, [])
+            try:
+                await self.sink.write(rows + [row])
+            except Exception:
+                # The pending rows get another try; the caller handles its own row
+                self._requeue(project_id, rows)
+                raise
+            self.failures.pop(project_id, None)
+
+    async def flush(self, project_id: Optional[str] = None):
+        """Write pending rows for one project, or for all projects"""
+        async with self._lock:
+            if project_id is not None:
+                batches = {project_id: self.pending.pop(project_id, [])}
+            else:
+                batches = dict(self.pending)
+                self.pending.clear()
+
+            for batch_project_id, rows in batches.items():
+                if not rows:
+                    continue
+                try:
+                    await self.sink.write(rows)
+                    self.failures.pop(batch_project_id, None)
+                except Exception as e:
+                    logger.error(f"Message batch write failed ({len(rows)} rows), will retry: {e}")
+                    self._requeue(batch_project_id, rows)
+
+    def _requeue(self, project_id: str, rows: List[Dict]):
+        """Put a failed batch back ahead of newer rows, giving up after max_retries"""
+        if not rows:
+            return
+        failures = self.failures.get(project_id, 0) + 1
+        if failures > self.max_retries:
+            logger.error(f"Dropping {len(rows)} messages for project {project_id} after {self.max_retries} retries")
+            self.failures.pop(project_id, None)
+            return
+        self.failures[project_id] = failures
+        self.pending[project_id] = rows + self.pending.get(project_id, [])
+
+    async def close(self):
+        """Stop the periodic flusher and drain all pending rows"""
+        self._closed = True
+        if self._flusher:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        # Failed batches are requeued; give them their remaining retries now
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                await asyncio.sleep(self.flush_interval)
+            await self.flush()
+            if not self.pending:
+                break
+
+    def _ensure_flusher(self):
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.get_running_loop().create_task(self._flush_periodically())
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            if self.pending:
+                await self.flush()
+
+
+# Global instance for the PostgreSQL project_messages table
+project_message_buffer = MessageWriteBuffer(PostgresMessageSink())
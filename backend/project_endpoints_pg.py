@@ -12,8 +12,9 @@ from database import get_db
 from db_helpers import (
     get_user_by_id, get_user_projects, get_project_by_id,
     create_project, update_project, get_project_messages,
-    create_message, project_to_dict, message_to_dict
+    project_to_dict, message_to_dict
 )
+from message_buffer import project_message_buffer
 
 
 class ProjectCreate(BaseModel):
@@ -64,7 +65,7 @@ async def create_project_endpoint(
         'content': f'Project "{project.name}" created',
         'created_at': datetime.now(timezone.utc)
     }
-    await create_message(db, message_dict)
+    await project_message_buffer.add(project.id, message_dict)
     
     return {
         "message": "Project created successfully",
@@ -133,11 +134,18 @@ async def create_project_message_endpoint(
         'created_at': datetime.now(timezone.utc)
     }
     
-    message = await create_message(db, message_dict)
+    # Written together with the project's pending (batched) messages
+    await project_message_buffer.add(project_id, message_dict, terminal=True)
     
     return {
         "success": True,
-        "message": message_to_dict(message)
+        "message": {
+            **message_dict,
+            'agent_type': None,
+            'agent_status': None,
+            'progress': 0,
+            'created_at': message_dict['created_at'].isoformat()
+        }
     }
 
 
@@ -195,7 +203,18 @@ async def delete_project_endpoint(
     # Delete project (cascade will delete messages)
     from sqlalchemy import delete
     from database import Project
-    await db.execute(delete(Project).where(Project.id == project_id))
+    from user_stats import record_project_deleted
+    # RETURNING gives the status at delete time; a concurrent delete returns no row
+    result = await db.execute(
+        delete(Project)
+        .where(Project.id == project_id, Project.user_id == user_id)
+        .returning(Project.status)
+    )
+    deleted = result.first()
+    if deleted is None:
+        await db.rollback()
+        raise HTTPException(status_code=404, detail="Project not found")
+    await record_project_deleted(db, user_id, deleted.status)
     await db.commit()
     
     return {"message": "Project deleted successfully"}
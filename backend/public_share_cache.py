@@ -0,0 +1,80 @@
+# Public Share Cache
+# Shared project pages served from the two-tier cache (in-process LRU + Redis)
+# with ETags and CDN-friendly Cache-Control; invalidated per project
+
+from fastapi import HTTPException, Request, Response
+from catalog_cache import etag_matches
+from redis_cache import cache
+from typing import Dict, Optional
+import hashlib
+import os
+
+PUBLIC_SHARE_TTL = int(os.environ.get('PUBLIC_SHARE_TTL', '3600'))
+# Unknown/revoked tokens are cached briefly so scans of bad links don't reach Mongo
+PUBLIC_SHARE_NEGATIVE_TTL = int(os.environ.get('PUBLIC_SHARE_NEGATIVE_TTL', '10'))
+# Browser/CDN freshness; also bounds how long a revoked page can linger at the edge
+PUBLIC_SHARE_MAX_AGE = int(os.environ.get('PUBLIC_SHARE_MAX_AGE', '60'))
+PUBLIC_SHARE_STALE_WHILE_REVALIDATE = int(os.environ.get('PUBLIC_SHARE_STALE_WHILE_REVALIDATE', '300'))
+
+EMPTY_PAGE = '<h1>No content available</h1>'
+
+
+def public_share_key(share_token: str) -> str:
+    return f"public:share:{share_token}"
+
+
+def project_tag(project_id: str) -> str:
+    return f"project:{project_id}"
+
+
+async def get_public_page(db, share_token: str) -> Optional[Dict]:
+    """Return {'html', 'etag', 'project_id'} for a public share token, or None"""
+
+    async def load():
+        project = await db.projects.find_one(
+            {"share_token": share_token, "is_public": True},
+            {"_id": 0, "id": 1, "generated_code": 1}
+        )
+        if not project:
+            return None
+        html = project.get('generated_code') or EMPTY_PAGE
+        # The ETag doubles as the content version of the cached page
+        return {
+            'html': html,
+            'etag': f'"{hashlib.sha256(html.encode()).hexdigest()[:32]}"',
+            'project_id': project['id'],
+        }
+
+    return await cache.get_or_compute(
+        public_share_key(share_token), load,
+        ttl=PUBLIC_SHARE_TTL, negative_ttl=PUBLIC_SHARE_NEGATIVE_TTL,
+        # Tagged with the project so invalidate_public_project finds every token
+        tags=lambda page: [project_tag(page['project_id'])] if page else None
+    )
+
+
+async def invalidate_public_project(project_id: str):
+    """
+    Call when a project's code changes or its sharing is revoked. Loads of
+    the project's pages already in flight are not stored afterwards (see
+    RedisCache.invalidate_tags), so an old page can't outlive the change.
+    """
+    await cache.invalidate_tags(project_tag(project_id))
+
+
+def public_page_response(request: Request, page: Optional[Dict]) -> Response:
+    if page is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Project not found or not public",
+            headers={"Cache-Control": f"public, max-age={PUBLIC_SHARE_NEGATIVE_TTL}"}
+        )
+
+    headers = {
+        "ETag": page['etag'],
+        "Cache-Control": f"public, max-age={PUBLIC_SHARE_MAX_AGE}, "
+                         f"stale-while-revalidate={PUBLIC_SHARE_STALE_WHILE_REVALIDATE}",
+    }
+    if etag_matches(request.headers.get('if-none-match'), [page['etag']]):
+        return Response(status_code=304, headers=headers)
+    return Response(content=page['html'], media_type="text/html", headers=headers)
@@ -1,58 +1,339 @@
 # Redis Cache Manager
 # Handles caching for templates, components, and user data
+# Two tiers: a small in-process LRU in front of Redis, with get_or_compute
+# for single-flight recomputation, early refresh (XFetch) and negative caching
 
 import redis.asyncio as redis
-import json
-from typing import Optional, Any, List
+from redis.exceptions import RedisError
+from prometheus_client import Counter, Histogram
+from collections import OrderedDict
+from typing import Optional, Any, List, Awaitable, Callable, Dict, Tuple
+import asyncio
+import logging
+import math
+import orjson
 import os
+import random
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Local tier: entries are kept at most this long so other workers' writes show up quickly
+CACHE_LOCAL_TTL = float(os.environ.get('CACHE_LOCAL_TTL', '30'))
+CACHE_LOCAL_MAX_ENTRIES = int(os.environ.get('CACHE_LOCAL_MAX_ENTRIES', '5000'))
+CACHE_EVICT_CHANNEL = "cache:evict"
+# Tag sets outlive their members so invalidation never misses a live key
+CACHE_TAG_TTL = int(os.environ.get('CACHE_TAG_TTL', '86400'))
+# Keys per pipeline round trip for bulk writes
+CACHE_PIPELINE_BATCH = int(os.environ.get('CACHE_PIPELINE_BATCH', '500'))
+
+CACHE_LOOKUPS = Counter(
+    'cache_lookups_total',
+    'Cache lookups by namespace, tier and result',
+    ['namespace', 'tier', 'result']
+)
+CACHE_LATENCY = Histogram(
+    'cache_operation_seconds',
+    'Cache operation latency by namespace',
+    ['namespace', 'operation'],
+    buckets=(0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+)
+CACHE_COMPUTE_LATENCY = Histogram(
+    'cache_compute_seconds',
+    'Time spent recomputing missing or expiring values',
+    ['namespace']
+)
+CACHE_ERRORS = Counter(
+    'cache_errors_total',
+    'Redis errors by namespace and operation',
+    ['namespace', 'operation']
+)
+
+# Compare-and-delete so a lock is only released by its owner
+RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# Invalidation marks: Redis server time (ms) of each tag's last invalidation
+MARK_INVALIDATED_SCRIPT = """
+local now = redis.call('TIME')
+local ms = tonumber(now[1]) * 1000 + math.floor(tonumber(now[2]) / 1000)
+for i = 1, #KEYS do
+    redis.call('SET', KEYS[i], ms, 'EX', ARGV[1])
+end
+return ms
+"""
+
+# Store a computed value and register its tags, unless one of the tags was
+# invalidated after the compute started: the value may predate that change
+# KEYS: key, then (tag set, invalidation mark) per tag
+# ARGV: encoded envelope, ttl, compute start (server ms), tag set ttl
+STORE_TAGGED_SCRIPT = """
+local started = tonumber(ARGV[3])
+for i = 2, #KEYS, 2 do
+    local invalidated = redis.call('GET', KEYS[i + 1])
+    if invalidated and tonumber(invalidated) >= started then
+        return 0
+    end
+end
+redis.call('SETEX', KEYS[1], ARGV[2], ARGV[1])
+for i = 2, #KEYS, 2 do
+    redis.call('SADD', KEYS[i], KEYS[1])
+    redis.call('EXPIRE', KEYS[i], ARGV[4])
+end
+return 1
+"""
+
+_MISSING = object()
+
+
+def namespace_of(key: str) -> str:
+    """Metric label for a key: the part before the first ':'"""
+    return key.split(':', 1)[0]
+
+
+def tag_key(tag: str) -> str:
+    return f"tag:{tag}"
+
+
+def tag_mark_key(tag: str) -> str:
+    return f"tag:{tag}:invalidated"
+
+
+def encode(value: Any) -> bytes:
+    return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+
+
+def decode(raw) -> Any:
+    return orjson.loads(raw)
+
+
+class LocalLRU:
+    """Bounded in-process LRU with per-entry expiry"""
+
+    def __init__(self, max_entries: int = CACHE_LOCAL_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: str) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            return _MISSING
+        if entry[0] <= time.monotonic():
+            del self._entries[key]
+            return _MISSING
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def set(self, key: str, value: Any, ttl: float):
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def delete(self, key: str):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
 
 class RedisCache:
     """Redis cache manager for AutoWebIQ"""
-    
+
     def __init__(self):
         redis_url = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
         self.redis = redis.from_url(redis_url, decode_responses=True)
         self.default_ttl = 3600  # 1 hour
-    
+        self.local = LocalLRU()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._refreshing = set()
+        self._release_lock = self.redis.register_script(RELEASE_LOCK_SCRIPT)
+        self._mark_invalidated = self.redis.register_script(MARK_INVALIDATED_SCRIPT)
+        self._store_tagged = self.redis.register_script(STORE_TAGGED_SCRIPT)
+        self._listener: Optional[asyncio.Task] = None
+
     async def get(self, key: str) -> Optional[Any]:
         """Get value from cache"""
+        namespace = namespace_of(key)
+        value = self.local.get(key)
+        if value is not _MISSING:
+            CACHE_LOOKUPS.labels(namespace, 'local', 'hit').inc()
+            return value
+        CACHE_LOOKUPS.labels(namespace, 'local', 'miss').inc()
+
         try:
-            value = await self.redis.get(key)
-            if value:
-                return json.loads(value)
+            with CACHE_LATENCY.labels(namespace, 'get').time():
+                raw = await self.redis.get(key)
+        except RedisError as e:
+            CACHE_ERRORS.labels(namespace, 'get').inc()
+            logger.warning(f"Cache get error for {key}: {e}")
             return None
-        except Exception as e:
-            print(f"Cache get error: {e}")
+
+        if raw is None:
+            CACHE_LOOKUPS.labels(namespace, 'redis', 'miss').inc()
             return None
-    
-    async def set(self, key: str, value: Any, ttl: Optional[int] = None) -> bool:
-        """Set value in cache"""
+        CACHE_LOOKUPS.labels(namespace, 'redis', 'hit').inc()
+        value = decode(raw)
+        self.local.set(key, value, CACHE_LOCAL_TTL)
+        return value
+
+    async def set(self, key: str, value: Any, ttl: Optional[int] = None,
+                  tags: Optional[List[str]] = None) -> bool:
+        """Set value in cache, registering the key under each tag for invalidate_tags"""
+        namespace = namespace_of(key)
+        ttl = ttl or self.default_ttl
+        self.local.set(key, value, min(ttl, CACHE_LOCAL_TTL))
         try:
-            ttl = ttl or self.default_ttl
-            serialized = json.dumps(value)
-            await self.redis.setex(key, ttl, serialized)
+            with CACHE_LATENCY.labels(namespace, 'set').time():
+                if tags:
+                    async with self.redis.pipeline(transaction=False) as pipe:
+                        self._queue_set(pipe, key, encode(value), ttl, tags)
+                        await pipe.execute()
+                else:
+                    await self.redis.setex(key, ttl, encode(value))
             return True
-        except Exception as e:
-            print(f"Cache set error: {e}")
+        except RedisError as e:
+            CACHE_ERRORS.labels(namespace, 'set').inc()
+            logger.warning(f"Cache set error for {key}: {e}")
             return False
-    
+
+    # ==================== Bulk Operations & Tags ====================
+
+    @staticmethod
+    def _queue_set(pipe, key: str, raw: bytes, ttl: int, tags: Optional[List[str]]):
+        pipe.setex(key, ttl, raw)
+        for tag in tags or ():
+            pipe.sadd(tag_key(tag), key)
+            pipe.expire(tag_key(tag), max(ttl, CACHE_TAG_TTL))
+
+    def pipeline(self):
+        """Non-transactional pipeline on the shared connection pool for ad-hoc batching"""
+        return self.redis.pipeline(transaction=False)
+
+    async def mget(self, keys: List[str]) -> Dict[str, Any]:
+        """Get many keys in one round trip; missing keys are absent from the result"""
+        found: Dict[str, Any] = {}
+        remote: List[str] = []
+        for key in keys:
+            value = self.local.get(key)
+            if value is _MISSING:
+                CACHE_LOOKUPS.labels(namespace_of(key), 'local', 'miss').inc()
+                remote.append(key)
+            else:
+                CACHE_LOOKUPS.labels(namespace_of(key), 'local', 'hit').inc()
+                found[key] = value
+        if not remote:
+            return found
+
+        namespace = namespace_of(remote[0])
+        try:
+            with CACHE_LATENCY.labels(namespace, 'mget').time():
+                raws = await self.redis.mget(remote)
+        except RedisError as e:
+            CACHE_ERRORS.labels(namespace, 'mget').inc()
+            logger.warning(f"Cache mget error for {len(remote)} keys: {e}")
+            return found
+
+        for key, raw in zip(remote, raws):
+            if raw is None:
+                CACHE_LOOKUPS.labels(namespace_of(key), 'redis', 'miss').inc()
+                continue
+            CACHE_LOOKUPS.labels(namespace_of(key), 'redis', 'hit').inc()
+            value = decode(raw)
+            self.local.set(key, value, CACHE_LOCAL_TTL)
+            found[key] = value
+        return found
+
+    async def mset_with_ttl(
+        self,
+        items: Dict[str, Any],
+        ttl: Optional[int] = None,
+        tags: Optional[Dict[str, List[str]]] = None,
+        batch_size: int = CACHE_PIPELINE_BATCH
+    ) -> int:
+        """
+        Set many keys with one TTL, pipelined `batch_size` keys per round trip.
+        `tags` maps a key to the tags it should be registered under.
+        Returns the number of keys written.
+        """
+        ttl = ttl or self.default_ttl
+        tags = tags or {}
+        keys = list(items)
+        written = 0
+        for start in range(0, len(keys), batch_size):
+            batch = keys[start:start + batch_size]
+            namespace = namespace_of(batch[0])
+            try:
+                with CACHE_LATENCY.labels(namespace, 'mset').time():
+                    async with self.redis.pipeline(transaction=False) as pipe:
+                        for key in batch:
+                            self._queue_set(pipe, key, encode(items[key]), ttl, tags.get(key))
+                        await pipe.execute()
+            except RedisError as e:
+                CACHE_ERRORS.labels(namespace, 'mset').inc()
+                logger.warning(f"Cache mset error for batch of {len(batch)} keys: {e}")
+                continue
+            for key in batch:
+                self.local.set(key, items[key], min(ttl, CACHE_LOCAL_TTL))
+            written += len(batch)
+        return written
+
+    async def invalidate_tags(self, *tags: str) -> int:
+        """
+        Delete every key registered under the given tags (SMEMBERS + UNLINK, no
+        keyspace scan). The tags are also marked, so computes already running
+        for them don't store their (possibly stale) values afterwards.
+        """
+        if not tags:
+            return 0
+        try:
+            await self._mark_invalidated(keys=[tag_mark_key(tag) for tag in tags], args=[CACHE_TAG_TTL])
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for tag in tags:
+                    pipe.smembers(tag_key(tag))
+                members = await pipe.execute()
+            keys = sorted(set().union(*members))
+            for key in keys:
+                self.local.delete(key)
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.unlink(*keys, *[tag_key(tag) for tag in tags])
+                if keys:
+                    pipe.publish(CACHE_EVICT_CHANNEL, orjson.dumps(keys))
+                await pipe.execute()
+            return len(keys)
+        except RedisError as e:
+            CACHE_ERRORS.labels('tag', 'invalidate').inc()
+            logger.warning(f"Cache tag invalidation error for {tags}: {e}")
+            return 0
+
     async def delete(self, key: str) -> bool:
-        """Delete key from cache"""
+        """Delete key from cache (and from every process's local tier)"""
+        self.local.delete(key)
         try:
-            await self.redis.delete(key)
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.delete(key)
+                pipe.publish(CACHE_EVICT_CHANNEL, key)
+                await pipe.execute()
             return True
-        except Exception as e:
-            print(f"Cache delete error: {e}")
+        except RedisError as e:
+            CACHE_ERRORS.labels(namespace_of(key), 'delete').inc()
+            logger.warning(f"Cache delete error for {key}: {e}")
             return False
-    
+
     async def exists(self, key: str) -> bool:
         """Check if key exists"""
         try:
             return await self.redis.exists(key) > 0
-        except Exception as e:
-            print(f"Cache exists error: {e}")
+        except RedisError as e:
+            CACHE_ERRORS.labels(namespace_of(key), 'exists').inc()
+            logger.warning(f"Cache exists error for {key}: {e}")
             return False
-    
+
     async def clear_pattern(self, pattern: str) -> int:
         """Clear all keys matching pattern"""
         try:
@@ -62,74 +343,297 @@ class RedisCache:
                 cursor, keys = await self.redis.scan(cursor, match=pattern, count=100)
                 if keys:
                     deleted += await self.redis.delete(*keys)
+                    for key in keys:
+                        self.local.delete(key)
+                    await self.redis.publish(CACHE_EVICT_CHANNEL, orjson.dumps(keys))
                 if cursor == 0:
                     break
             return deleted
-        except Exception as e:
-            print(f"Cache clear pattern error: {e}")
+        except RedisError as e:
+            CACHE_ERRORS.labels(namespace_of(pattern), 'clear_pattern').inc()
+            logger.warning(f"Cache clear pattern error for {pattern}: {e}")
             return 0
-    
+
+    # ==================== Get-or-Compute ====================
+
+    async def get_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[Any]],
+        ttl: Optional[int] = None,
+        negative_ttl: int = 60,
+        beta: float = 1.0,
+        lock_timeout: float = 10.0,
+        tags: Optional[Any] = None
+    ) -> Any:
+        """
+        Return the cached value for `key`, computing and caching it on a miss.
+
+        - Single flight: concurrent misses in this process share one compute,
+          and a short Redis lock makes other workers wait for the winner
+          instead of recomputing.
+        - XFetch: as expiry approaches, one caller refreshes the value in the
+          background (earlier for values that are slow to compute), so hot
+          keys never expire under load.
+        - Negative caching: a None result is cached for `negative_ttl`.
+
+        Keys written here hold an envelope; read them only through this method.
+        `tags` registers the key for invalidate_tags; it may also be a
+        callable taking the computed value, for tags only known after loading.
+        """
+        namespace = namespace_of(key)
+        ttl = ttl or self.default_ttl
+
+        envelope = self.local.get(key)
+        if envelope is not _MISSING:
+            CACHE_LOOKUPS.labels(namespace, 'local', 'hit').inc()
+        else:
+            CACHE_LOOKUPS.labels(namespace, 'local', 'miss').inc()
+            envelope = await self._get_envelope(key, namespace)
+
+        if envelope is not None:
+            if self._should_refresh_early(envelope, beta):
+                self._refresh_in_background(key, compute, ttl, negative_ttl, lock_timeout, tags)
+            return envelope['v']
+
+        # In-process single flight
+        pending = self._inflight.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await self._compute_once(key, namespace, compute, ttl, negative_ttl, lock_timeout, tags)
+            future.set_result(value)
+            return value
+        except Exception as e:
+            future.set_exception(e)
+            # Retrieve the exception so an unawaited future doesn't log a warning
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    async def _get_envelope(self, key: str, namespace: str) -> Optional[Dict]:
+        try:
+            with CACHE_LATENCY.labels(namespace, 'get').time():
+                raw = await self.redis.get(key)
+        except RedisError as e:
+            CACHE_ERRORS.labels(namespace, 'get').inc()
+            logger.warning(f"Cache get error for {key}: {e}")
+            return None
+        if raw is None:
+            CACHE_LOOKUPS.labels(namespace, 'redis', 'miss').inc()
+            return None
+        CACHE_LOOKUPS.labels(namespace, 'redis', 'hit').inc()
+        envelope = decode(raw)
+        self.local.set(key, envelope, max(min(envelope['e'] - time.time(), CACHE_LOCAL_TTL), 0.001))
+        return envelope
+
+    @staticmethod
+    def _should_refresh_early(envelope: Dict, beta: float) -> bool:
+        """XFetch: refresh with rising probability as expiry nears"""
+        delta = envelope.get('d', 0)
+        if delta <= 0 or beta <= 0:
+            return False
+        return time.time() - delta * beta * math.log(random.random() or 1e-12) >= envelope['e']
+
+    def _refresh_in_background(self, key, compute, ttl, negative_ttl, lock_timeout, tags):
+        if key in self._refreshing:
+            return
+        self._refreshing.add(key)
+
+        async def refresh():
+            try:
+                lock = await self._acquire_lock(key, lock_timeout)
+                if lock:
+                    try:
+                        await self._compute_and_store(key, namespace_of(key), compute, ttl, negative_ttl, tags)
+                    finally:
+                        await self._unlock(key, lock)
+            except Exception as e:
+                logger.warning(f"Early refresh of {key} failed: {e}")
+            finally:
+                self._refreshing.discard(key)
+
+        asyncio.get_running_loop().create_task(refresh())
+
+    async def _compute_once(self, key, namespace, compute, ttl, negative_ttl, lock_timeout, tags) -> Any:
+        lock = await self._acquire_lock(key, lock_timeout)
+        if lock is None:
+            # Another worker holds the lock - wait for its result
+            deadline = time.monotonic() + lock_timeout
+            while time.monotonic() < deadline:
+                await asyncio.sleep(0.05)
+                envelope = await self._get_envelope(key, namespace)
+                if envelope is not None:
+                    return envelope['v']
+            # Lock holder died or is very slow: compute ourselves
+            return await self._compute_and_store(key, namespace, compute, ttl, negative_ttl, tags)
+
+        try:
+            return await self._compute_and_store(key, namespace, compute, ttl, negative_ttl, tags)
+        finally:
+            await self._unlock(key, lock)
+
+    async def _compute_and_store(self, key, namespace, compute, ttl, negative_ttl, tags) -> Any:
+        started_ms = None
+        if tags is not None:
+            try:
+                seconds, microseconds = await self.redis.time()
+                started_ms = seconds * 1000 + microseconds // 1000
+            except RedisError as e:
+                logger.warning(f"Cache time error for {key}: {e}")
+        start = time.perf_counter()
+        value = await compute()
+        delta = time.perf_counter() - start
+        CACHE_COMPUTE_LATENCY.labels(namespace).observe(delta)
+
+        store_ttl = negative_ttl if value is None else ttl
+        envelope = {'v': value, 'd': delta, 'e': time.time() + store_ttl}
+        value_tags = tags(value) if callable(tags) else tags
+        stored = True
+        try:
+            with CACHE_LATENCY.labels(namespace, 'set').time():
+                if value_tags and started_ms is not None:
+                    keys = [key]
+                    for tag in value_tags:
+                        keys += [tag_key(tag), tag_mark_key(tag)]
+                    stored = bool(await self._store_tagged(
+                        keys=keys, args=[encode(envelope), store_ttl, started_ms, max(store_ttl, CACHE_TAG_TTL)]
+                    ))
+                else:
+                    async with self.redis.pipeline(transaction=False) as pipe:
+                        self._queue_set(pipe, key, encode(envelope), store_ttl, value_tags)
+                        await pipe.execute()
+        except RedisError as e:
+            CACHE_ERRORS.labels(namespace, 'set').inc()
+            logger.warning(f"Cache set error for {key}: {e}")
+        if stored:
+            self.local.set(key, envelope, min(store_ttl, CACHE_LOCAL_TTL))
+        return value
+
+    async def _acquire_lock(self, key: str, timeout: float) -> Optional[str]:
+        """Returns a lock token, '' if Redis is down (proceed unlocked), or None if held elsewhere"""
+        token = uuid.uuid4().hex
+        try:
+            if await self.redis.set(f"lock:{key}", token, nx=True, px=int(timeout * 1000)):
+                return token
+            return None
+        except RedisError as e:
+            CACHE_ERRORS.labels(namespace_of(key), 'lock').inc()
+            logger.warning(f"Cache lock error for {key}: {e}")
+            return ''
+
+    async def _unlock(self, key: str, token: str):
+        if not token:
+            return
+        try:
+            await self._release_lock(keys=[f"lock:{key}"], args=[token])
+        except RedisError as e:
+            logger.warning(f"Cache unlock error for {key}: {e}")
+
+    # ==================== Local Tier Invalidation ====================
+
+    def start_listener(self):
+        """Evict local entries deleted by other processes"""
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.get_running_loop().create_task(self._listen())
+
+    async def stop_listener(self):
+        if self._listener:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+    async def _listen(self):
+        while True:
+            pubsub = self.redis.pubsub()
+            try:
+                await pubsub.subscribe(CACHE_EVICT_CHANNEL)
+                async for message in pubsub.listen():
+                    if message.get('type') != 'message':
+                        continue
+                    data = message['data']
+                    keys = decode(data) if data.startswith('[') else [data]
+                    for key in keys:
+                        self.local.delete(key)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Evictions may have been missed - drop the local tier entirely
+                logger.error(f"Cache eviction listener error: {e}")
+                self.local.clear()
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.close()
+
     # ==================== Specific Cache Methods ====================
-    
+
     async def get_template(self, template_id: str) -> Optional[dict]:
         """Get template from cache"""
         return await self.get(f"template:{template_id}")
-    
+
     async def set_template(self, template_id: str, template: dict, ttl: int = 7200) -> bool:
         """Cache template (2 hour TTL)"""
         return await self.set(f"template:{template_id}", template, ttl)
-    
+
     async def get_component(self, component_id: str) -> Optional[dict]:
         """Get component from cache"""
         return await self.get(f"component:{component_id}")
-    
+
     async def set_component(self, component_id: str, component: dict, ttl: int = 7200) -> bool:
         """Cache component (2 hour TTL)"""
         return await self.set(f"component:{component_id}", component, ttl)
-    
+
     async def get_user_credits(self, user_id: str) -> Optional[int]:
         """Get user credits from cache"""
         return await self.get(f"user:{user_id}:credits")
-    
+
     async def set_user_credits(self, user_id: str, credits: int, ttl: int = 300) -> bool:
         """Cache user credits (5 minute TTL)"""
-        return await self.set(f"user:{user_id}:credits", credits, ttl)
-    
+        return await self.set(f"user:{user_id}:credits", credits, ttl, tags=[f"user:{user_id}"])
+
     async def invalidate_user_cache(self, user_id: str) -> int:
-        """Invalidate all cache for a user"""
-        return await self.clear_pattern(f"user:{user_id}:*")
-    
+        """Invalidate all cache for a user (keys cached with the user:{id} tag)"""
+        return await self.invalidate_tags(f"user:{user_id}")
+
     async def get_build_status(self, task_id: str) -> Optional[dict]:
         """Get build task status from cache"""
         return await self.get(f"build:status:{task_id}")
-    
+
     async def set_build_status(self, task_id: str, status: dict, ttl: int = 1800) -> bool:
         """Cache build status (30 minute TTL)"""
         return await self.set(f"build:status:{task_id}", status, ttl)
-    
+
     # ==================== Pub/Sub for Real-time Updates ====================
-    
+
     async def publish_message(self, channel: str, message: dict) -> int:
         """Publish message to channel"""
         try:
-            return await self.redis.publish(channel, json.dumps(message))
-        except Exception as e:
-            print(f"Publish error: {e}")
+            return await self.redis.publish(channel, encode(message))
+        except RedisError as e:
+            logger.warning(f"Publish error on {channel}: {e}")
             return 0
-    
+
     async def subscribe_channel(self, channel: str):
         """Subscribe to channel (returns async generator)"""
         pubsub = self.redis.pubsub()
         await pubsub.subscribe(channel)
         return pubsub
-    
+
     async def publish_build_update(self, project_id: str, update: dict) -> int:
         """Publish build update for real-time WebSocket"""
         channel = f"build:{project_id}"
         return await self.publish_message(channel, update)
-    
+
     async def close(self):
         """Close Redis connection"""
+        await self.stop_listener()
         await self.redis.close()
 
 
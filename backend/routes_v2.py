@@ -3,16 +3,19 @@
 
 from fastapi import APIRouter, HTTPException, Depends, WebSocket, WebSocketDisconnect, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy import select, update, func
+from sqlalchemy import select, update
 from sqlalchemy.ext.asyncio import AsyncSession
-from database import get_db, User, Project, ProjectMessage, CreditTransaction
+from database import get_db, get_read_db, User, Project, ProjectMessage
 from credit_system_v2 import get_credit_manager_v2, TransactionType, TransactionStatus
 from websocket_manager import ws_manager
+from user_stats import get_user_stats_row, record_project_created, record_project_status_change
 from celery_tasks import build_website_task
+from auth_cache import principal_cache, jwt_cache_key, AUTH_CACHE_TTL, AUTH_DEPENDENCY_LATENCY
 from pydantic import BaseModel
 from typing import List, Optional
 import jwt
 from datetime import datetime, timezone
+import time
 import uuid
 from passlib.context import CryptContext
 import os
@@ -27,11 +30,25 @@ JWT_ALGORITHM = "HS256"
 
 # ==================== Helper Functions ====================
 
+# Columns cached with the principal (no password hash or tokens in Redis)
+PRINCIPAL_FIELDS = ('id', 'email', 'name', 'credits', 'firebase_uid', 'created_at', 'updated_at')
+
+
+def _user_from_principal(principal: dict) -> User:
+    """Rebuild a detached User from a cached principal"""
+    data = {field: principal.get(field) for field in PRINCIPAL_FIELDS}
+    for field in ('created_at', 'updated_at'):
+        if data.get(field):
+            data[field] = datetime.fromisoformat(data[field])
+    return User(**data)
+
+
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
     session: AsyncSession = Depends(get_db)
 ) -> User:
-    """Get current authenticated user from JWT token"""
+    """Get current authenticated user from JWT token (cached per token)"""
+    start = time.perf_counter()
     try:
         token = credentials.credentials
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
@@ -40,20 +57,34 @@ async def get_current_user(
         if not user_id:
             raise HTTPException(status_code=401, detail="Invalid token")
         
-        result = await session.execute(
-            select(User).where(User.id == user_id)
-        )
-        user = result.scalar_one_or_none()
+        async def load_user():
+            result = await session.execute(
+                select(User).where(User.id == user_id)
+            )
+            user = result.scalar_one_or_none()
+            if not user:
+                return None
+            principal = {
+                field: value.isoformat() if isinstance(value, datetime) else value
+                for field, value in ((f, getattr(user, f)) for f in PRINCIPAL_FIELDS)
+            }
+            principal['user_id'] = user.id
+            ttl = payload['exp'] - time.time() if 'exp' in payload else AUTH_CACHE_TTL
+            return principal, ttl
         
-        if not user:
+        principal = await principal_cache.resolve('jwt', jwt_cache_key(payload, token), load_user)
+        
+        if not principal:
             raise HTTPException(status_code=401, detail="User not found")
         
-        return user
+        return _user_from_principal(principal)
         
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
+    finally:
+        AUTH_DEPENDENCY_LATENCY.labels('jwt').observe(time.perf_counter() - start)
 
 
 # ==================== Models ====================
@@ -184,6 +215,7 @@ async def create_project(
     )
     
     session.add(project)
+    await record_project_created(session, current_user.id, project.status)
     await session.commit()
     
     return {
@@ -199,7 +231,7 @@ async def create_project(
 @router_v2.get("/projects")
 async def list_projects(
     current_user: User = Depends(get_current_user),
-    session: AsyncSession = Depends(get_db),
+    session: AsyncSession = Depends(get_read_db),
     limit: int = 50,
     offset: int = 0
 ):
@@ -310,6 +342,7 @@ async def start_async_build(
         .where(Project.id == project_id)
         .values(status='building', updated_at=datetime.now(timezone.utc))
     )
+    await record_project_status_change(session, current_user.id, project.status, 'building')
     await session.commit()
     
     # Submit Celery task
@@ -379,7 +412,7 @@ async def get_build_status(
 @router_v2.get("/credits/history")
 async def get_credit_history(
     current_user: User = Depends(get_current_user),
-    session: AsyncSession = Depends(get_db),
+    session: AsyncSession = Depends(get_read_db),
     limit: int = 50,
     offset: int = 0
 ):
@@ -402,39 +435,18 @@ async def get_credit_history(
 @router_v2.get("/stats")
 async def get_user_stats(
     current_user: User = Depends(get_current_user),
-    session: AsyncSession = Depends(get_db)
+    session: AsyncSession = Depends(get_read_db)
 ):
-    """Get user statistics"""
-    # Count projects
-    project_count_result = await session.execute(
-        select(func.count(Project.id))
-        .where(Project.user_id == current_user.id)
-    )
-    project_count = project_count_result.scalar()
-    
-    # Count completed projects
-    completed_count_result = await session.execute(
-        select(func.count(Project.id))
-        .where(Project.user_id == current_user.id)
-        .where(Project.status == 'completed')
-    )
-    completed_count = completed_count_result.scalar()
-    
-    # Count total credits spent
-    credits_spent_result = await session.execute(
-        select(func.sum(CreditTransaction.amount))
-        .where(CreditTransaction.user_id == current_user.id)
-        .where(CreditTransaction.transaction_type == 'deduction')
-    )
-    credits_spent = abs(credits_spent_result.scalar() or 0)
+    """Get user statistics (single read of the maintained user_stats row)"""
+    stats = await get_user_stats_row(session, current_user.id)
     
     return {
         'user_id': current_user.id,
         'email': current_user.email,
         'credits': current_user.credits,
-        'total_projects': project_count,
-        'completed_projects': completed_count,
-        'credits_spent': credits_spent,
+        'total_projects': stats['total_projects'],
+        'completed_projects': stats['completed_projects'],
+        'credits_spent': stats['credits_spent'],
         'member_since': current_user.created_at.isoformat()
     }
 
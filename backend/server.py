@@ -12,13 +12,13 @@ from pydantic import BaseModel, Field, ConfigDict
 from typing import List, Optional
 import uuid
 from datetime import datetime, timezone, timedelta
-from passlib.context import CryptContext
 import jwt
 import razorpay
 import io
 import zipfile
 import json
 import asyncio
+import time
 import cloudinary
 import cloudinary.uploader
 from openai import AsyncOpenAI
@@ -66,12 +66,36 @@ cloudinary.config(
 # MongoDB has been removed - all data migrated to PostgreSQL
 # TEMPORARY: Re-add MongoDB for V1 endpoints until full PostgreSQL migration
 from motor.motor_asyncio import AsyncIOMotorClient
+from db_metrics import mongo_command_listener
+from auth_cache import principal_cache, session_cache_key, AUTH_DEPENDENCY_LATENCY
+from redis_cache import cache
+from catalog_cache import Catalog
+from health_prober import create_health_prober
+from public_share_cache import get_public_page, invalidate_public_project, public_page_response
+from code_patch import EDIT_PROTOCOL_INSTRUCTIONS, apply_edit_response, record_edit, strip_edit_blocks
+from chat_context import CHAT_PROMPT_TOKENS, ChatContextBuilder, code_context as build_code_context, estimate_tokens
 
 # MongoDB connection for V1 endpoints
-mongo_client = AsyncIOMotorClient(os.environ.get('MONGO_URL', 'mongodb://localhost:27017'))
+mongo_client = AsyncIOMotorClient(
+    os.environ.get('MONGO_URL', 'mongodb://localhost:27017'),
+    event_listeners=[mongo_command_listener]
+)
 db = mongo_client[os.environ.get('DB_NAME', 'autowebiq_db')]
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Chat messages are written behind in per-project batches (one insert_many);
+# replies that end a request are written synchronously with what is pending
+from message_buffer import MessageWriteBuffer, MongoMessageSink, project_message_buffer
+message_buffer = MessageWriteBuffer(MongoMessageSink(db.messages))
+
+# Credit balances are held hot in Redis; ledger entries persist write-behind to MongoDB
+from hot_credits import HotCreditLedger, LedgerStreamPersister, MongoLedgerSink, create_redis_client
+credit_redis = create_redis_client()
+hot_credits = HotCreditLedger(credit_redis, MongoLedgerSink(db), fallback=get_credit_manager(db))
+ledger_persister = LedgerStreamPersister(credit_redis, MongoLedgerSink(db))
+
+# bcrypt runs on a bounded thread pool, off the event loop
+from password_hashing import hash_password, verify_and_update
+
 security = HTTPBearer()
 JWT_SECRET = os.environ.get('JWT_SECRET')
 JWT_ALGORITHM = "HS256"
@@ -81,6 +105,7 @@ razorpay_client = razorpay.Client(auth=(os.environ['RAZORPAY_KEY_ID'], os.enviro
 
 # OpenAI client
 openai_client = AsyncOpenAI(api_key=os.environ.get('OPENAI_API_KEY'))
+chat_context_builder = ChatContextBuilder(db.messages, openai_client)
 
 # Initialize Multi-Agent Orchestrators
 agent_orchestrator = OptimizedAgentOrchestrator(
@@ -106,6 +131,17 @@ async def startup_event():
     # await init_db()
     logging.info("✅ Server started (MongoDB mode)")
     
+    # Persist hot-balance ledger events in the background
+    ledger_persister.start()
+    # Evict cached auth principals invalidated by other processes
+    principal_cache.start_listener()
+    # Probe dependencies in the background for the health endpoints
+    health_prober.start()
+    # Evict local cache entries deleted by other processes
+    cache.start_listener()
+    # Keep warm workspace containers ready for live previews
+    get_workspace_manager().start_pool()
+    
     # Auto-load templates if not already loaded
     try:
         template_count = await db.templates.count_documents({})
@@ -221,16 +257,10 @@ class GoogleAuthUser(BaseModel):
     picture: Optional[str] = None
 
 # Helper functions
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
-
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
-
 def create_access_token(data: dict) -> str:
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + JWT_EXPIRATION
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "jti": uuid.uuid4().hex})
     return jwt.encode(to_encode, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
 async def get_current_user_from_session(request: Request) -> Optional[str]:
@@ -250,16 +280,23 @@ async def get_current_user_from_session(request: Request) -> Optional[str]:
     if not session_token:
         return None
     
-    # Find active session
-    session = await db.user_sessions.find_one({
-        "session_token": session_token,
-        "expires_at": {"$gt": datetime.now(timezone.utc)}
-    })
+    async def load_session():
+        # Find active session
+        session = await db.user_sessions.find_one({
+            "session_token": session_token,
+            "expires_at": {"$gt": datetime.now(timezone.utc)}
+        })
+        if not session:
+            return None
+        expires_at = session["expires_at"]
+        if expires_at.tzinfo is None:
+            expires_at = expires_at.replace(tzinfo=timezone.utc)
+        return {"user_id": session["user_id"]}, (expires_at - datetime.now(timezone.utc)).total_seconds()
     
-    if not session:
-        return None
+    with AUTH_DEPENDENCY_LATENCY.labels('session').time():
+        principal = await principal_cache.resolve('session', session_cache_key(session_token), load_session)
     
-    return session["user_id"]
+    return principal["user_id"] if principal else None
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> str:
     try:
@@ -327,7 +364,7 @@ async def register(user_data: UserRegister):
         "id": str(uuid.uuid4()),
         "username": user_data.username,
         "email": user_data.email,
-        "password_hash": hash_password(user_data.password),
+        "password_hash": await hash_password(user_data.password),
         "credits": INITIAL_FREE_CREDITS,
         "created_at": datetime.now(timezone.utc).isoformat()
     }
@@ -356,9 +393,17 @@ async def login(user_data: UserLogin):
     """Login user - MongoDB"""
     # Find user
     user = await db.users.find_one({"email": user_data.email})
-    if not user or not verify_password(user_data.password, user.get('password_hash') or user.get('password', '')):
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    
+    valid, new_hash = await verify_and_update(user_data.password, user.get('password_hash') or user.get('password', ''))
+    if not valid:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
+    # Cost factor changed since this hash was made - store the upgraded hash
+    if new_hash:
+        await db.users.update_one({"id": user['id']}, {"$set": {"password_hash": new_hash}})
+    
     # Remove MongoDB _id to prevent serialization issues
     user.pop('_id', None)
     
@@ -437,7 +482,7 @@ async def reset_password(request: ResetPasswordRequest):
         raise HTTPException(status_code=400, detail="Reset code expired")
     
     # Update password
-    new_hash = hash_password(request.new_password)
+    new_hash = await hash_password(request.new_password)
     await db.users.update_one(
         {"email": request.email},
         {"$set": {"password_hash": new_hash}}
@@ -640,8 +685,9 @@ async def logout(request: Request, response: Response):
     session_token = request.cookies.get("session_token")
     
     if session_token:
-        # Delete session from database
+        # Delete session from database and every process's auth cache
         await db.user_sessions.delete_many({"session_token": session_token})
+        await principal_cache.invalidate_key(session_cache_key(session_token))
     
     # Clear cookie
     response.delete_cookie(key="session_token", path="/")
@@ -715,10 +761,9 @@ async def verify_payment(request: VerifyPaymentRequest, user_id: str = Depends(g
             {"id": user_id},
             {"$inc": {"credits": transaction['credits']}}
         )
+        await hot_credits.adjust(user_id, transaction['credits'])
         
-        user_doc = await db.users.find_one({"id": user_id}, {"_id": 0, "credits": 1})
-        
-        return {"success": True, "credits": user_doc['credits']}
+        return {"success": True, "credits": await hot_credits.get_balance(user_id)}
     except:
         await db.transactions.update_one(
             {"order_id": request.order_id},
@@ -816,6 +861,8 @@ async def verify_subscription_payment(
                 "$inc": {"credits": credits_to_add}
             }
         )
+        await hot_credits.adjust(user_id, credits_to_add)
+        await principal_cache.invalidate_user(user_id)
         
         # Get updated user
         updated_user = await db.users.find_one({"id": user_id}, {"_id": 0})
@@ -862,6 +909,8 @@ async def get_subscription_status_endpoint(user_id: str = Depends(get_current_us
         
         if should_refill:
             refill_result = await subscription_manager.refill_monthly_credits(user, db)
+            await hot_credits.invalidate(user_id)
+            await principal_cache.invalidate_user(user_id)
             return {
                 "success": True,
                 "subscription": {**subscription, **razorpay_status},
@@ -1057,7 +1106,7 @@ async def create_project(project_data: ProjectCreate, user_id: str = Depends(get
     )
     sys_dict = system_msg.model_dump()
     sys_dict['created_at'] = sys_dict['created_at'].isoformat()
-    await db.messages.insert_one(sys_dict)
+    await message_buffer.add(project.id, sys_dict)
     
     # Return clean project data
     return {
@@ -1149,7 +1198,7 @@ async def create_message(project_id: str, request: Request, user_id: str = Depen
         "images": uploaded_images,
         "created_at": datetime.now(timezone.utc).isoformat()
     }
-    await db.messages.insert_one(user_message)
+    await message_buffer.add(project_id, user_message)
     
     # Check user credits
     user = await db.users.find_one({"id": user_id})
@@ -1161,7 +1210,7 @@ async def create_message(project_id: str, request: Request, user_id: str = Depen
             "content": "⚠️ Insufficient credits. You need at least 20 credits to generate a website.",
             "created_at": datetime.now(timezone.utc).isoformat()
         }
-        await db.messages.insert_one(error_message)
+        await message_buffer.add(project_id, error_message, terminal=True)
         return {"message": error_message}
     
     try:
@@ -1212,10 +1261,7 @@ async def create_message(project_id: str, request: Request, user_id: str = Depen
                 "content": f"✅ Multi-page website generated successfully! 🎉\n\n**Generated Pages:** {page_list}\n\n**Features:**\n• Working navigation\n• Functional forms\n• Responsive design",
                 "created_at": datetime.now(timezone.utc).isoformat()
             }
-            await db.messages.insert_one(assistant_message)
-            
-            # Remove MongoDB _id before returning
-            assistant_message.pop('_id', None)
+            await message_buffer.add(project_id, assistant_message, terminal=True)
             
             # Update project with generated code and all pages
             await db.projects.update_one(
@@ -1228,6 +1274,7 @@ async def create_message(project_id: str, request: Request, user_id: str = Depen
                     "updated_at": datetime.now(timezone.utc).isoformat()
                 }}
             )
+            await invalidate_public_project(project_id)
             
             # Deduct credits (use token usage if available)
             credits_used = result.get('token_usage', {}).get('total_credits', 20)
@@ -1237,6 +1284,7 @@ async def create_message(project_id: str, request: Request, user_id: str = Depen
                 {"id": user_id},
                 {"$inc": {"credits": -credits_used}}
             )
+            await hot_credits.adjust(user_id, -credits_used)
             
             return {
                 "message": assistant_message,
@@ -1254,8 +1302,7 @@ async def create_message(project_id: str, request: Request, user_id: str = Depen
                 "content": f"❌ Generation failed: {result.get('error', 'Unknown error')}",
                 "created_at": datetime.now(timezone.utc).isoformat()
             }
-            await db.messages.insert_one(error_message)
-            error_message.pop('_id', None)
+            await message_buffer.add(project_id, error_message, terminal=True)
             return {"message": error_message}
             
     except Exception as e:
@@ -1267,8 +1314,7 @@ async def create_message(project_id: str, request: Request, user_id: str = Depen
             "content": f"❌ Error: {str(e)}",
             "created_at": datetime.now(timezone.utc).isoformat()
         }
-        await db.messages.insert_one(error_message)
-        error_message.pop('_id', None)
+        await message_buffer.add(project_id, error_message, terminal=True)
         return {"message": error_message}
 
 # Vercel deployment removed - using manual deployment instead
@@ -1302,6 +1348,7 @@ async def update_project_code(project_id: str, user_id: str = Depends(get_curren
     
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Project not found")
+    await invalidate_public_project(project_id)
     
     return {"message": "Code updated successfully"}
 
@@ -1355,7 +1402,7 @@ async def fork_project(project_id: str, user_id: str = Depends(get_current_user)
         for msg in messages:
             msg['id'] = str(uuid.uuid4())
             msg['project_id'] = new_project_id
-            await db.messages.insert_one(msg)
+        await db.messages.insert_many(messages, ordered=False)
     
     return {
         "message": "Project forked successfully",
@@ -1382,6 +1429,8 @@ async def share_project(project_id: str, user_id: str = Depends(get_current_user
             "updated_at": datetime.now(timezone.utc).isoformat()
         }}
     )
+    # A new token replaces the old one; drop the old token's cached page
+    await invalidate_public_project(project_id)
     
     # Generate public URL
     backend_url = os.environ.get('REACT_APP_BACKEND_URL', 'http://localhost:8001')
@@ -1393,16 +1442,27 @@ async def share_project(project_id: str, user_id: str = Depends(get_current_user
         "share_token": share_token
     }
 
-@api_router.get("/public/{share_token}")
-async def view_public_project(share_token: str):
-    """View a publicly shared project"""
-    project = await db.projects.find_one({"share_token": share_token, "is_public": True}, {"_id": 0})
-    if not project:
-        raise HTTPException(status_code=404, detail="Project not found or not public")
+@api_router.delete("/projects/{project_id}/share")
+async def unshare_project(project_id: str, user_id: str = Depends(get_current_user)):
+    """Revoke the public link for the project"""
+    result = await db.projects.update_one(
+        {"id": project_id, "user_id": user_id},
+        {"$set": {
+            "is_public": False,
+            "updated_at": datetime.now(timezone.utc).isoformat()
+        }, "$unset": {"share_token": ""}}
+    )
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="Project not found")
     
-    # Return HTML directly
-    from fastapi.responses import HTMLResponse
-    return HTMLResponse(content=project.get('generated_code', '<h1>No content available</h1>'))
+    await invalidate_public_project(project_id)
+    return {"message": "Project is no longer public"}
+
+@api_router.get("/public/{share_token}")
+async def view_public_project(share_token: str, request: Request):
+    """View a publicly shared project (cached; ETag + stale-while-revalidate for CDNs)"""
+    page = await get_public_page(db, share_token)
+    return public_page_response(request, page)
 
 
 @api_router.post("/upload")
@@ -1432,6 +1492,43 @@ async def upload_file(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
+def extract_html_document(ai_response: str, title: str) -> str:
+    """Pull the HTML page out of a full-generation chat response"""
+    html_code = ai_response.strip()
+    
+    # Try multiple extraction patterns
+    if "```html" in html_code.lower():
+        # Extract between ```html and ```
+        parts = html_code.lower().split("```html")
+        if len(parts) > 1:
+            html_code = html_code.split("```html", 1)[1].split("```")[0].strip()
+    elif "```" in html_code:
+        # Extract between ``` and ```
+        parts = html_code.split("```")
+        if len(parts) >= 3:
+            html_code = parts[1].strip()
+    
+    # If still has code blocks, try to clean
+    if html_code.startswith("```"):
+        html_code = html_code.split("```", 1)[1].split("```")[0].strip()
+    
+    # Ensure we have HTML
+    if not html_code.strip().lower().startswith("<!doctype") and not html_code.strip().lower().startswith("<html"):
+        # If no HTML structure, wrap content
+        if "<" in html_code and ">" in html_code:
+            html_code = f"""<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>{title}</title>
+</head>
+<body>
+{html_code}
+</body>
+</html>"""
+    return html_code
+
 # Chat endpoint using HTTP POST instead of WebSocket
 @api_router.post("/chat")
 async def chat(request: ChatRequest, user_id: str = Depends(get_current_user)):
@@ -1442,43 +1539,37 @@ async def chat(request: ChatRequest, user_id: str = Depends(get_current_user)):
     model_info = MODEL_COSTS[request.model]
     credits_needed = model_info["cost"]
     
-    # Check user has enough credits
-    user_doc = await db.users.find_one({"id": user_id})
-    if user_doc['credits'] < credits_needed:
-        raise HTTPException(
-            status_code=402, 
-            detail=f"Insufficient credits. Need {credits_needed} credits. You have {user_doc['credits']}."
-        )
-    
     # Verify project
     project = await db.projects.find_one({"id": request.project_id, "user_id": user_id})
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
     
-    # Deduct credits BEFORE generation
-    await db.users.update_one(
-        {"id": user_id},
-        {"$inc": {"credits": -credits_needed}}
-    )
-    
-    # Save user message
-    user_msg = ChatMessage(
-        project_id=request.project_id,
-        role="user",
-        content=request.message,
-        credits_used=credits_needed
+    # Reserve credits BEFORE generation (hot balance, one Redis round trip)
+    reservation = await hot_credits.reserve_credits(
+        user_id, credits_needed, "chat", {"project_id": request.project_id, "model": request.model}
     )
-    user_dict = user_msg.model_dump()
-    user_dict['created_at'] = user_dict['created_at'].isoformat()
-    await db.messages.insert_one(user_dict)
+    if reservation['status'] != 'success':
+        raise HTTPException(
+            status_code=402, 
+            detail=f"Insufficient credits. Need {credits_needed} credits. You have {reservation['available']}."
+        )
+    transaction_id = reservation['transaction_id']
     
-    # Get AI response
+    # Get AI response (any failure from here on refunds the reservation)
     try:
-        # Get recent chat history for context (last 10 messages)
-        recent_messages = await db.messages.find(
-            {"project_id": request.project_id}
-        ).sort("created_at", -1).limit(10).to_list(length=10)
-        recent_messages.reverse()  # Put in chronological order
+        # Save user message
+        user_msg = ChatMessage(
+            project_id=request.project_id,
+            role="user",
+            content=request.message,
+            credits_used=credits_needed
+        )
+        user_dict = user_msg.model_dump()
+        user_dict['created_at'] = user_dict['created_at'].isoformat()
+        await message_buffer.add(request.project_id, user_dict)
+        
+        # Running summary of older turns plus the latest raw turns (code stripped)
+        chat_context = await chat_context_builder.build(request.project_id, exclude_id=user_msg.id)
         
         # Map models to actual API models
         if request.model in ["claude-4.5-sonnet-200k", "claude-4.5-sonnet-1m"]:
@@ -1544,35 +1635,29 @@ CURRENT PROJECT CONTEXT:
             has_code="Yes - user wants modifications" if has_code else "No - first generation"
         )
         
-        # Build conversation messages with history
-        messages = [{"role": "system", "content": system_prompt}]
+        if chat_context.summary:
+            system_prompt += f"\n\nCONVERSATION SO FAR (summary of earlier turns):\n{chat_context.summary}"
         
-        # Add recent chat history (excluding current message)
-        for msg in recent_messages[:-1]:  # Exclude the message we just saved
-            if msg['role'] in ['user', 'assistant']:
-                messages.append({
-                    "role": msg['role'],
-                    "content": msg['content'][:1000]  # Limit length to save tokens
-                })
-        
-        # Add current user message
-        current_prompt = request.message
+        # Existing code is edited with SEARCH/REPLACE blocks instead of being regenerated
+        current_code = project.get('generated_code') or ""
         if has_code:
-            current_prompt += f"\n\n[Context: Website already exists. User wants: {request.message}]"
-        
-        messages.append({"role": "user", "content": current_prompt})
-        
-        # Use OpenAI for GPT models (best quality)
-        if actual_model.startswith('gpt'):
-            completion = await openai_client.chat.completions.create(
-                model=actual_model,
-                messages=messages,
-                temperature=0.7,
-                max_tokens=4000
-            )
+            system_prompt += "\n\nEDIT MODE: The current code is attached to the request. Follow the edit format given there instead of outputting the complete file."
+        CHAT_PROMPT_TOKENS.labels('system').observe(estimate_tokens(system_prompt))
+        
+        # Build conversation messages with the recent raw turns
+        messages = [{"role": "system", "content": system_prompt}] + chat_context.turns
+        
+        async def complete(prompt: str) -> str:
+            if actual_model.startswith('gpt'):
+                # Use OpenAI for GPT models (best quality)
+                completion = await openai_client.chat.completions.create(
+                    model=actual_model,
+                    messages=messages + [{"role": "user", "content": prompt}],
+                    temperature=0.7,
+                    max_tokens=4000
+                )
+                return completion.choices[0].message.content
             
-            ai_response = completion.choices[0].message.content
-        else:
             # Use emergentintegrations for Claude
             api_key = os.environ.get('EMERGENT_LLM_KEY')
             chat_client = LlmChat(
@@ -1582,44 +1667,36 @@ CURRENT PROJECT CONTEXT:
             )
             chat_client.with_model("anthropic", actual_model)
             
-            # Send with context
-            user_message = UserMessage(text=current_prompt)
-            ai_response = await chat_client.send_message(user_message)
-        
-        # Extract HTML - improved extraction
-        html_code = ai_response.strip()
-        
-        # Try multiple extraction patterns
-        if "```html" in html_code.lower():
-            # Extract between ```html and ```
-            parts = html_code.lower().split("```html")
-            if len(parts) > 1:
-                html_code = html_code.split("```html", 1)[1].split("```")[0].strip()
-        elif "```" in html_code:
-            # Extract between ``` and ```
-            parts = html_code.split("```")
-            if len(parts) >= 3:
-                html_code = parts[1].strip()
-        
-        # If still has code blocks, try to clean
-        if html_code.startswith("```"):
-            html_code = html_code.split("```", 1)[1].split("```")[0].strip()
-        
-        # Ensure we have HTML
-        if not html_code.strip().lower().startswith("<!doctype") and not html_code.strip().lower().startswith("<html"):
-            # If no HTML structure, wrap content
-            if "<" in html_code and ">" in html_code:
-                html_code = f"""<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>{project['name']}</title>
-</head>
-<body>
-{html_code}
-</body>
-</html>"""
+            # Send with context (this client keeps no history, so the recent turns go in the prompt)
+            if chat_context.turns:
+                recent = "\n\n".join(f"{turn['role']}: {turn['content']}" for turn in chat_context.turns)
+                prompt = f"Recent conversation:\n{recent}\n\nCurrent request:\n{prompt}"
+            return await chat_client.send_message(UserMessage(text=prompt))
+        
+        if has_code:
+            code_context = f"{request.message}\n\n{build_code_context(current_code, request.message)}"
+            started = time.perf_counter()
+            ai_response = await complete(f"{code_context}\n\n{EDIT_PROTOCOL_INSTRUCTIONS}")
+            edit = apply_edit_response(current_code, ai_response, "index.html")
+            record_edit("chat", edit.mode, ai_response, time.perf_counter() - started)
+            
+            if edit.mode == "patch":
+                html_code = edit.content
+                ai_response = strip_edit_blocks(ai_response) or "Updated the website."
+            elif edit.mode == "full":
+                html_code = extract_html_document(ai_response, project['name'])
+            else:
+                # Patch did not apply cleanly: regenerate the whole page from the full code
+                logging.warning(f"Chat edit for project {request.project_id} fell back to full regeneration: {edit.error}")
+                started = time.perf_counter()
+                ai_response = await complete(
+                    f"{request.message}\n\nCurrent website code (index.html):\n```html\n{current_code}\n```\n\nApply the request and return the complete updated file in a ```html code block."
+                )
+                record_edit("chat", "fallback", ai_response, time.perf_counter() - started)
+                html_code = extract_html_document(ai_response, project['name'])
+        else:
+            ai_response = await complete(request.message)
+            html_code = extract_html_document(ai_response, project['name'])
         
         # Save AI message
         ai_msg = ChatMessage(
@@ -1629,7 +1706,7 @@ CURRENT PROJECT CONTEXT:
         )
         ai_dict = ai_msg.model_dump()
         ai_dict['created_at'] = ai_dict['created_at'].isoformat()
-        await db.messages.insert_one(ai_dict)
+        await message_buffer.add(request.project_id, ai_dict, terminal=True)
         
         # Update project code
         await db.projects.update_one(
@@ -1639,6 +1716,10 @@ CURRENT PROJECT CONTEXT:
                 "updated_at": datetime.now(timezone.utc).isoformat()
             }}
         )
+        await invalidate_public_project(request.project_id)
+        chat_context_builder.schedule_update(request.project_id)
+        
+        await hot_credits.complete_transaction(user_id, transaction_id)
         
         return {
             "user_message": user_msg.model_dump(),
@@ -1647,6 +1728,7 @@ CURRENT PROJECT CONTEXT:
         }
     
     except Exception as e:
+        await hot_credits.refund_transaction(user_id, transaction_id, f"Chat failed - full refund: {str(e)}")
         raise HTTPException(status_code=500, detail=f"AI error: {str(e)}")
 
 # New Multi-Agent Website Builder Endpoint
@@ -1704,16 +1786,8 @@ async def build_with_agents(request: MultiAgentBuildRequest, user_id: str = Depe
     
     estimated_cost = cost_breakdown['total']
     
-    # Check if user has enough credits
-    user_balance = await credit_manager.get_user_balance(user_id)
-    if user_balance < estimated_cost:
-        raise HTTPException(
-            status_code=402,
-            detail=f"Insufficient credits. Multi-agent build requires {estimated_cost} credits. You have {user_balance}. Breakdown: {cost_breakdown['breakdown']}"
-        )
-    
-    # Reserve credits upfront
-    reservation = await credit_manager.reserve_credits(
+    # Check and reserve credits upfront (atomic on the hot balance)
+    reservation = await hot_credits.reserve_credits(
         user_id,
         estimated_cost,
         "multi_agent_build",
@@ -1726,7 +1800,10 @@ async def build_with_agents(request: MultiAgentBuildRequest, user_id: str = Depe
     )
     
     if reservation['status'] != 'success':
-        raise HTTPException(status_code=402, detail="Failed to reserve credits")
+        raise HTTPException(
+            status_code=402,
+            detail=f"Insufficient credits. Multi-agent build requires {estimated_cost} credits. You have {reservation['available']}. Breakdown: {cost_breakdown['breakdown']}"
+        )
     
     transaction_id = reservation['transaction_id']
     
@@ -1763,7 +1840,8 @@ async def build_with_agents(request: MultiAgentBuildRequest, user_id: str = Depe
             actual_cost = actual_cost_breakdown['total']
             
             # Complete transaction (will refund difference if actual < estimated)
-            completion = await credit_manager.complete_transaction(
+            completion = await hot_credits.complete_transaction(
+                user_id,
                 transaction_id,
                 actual_cost
             )
@@ -1779,9 +1857,10 @@ async def build_with_agents(request: MultiAgentBuildRequest, user_id: str = Depe
                     "updated_at": datetime.now(timezone.utc).isoformat()
                 }}
             )
+            await invalidate_public_project(request.project_id)
             
             # Get updated balance
-            new_balance = await credit_manager.get_user_balance(user_id)
+            new_balance = await hot_credits.get_balance(user_id)
             
             return {
                 "status": "success",
@@ -1790,27 +1869,27 @@ async def build_with_agents(request: MultiAgentBuildRequest, user_id: str = Depe
                 "backend_code": result.get('backend_code', ''),
                 "message": "✅ Website built successfully with multi-agent system!",
                 "credits_used": actual_cost,
-                "credits_refunded": completion['refunded'],
+                "credits_refunded": completion.get('refunded', 0),
                 "remaining_balance": new_balance,
                 "cost_breakdown": actual_cost_breakdown
             }
         else:
             # Full refund on failure
-            await credit_manager.refund_credits(
+            await hot_credits.refund_transaction(
                 user_id,
-                estimated_cost,
-                "Build failed - full refund",
-                {"transaction_id": transaction_id, "error": result.get('error')}
+                transaction_id,
+                f"Build failed - full refund: {result.get('error')}"
             )
             raise HTTPException(status_code=500, detail=result.get('error', 'Build failed'))
     
+    except HTTPException:
+        raise
     except Exception as e:
-        # Full refund on exception
-        await credit_manager.refund_credits(
+        # Full refund on exception (no-op if the reservation was already settled)
+        await hot_credits.refund_transaction(
             user_id,
-            estimated_cost,
-            f"Build exception - full refund: {str(e)}",
-            {"transaction_id": transaction_id}
+            transaction_id,
+            f"Build exception - full refund: {str(e)}"
         )
         raise HTTPException(status_code=500, detail=f"Multi-agent build error: {str(e)}")
 
@@ -1884,16 +1963,8 @@ async def build_fullstack_application(
     
     estimated_cost = cost_breakdown['total']
     
-    # Check if user has enough credits
-    user_balance = await credit_manager.get_user_balance(user_id)
-    if user_balance < estimated_cost:
-        raise HTTPException(
-            status_code=402,
-            detail=f"Insufficient credits. Full-stack build requires {estimated_cost} credits. You have {user_balance}. Breakdown: Planning (12) + Frontend (16) + Backend (16) + Database (10) + Testing (10) = {estimated_cost}"
-        )
-    
-    # Reserve credits upfront
-    reservation = await credit_manager.reserve_credits(
+    # Check and reserve credits upfront (atomic on the hot balance)
+    reservation = await hot_credits.reserve_credits(
         user_id,
         estimated_cost,
         "fullstack_build",
@@ -1906,7 +1977,10 @@ async def build_fullstack_application(
     )
     
     if reservation['status'] != 'success':
-        raise HTTPException(status_code=402, detail="Failed to reserve credits")
+        raise HTTPException(
+            status_code=402,
+            detail=f"Insufficient credits. Full-stack build requires {estimated_cost} credits. You have {reservation['available']}. Breakdown: Planning (12) + Frontend (16) + Backend (16) + Database (10) + Testing (10) = {estimated_cost}"
+        )
     
     transaction_id = reservation['transaction_id']
     
@@ -1942,25 +2016,13 @@ async def build_fullstack_application(
             actual_cost = estimated_cost
             
             # Complete the transaction
-            completion_result = await credit_manager.complete_transaction(
+            # Complete the transaction (refunds any unused part of the reservation)
+            completion_result = await hot_credits.complete_transaction(
+                user_id,
                 transaction_id,
-                actual_cost,
-                {
-                    "agents_used": [a.value for a in agents_to_use],
-                    "total_files": result.get('total_files', 0),
-                    "tech_stack": result.get('tech_stack', {})
-                }
+                actual_cost
             )
-            
-            # Calculate refund if any
-            refund_amount = estimated_cost - actual_cost
-            if refund_amount > 0:
-                await credit_manager.refund_credits(
-                    user_id,
-                    refund_amount,
-                    "Full-stack build refund (unused credits)",
-                    {"transaction_id": transaction_id}
-                )
+            refund_amount = completion_result.get('refunded', 0)
             
             # Update project with generated code
             await db.projects.update_one(
@@ -1975,6 +2037,7 @@ async def build_fullstack_application(
                     "updated_at": datetime.utcnow().isoformat()
                 }}
             )
+            await invalidate_public_project(request.project_id)
             
             # Return success with credit breakdown
             return {
@@ -1985,27 +2048,27 @@ async def build_fullstack_application(
                     "estimated": estimated_cost,
                     "used": actual_cost,
                     "refunded": refund_amount,
-                    "remaining": user_balance - actual_cost
+                    "remaining": completion_result.get('remaining_balance')
                 },
                 "message": f"✅ Full-stack application generated! {result.get('total_files', 0)} files created."
             }
         else:
             # Full refund on failure
-            await credit_manager.refund_credits(
+            await hot_credits.refund_transaction(
                 user_id,
-                estimated_cost,
-                "Full-stack build failed - full refund",
-                {"transaction_id": transaction_id, "error": result.get('error')}
+                transaction_id,
+                f"Full-stack build failed - full refund: {result.get('error')}"
             )
             raise HTTPException(status_code=500, detail=result.get('error', 'Full-stack build failed'))
     
+    except HTTPException:
+        raise
     except Exception as e:
-        # Full refund on exception
-        await credit_manager.refund_credits(
+        # Full refund on exception (no-op if the reservation was already settled)
+        await hot_credits.refund_transaction(
             user_id,
-            estimated_cost,
-            f"Full-stack build exception - full refund: {str(e)}",
-            {"transaction_id": transaction_id}
+            transaction_id,
+            f"Full-stack build exception - full refund: {str(e)}"
         )
         raise HTTPException(status_code=500, detail=f"Full-stack build error: {str(e)}")
 
@@ -2110,6 +2173,30 @@ async def delete_workspace(
     workspace_manager = get_workspace_manager()
     return await workspace_manager.delete_workspace(project_id)
 
+@api_router.post("/workspaces/{project_id}/sync")
+async def sync_workspace(
+    project_id: str,
+    prune: bool = False,
+    force: bool = False,
+    user_id: str = Depends(get_current_user)
+):
+    """Push the project's generated files into its running workspace (changed files only, unless force)"""
+    project = await db.projects.find_one({"id": project_id, "user_id": user_id})
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+    
+    generated_code = project.get('generated_code', '')
+    if not generated_code:
+        raise HTTPException(status_code=400, detail="No code generated yet")
+    
+    try:
+        files = json.loads(generated_code) if isinstance(generated_code, str) else generated_code
+    except ValueError:
+        files = {"index.html": generated_code}
+    
+    workspace_manager = get_workspace_manager()
+    return await workspace_manager.sync_workspace(project_id, files, prune=prune, force=force)
+
 @api_router.get("/workspaces/{project_id}/logs")
 async def get_workspace_logs(
     project_id: str,
@@ -2147,6 +2234,23 @@ async def read_file(
     fs_manager = get_file_system_manager()
     return await fs_manager.read_file(user_id, request.project_id, request.file_path)
 
+@api_router.get("/files/raw")
+async def read_file_raw(
+    project_id: str,
+    file_path: str,
+    user_id: str = Depends(get_current_user)
+):
+    """Stream a workspace file in chunks (binary and large files)"""
+    fs_manager = get_file_system_manager()
+    result = await fs_manager.open_file_stream(user_id, project_id, file_path)
+    if result["status"] != "success":
+        raise HTTPException(status_code=404, detail=result["message"])
+    return StreamingResponse(
+        result["chunks"],
+        media_type=result["mime_type"],
+        headers={"Content-Length": str(result["size"])}
+    )
+
 @api_router.post("/files/write")
 async def write_file(
     request: FileWriteRequest,
@@ -2177,21 +2281,32 @@ async def list_directory(
 @api_router.post("/files/tree")
 async def get_file_tree(
     project_id: str,
+    path: str = "",
+    depth: int = 5,
+    since_version: Optional[str] = None,
     user_id: str = Depends(get_current_user)
 ):
-    """Get complete file tree structure"""
+    """Get file tree structure (subtree by path/depth; not_modified when since_version matches)"""
     fs_manager = get_file_system_manager()
-    return await fs_manager.get_file_tree(user_id, project_id)
+    return await fs_manager.get_file_tree(user_id, project_id, depth, path, since_version)
 
 @api_router.post("/files/search")
 async def search_files(
     project_id: str,
     query: str,
+    file_pattern: str = "*",
+    content: bool = False,
+    regex: bool = False,
+    case_sensitive: bool = False,
+    max_results: int = 200,
     user_id: str = Depends(get_current_user)
 ):
-    """Search for files"""
+    """Search file names, or file contents (substring/regex, line-level hits) with content=true"""
     fs_manager = get_file_system_manager()
-    return await fs_manager.search_files(user_id, project_id, query)
+    return await fs_manager.search_files(
+        user_id, project_id, query, file_pattern,
+        content=content, regex=regex, case_sensitive=case_sensitive, max_results=min(max_results, 1000)
+    )
 
 
 # ============================================================================
@@ -3035,11 +3150,8 @@ async def list_gke_workspaces(user_id: str = Depends(get_current_user)):
 # Credit System Endpoints
 @api_router.get("/credits/balance")
 async def get_credit_balance_mongodb(user_id: str = Depends(get_current_user)):
-    """Get current credit balance - MongoDB"""
-    user = await db.users.find_one({"id": user_id}, {"_id": 0, "credits": 1})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    return {"credits": user.get("credits", 0)}
+    """Get current credit balance (hot balance in Redis, hydrated from MongoDB)"""
+    return {"credits": await hot_credits.get_balance(user_id)}
 
 # @api_router.get("/credits/balance")
 # async def get_credit_balance(user_id: str = Depends(get_current_user), db=Depends(get_db)):
@@ -3280,51 +3392,60 @@ async def validate_website(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Validation failed: {str(e)}")
 
-# Health check endpoint
+# Health checks: dependencies are probed in the background; these endpoints
+# only read the cached snapshot
+health_prober = create_health_prober(db, cache.redis, docker_manager)
+
+
 @app.get("/api/health")
 async def health_check():
-    """Health check endpoint for monitoring - MongoDB only"""
-    health_status = {
-        "status": "healthy",
+    """Cached health report for monitoring (see health_prober for the checks)"""
+    snapshot = health_prober.snapshot
+    return {
+        "status": snapshot['status'],
         "service": "autowebiq-backend",
         "timestamp": datetime.now(timezone.utc).isoformat(),
-        "databases": {},
-        "services": {}
+        "checked_at": snapshot['checked_at'],
+        "required": health_prober.required,
+        "checks": snapshot['checks']
     }
-    
-    try:
-        # Check MongoDB connection
-        await db.command('ping')
-        health_status["databases"]["mongodb"] = "connected"
-    except Exception as e:
-        health_status["databases"]["mongodb"] = f"error: {str(e)}"
-        health_status["status"] = "degraded"
-    
-    # PostgreSQL, Redis, and Celery are not used in production (MongoDB-only mode)
-    health_status["databases"]["postgresql"] = "not configured (using MongoDB)"
-    health_status["services"]["redis"] = "not configured (not required)"
-    health_status["services"]["celery"] = "not configured (not required)"
-    
-    return health_status
+
+
+@app.get("/api/health/live")
+async def liveness():
+    """Liveness: the event loop is serving requests"""
+    return {"status": "alive"}
+
+
+@app.get("/api/health/ready")
+async def readiness():
+    """Readiness: required dependencies passed the latest background probe"""
+    state = health_prober.readiness()
+    return JSONResponse(status_code=200 if state['ready'] else 503, content=state)
+
+
+# Prometheus metrics (database latency, pool saturation, slow statements)
+@app.get("/api/metrics")
+async def metrics():
+    """Prometheus scrape endpoint"""
+    from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
 
 # ==================== Template & Component Endpoints ====================
 
+# Serialized once per catalog version and served precompressed with ETags
+templates_catalog = Catalog("templates", db.templates)
+components_catalog = Catalog("components", db.components)
+
+
 @app.get("/api/templates")
-async def get_templates():
-    """Get all available templates"""
+async def get_templates(request: Request, fields: Optional[str] = None):
+    """Get all available templates (`fields=id,name,...` returns only those fields)"""
     try:
-        templates = await db.templates.find().to_list(length=None)
-        
-        # Convert ObjectId to string for JSON serialization
-        for template in templates:
-            template['_id'] = str(template['_id'])
-        
-        return {
-            "success": True,
-            "count": len(templates),
-            "templates": templates
-        }
+        return await templates_catalog.respond(request, fields)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching templates: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error fetching templates: {str(e)}")
@@ -3353,20 +3474,12 @@ async def get_template(template_id: str):
 
 
 @app.get("/api/components")
-async def get_components():
-    """Get all available UI components"""
+async def get_components(request: Request, fields: Optional[str] = None):
+    """Get all available UI components (`fields=id,name,...` returns only those fields)"""
     try:
-        components = await db.components.find().to_list(length=None)
-        
-        # Convert ObjectId to string for JSON serialization
-        for component in components:
-            component['_id'] = str(component['_id'])
-        
-        return {
-            "success": True,
-            "count": len(components),
-            "components": components
-        }
+        return await components_catalog.respond(request, fields)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching components: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error fetching components: {str(e)}")
@@ -3435,5 +3548,13 @@ logger = logging.getLogger(__name__)
 async def shutdown_db():
     """Cleanup database connections on shutdown"""
     from database import close_db
+    await message_buffer.close()
+    await project_message_buffer.close()
+    await ledger_persister.stop()
+    await hot_credits.stop()
+    await principal_cache.stop_listener()
+    await cache.stop_listener()
+    await health_prober.stop()
+    await get_workspace_manager().stop_pool()
     await close_db()
     print("✅ Database connections closed")
\ No newline at end of file
@@ -7,9 +7,13 @@ from datetime import datetime, timezone
 import re
 import os
 from motor.motor_asyncio import AsyncIOMotorClient
+from db_metrics import mongo_command_listener
 
 # MongoDB connection for templates
-mongo_client = AsyncIOMotorClient(os.environ.get('MONGO_URL', 'mongodb://localhost:27017'))
+mongo_client = AsyncIOMotorClient(
+    os.environ.get('MONGO_URL', 'mongodb://localhost:27017'),
+    event_listeners=[mongo_command_listener]
+)
 db = mongo_client[os.environ.get('DB_NAME', 'autowebiq_db')]
 
 class TemplateLibrary:
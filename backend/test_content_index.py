@@ -0,0 +1,61 @@
+# Test Script for the Workspace Content Index
+# Checks that the regex prefilter (required_literals) never rules out a file
+# that re.search would match, and that search finds those matches
+
+import os
+import re
+import tempfile
+
+from content_index import WorkspaceContentIndex, required_literals
+
+# (pattern, text it matches)
+CASES = [
+    (r'\x41BCD', 'xABCDx'),
+    (r'\101bcd', 'Abcd'),
+    (r'Abcd', 'Abcd'),
+    (r'\N{LATIN CAPITAL LETTER A}bcd', 'Abcd'),
+    (r'(?x) foo bar', 'foobar'),
+    (r'(?i:HELLO) world', 'hello world'),
+    (r'(a[)]b)c', 'a)bc'),
+    (r'(abc)\1xyz', 'abcabcxyz'),
+    (r'color:\s*red', 'color:   red'),
+    (r'def\s+\w+\(', 'def main('),
+    (r'colou?r', 'color'),
+    (r'[abc]def', 'bdef'),
+    (r'ab{0}cde', 'acde'),
+]
+
+
+def test_required_literals():
+    """Every required literal appears in a string the pattern matches"""
+    for pattern, text in CASES:
+        assert re.search(pattern, text), (pattern, text)
+        for literal in required_literals(pattern):
+            assert literal.lower() in text.lower(), (pattern, literal)
+    print(f"✅ {len(CASES)} prefilter cases keep their matches")
+
+    # Plain patterns are still filtered
+    assert required_literals(r'color:\s*red') == ['color:', 'red']
+    assert required_literals(r'def\s+\w+\(') == ['def']
+    print("✅ Literal runs extracted from plain patterns")
+
+
+def test_regex_search():
+    """search(regex=True) finds the matches end to end"""
+    with tempfile.TemporaryDirectory() as root:
+        for number, (_, text) in enumerate(CASES):
+            with open(os.path.join(root, f"case{number}.txt"), 'w') as f:
+                f.write(text + "\n")
+        index = WorkspaceContentIndex(root)
+        for number in range(len(CASES)):
+            index.index_file(f"case{number}.txt")
+        for number, (pattern, _) in enumerate(CASES):
+            paths = {hit["path"] for hit in index.search(pattern, regex=True, case_sensitive=True)["hits"]}
+            assert f"case{number}.txt" in paths, (pattern, paths)
+    print("✅ Regex search returns every case")
+
+
+if __name__ == "__main__":
+    test_required_literals()
+    test_regex_search()
+    print("\n✅ All content index checks passed")
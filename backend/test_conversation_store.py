@@ -0,0 +1,76 @@
+# Test Script for the Conversation Context Store
+# Runs conversation_store.py against Redis (REDIS_URL): concurrent saves from
+# two workers, and a turn whose save failed surviving the next load
+
+import asyncio
+import os
+import uuid
+
+import redis.asyncio as redis
+from redis.exceptions import RedisError
+
+from conversation_store import ConversationStore
+
+
+async def test_conversation_store():
+    """Compare-and-set saves and recovery after a failed write"""
+    client = redis.from_url(os.environ.get('REDIS_URL', 'redis://localhost:6379/0'))
+    user_id, project_id = f"test-{uuid.uuid4().hex[:8]}", "project"
+    worker_a, worker_b = ConversationStore(client), ConversationStore(client)
+
+    print("=" * 60)
+    print("CONVERSATION STORE TEST")
+    print("=" * 60)
+
+    try:
+        # 1. Two workers handle a turn on the same project concurrently
+        context = await worker_a.load(project_id, user_id)
+        context.add_message("user", "hello")
+        await worker_a.save(context)
+
+        turn_a = await worker_a.load(project_id, user_id)
+        turn_b = await worker_b.load(project_id, user_id)
+        turn_a.add_message("user", "turn A")
+        turn_b.add_message("user", "turn B")
+        await worker_a.save(turn_a)
+        await worker_b.save(turn_b)
+
+        stored = await ConversationStore(client).load(project_id, user_id)
+        contents = [message["content"] for message in stored.messages]
+        assert contents == ["hello", "turn A", "turn B"], contents
+        history = [message["content"] for message in await worker_a.history(project_id, user_id)]
+        assert history == contents, history
+        print("✅ Concurrent saves kept both turns")
+
+        # 2. A save fails; the next load must not drop the unsaved turn
+        context = await worker_a.load(project_id, user_id)
+        context.add_message("user", "turn C")
+        save_script = worker_a._save_context
+
+        async def failing_save(*args, **kwargs):
+            raise RedisError("simulated outage")
+
+        worker_a._save_context = failing_save
+        await worker_a.save(context)
+        worker_a._save_context = save_script
+
+        context = await worker_a.load(project_id, user_id)
+        contents = [message["content"] for message in context.messages]
+        assert contents == ["hello", "turn A", "turn B", "turn C"], contents
+        assert len(context.unsaved_messages) == 1, context.unsaved_messages
+        await worker_a.save(context)
+
+        stored = await ConversationStore(client).load(project_id, user_id)
+        assert [message["content"] for message in stored.messages] == contents
+        history = [message["content"] for message in await worker_a.history(project_id, user_id)]
+        assert history == contents, history
+        print("✅ Turn from a failed save replayed on the next load")
+    finally:
+        await worker_a.delete(project_id, user_id)
+        await client.aclose()
+
+    print("\n✅ All conversation store checks passed")
+
+
+if __name__ == "__main__":
+    asyncio.run(test_conversation_store())
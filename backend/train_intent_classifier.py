@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Intent Classifier Training
+Fits the hashed n-gram logistic regression used by intent_classifier.py
+from labelled requests: the seed set plus requests logged in production
+(INTENT_SAMPLE_LOG, one {"message", "label"} JSON object per line, labelled
+by the LLM analyzer). Reports cross-validated accuracy and how many requests
+would skip the LLM at a candidate confidence threshold, then writes the model:
+
+    python train_intent_classifier.py intent_seed.jsonl /var/log/autowebiq/intent_samples.jsonl --threshold 0.85
+
+The service runs the classifier in shadow mode until INTENT_CONFIDENCE_THRESHOLD
+is set to a threshold this report supports on logged requests.
+"""
+
+import argparse
+import json
+import math
+import random
+from collections import defaultdict
+
+from intent_classifier import (
+    FEATURE_BUCKETS, INTENT_LABELS, INTENT_MODEL_PATH,
+    IntentClassifier, bucket, extract_features
+)
+
+
+def load_samples(paths):
+    samples = []
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                sample = json.loads(line)
+                if sample.get("label") in INTENT_LABELS and sample.get("message"):
+                    samples.append((sample["message"], sample["label"]))
+    # Latest label wins for repeated messages
+    return list({message.strip().lower(): (message, label) for message, label in samples}.values())
+
+
+def train(samples, epochs: int, learning_rate: float, l2: float, seed: int = 7):
+    """Plain SGD on the softmax cross-entropy; returns sparse weights and biases"""
+    rng = random.Random(seed)
+    weights = {label: defaultdict(float) for label in INTENT_LABELS}
+    bias = {label: 0.0 for label in INTENT_LABELS}
+    encoded = [([bucket(feature) for feature in extract_features(message)], label) for message, label in samples]
+
+    for epoch in range(epochs):
+        rng.shuffle(encoded)
+        rate = learning_rate / (1 + epoch * 0.1)
+        for indexes, target in encoded:
+            scores = {label: bias[label] + sum(weights[label][i] for i in indexes) for label in INTENT_LABELS}
+            top = max(scores.values())
+            exps = {label: math.exp(score - top) for label, score in scores.items()}
+            total = sum(exps.values())
+            for label in INTENT_LABELS:
+                gradient = exps[label] / total - (1.0 if label == target else 0.0)
+                bias[label] -= rate * gradient
+                for i in indexes:
+                    weights[label][i] -= rate * (gradient + l2 * weights[label][i])
+
+    return {
+        "labels": INTENT_LABELS,
+        "buckets": FEATURE_BUCKETS,
+        "weights": {
+            label: {str(i): round(w, 4) for i, w in sorted(label_weights.items()) if abs(w) >= 1e-4}
+            for label, label_weights in weights.items()
+        },
+        "bias": {label: round(value, 4) for label, value in bias.items()},
+    }
+
+
+def classifier_from(model) -> IntentClassifier:
+    classifier = IntentClassifier(model_path=None)
+    classifier.labels = model["labels"]
+    classifier.weights = {
+        label: {int(i): w for i, w in weights.items()} for label, weights in model["weights"].items()
+    }
+    classifier.bias = model["bias"]
+    return classifier
+
+
+def cross_validate(samples, folds: int, threshold: float, **options):
+    samples = samples[:]
+    random.Random(11).shuffle(samples)
+    correct = confident = confident_correct = 0
+    for fold in range(folds):
+        held_out = samples[fold::folds]
+        training = [sample for i, sample in enumerate(samples) if i % folds != fold]
+        classifier = classifier_from(train(training, **options))
+        for message, label in held_out:
+            prediction = classifier.predict(message)
+            correct += prediction.label == label
+            if prediction.confidence >= threshold:
+                confident += 1
+                confident_correct += prediction.label == label
+    total = len(samples)
+    print(f"📊 {folds}-fold accuracy: {correct / total:.1%} ({correct}/{total})")
+    if confident:
+        print(f"⚡ Would skip the LLM for {confident / total:.1%} of requests "
+              f"(threshold {threshold}), {confident_correct / confident:.1%} of those correct")
+    else:
+        print(f"⚡ No request reaches the {threshold} threshold")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the local intent classifier")
+    parser.add_argument('samples', nargs='+', help="JSONL files of {\"message\", \"label\"}")
+    parser.add_argument('--output', default=INTENT_MODEL_PATH)
+    parser.add_argument('--epochs', type=int, default=40)
+    parser.add_argument('--learning-rate', type=float, default=0.5)
+    parser.add_argument('--l2', type=float, default=0.001)
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--threshold', type=float, default=0.85,
+                        help="candidate INTENT_CONFIDENCE_THRESHOLD to report skip rate and accuracy for")
+    args = parser.parse_args()
+
+    samples = load_samples(args.samples)
+    counts = defaultdict(int)
+    for _, label in samples:
+        counts[label] += 1
+    print(f"📚 {len(samples)} samples: " + ", ".join(f"{label}={counts[label]}" for label in INTENT_LABELS))
+
+    options = dict(epochs=args.epochs, learning_rate=args.learning_rate, l2=args.l2)
+    if args.folds > 1:
+        cross_validate(samples, args.folds, args.threshold, **options)
+
+    model = train(samples, **options)
+    with open(args.output, 'w') as f:
+        json.dump(model, f, separators=(',', ':'))
+    print(f"✅ Model written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+# User Stats - Incrementally Maintained Counters
+# Keeps user_stats in step with projects and credit_transactions so the
+# stats endpoint is a single primary-key read
+
+from sqlalchemy import select, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import AsyncSessionLocal, UserStats
+from typing import Dict, Optional
+from datetime import datetime, timezone
+
+COMPLETED_STATUS = 'completed'
+DEDUCTION_TYPE = 'deduction'
+
+
+async def _increment(
+    session: AsyncSession,
+    user_id: str,
+    total_projects: int = 0,
+    completed_projects: int = 0,
+    credits_spent: int = 0
+):
+    """Upsert deltas into the user's stats row inside the caller's transaction"""
+    if not (total_projects or completed_projects or credits_spent):
+        return
+    now = datetime.now(timezone.utc)
+    stmt = insert(UserStats).values(
+        user_id=user_id,
+        total_projects=total_projects,
+        completed_projects=completed_projects,
+        credits_spent=credits_spent,
+        updated_at=now
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[UserStats.user_id],
+        set_={
+            'total_projects': UserStats.total_projects + stmt.excluded.total_projects,
+            'completed_projects': UserStats.completed_projects + stmt.excluded.completed_projects,
+            'credits_spent': UserStats.credits_spent + stmt.excluded.credits_spent,
+            'updated_at': now
+        }
+    )
+    await session.execute(stmt)
+
+
+async def record_project_created(session: AsyncSession, user_id: str, status: str = 'draft'):
+    """Call in the same transaction that inserts the project"""
+    await _increment(
+        session, user_id,
+        total_projects=1,
+        completed_projects=1 if status == COMPLETED_STATUS else 0
+    )
+
+
+async def record_project_status_change(
+    session: AsyncSession,
+    user_id: str,
+    old_status: Optional[str],
+    new_status: str
+):
+    """Call in the same transaction that updates the project's status"""
+    delta = int(new_status == COMPLETED_STATUS) - int(old_status == COMPLETED_STATUS)
+    await _increment(session, user_id, completed_projects=delta)
+
+
+async def record_project_deleted(session: AsyncSession, user_id: str, status: Optional[str]):
+    """Call in the same transaction that deletes the project"""
+    await _increment(
+        session, user_id,
+        total_projects=-1,
+        completed_projects=-1 if status == COMPLETED_STATUS else 0
+    )
+
+
+async def record_ledger_entry(session: AsyncSession, user_id: str, transaction_type: str, amount: int):
+    """Call in the same transaction that writes a credit_transactions row"""
+    if transaction_type == DEDUCTION_TYPE:
+        await _increment(session, user_id, credits_spent=abs(amount))
+
+
+async def get_user_stats_row(session: AsyncSession, user_id: str) -> Dict:
+    """
+    Primary-key read of a user's stats.
+    
+    `session` may be a read-only (replica) session. A missing row is
+    backfilled once on the primary.
+    """
+    result = await session.execute(
+        select(UserStats).where(UserStats.user_id == user_id)
+    )
+    stats = result.scalar_one_or_none()
+    
+    if stats is None:
+        async with AsyncSessionLocal() as primary:
+            await reconcile_user_stats(primary, user_id=user_id)
+            await primary.commit()
+            result = await primary.execute(
+                select(UserStats).where(UserStats.user_id == user_id)
+            )
+            stats = result.scalar_one_or_none()
+    
+    if stats is None:
+        return {'total_projects': 0, 'completed_projects': 0, 'credits_spent': 0}
+    
+    return {
+        'total_projects': stats.total_projects,
+        'completed_projects': stats.completed_projects,
+        'credits_spent': stats.credits_spent
+    }
+
+
+async def reconcile_user_stats(session: AsyncSession, user_id: Optional[str] = None) -> int:
+    """
+    Recompute stats from source tables and fix any rows that drifted.
+    
+    Returns the number of rows inserted or corrected. The caller commits.
+    """
+    user_filter = "WHERE u.id = :user_id" if user_id else ""
+    result = await session.execute(text(f"""
+        INSERT INTO user_stats (user_id, total_projects, completed_projects, credits_spent, updated_at)
+        SELECT
+            u.id,
+            COALESCE(p.total, 0),
+            COALESCE(p.completed, 0),
+            COALESCE(t.spent, 0),
+            now()
+        FROM users u
+        LEFT JOIN (
+            SELECT user_id,
+                   COUNT(*) AS total,
+                   COUNT(*) FILTER (WHERE status = '{COMPLETED_STATUS}') AS completed
+            FROM projects
+            GROUP BY user_id
+        ) p ON p.user_id = u.id
+        LEFT JOIN (
+            SELECT user_id, SUM(ABS(amount)) AS spent
+            FROM credit_transactions
+            WHERE transaction_type = '{DEDUCTION_TYPE}'
+            GROUP BY user_id
+        ) t ON t.user_id = u.id
+        {user_filter}
+        ON CONFLICT (user_id) DO UPDATE SET
+            total_projects = EXCLUDED.total_projects,
+            completed_projects = EXCLUDED.completed_projects,
+            credits_spent = EXCLUDED.credits_spent,
+            updated_at = now()
+        WHERE (user_stats.total_projects, user_stats.completed_projects, user_stats.credits_spent)
+              IS DISTINCT FROM
+              (EXCLUDED.total_projects, EXCLUDED.completed_projects, EXCLUDED.credits_spent)
+    """), {'user_id': user_id} if user_id else {})
+    return result.rowcount or 0
@@ -1,5 +1,6 @@
 # Redis Cache Warming Script
 # Pre-loads frequently accessed data into Redis cache
+# Writes are pipelined (mset_with_ttl), so warming takes a few round trips
 
 import asyncio
 from redis_cache import cache
@@ -13,36 +14,33 @@ async def warm_cache():
     
     # 1. Cache all templates
     print("\n📚 Caching templates...")
-    templates = await mongo_db.templates.find({}).to_list(length=None)
-    cached_count = 0
-    for template in templates:
-        template_id = template.get('template_id')
-        if template_id:
-            # Remove MongoDB _id before caching
-            template.pop('_id', None)
-            await cache.set_template(template_id, template, ttl=7200)  # 2 hours
-            cached_count += 1
+    templates = await mongo_db.templates.find({}, {'_id': 0}).to_list(length=None)
+    cached_count = await cache.mset_with_ttl(
+        {f"template:{t['template_id']}": t for t in templates if t.get('template_id')},
+        ttl=7200  # 2 hours
+    )
     print(f"✅ Cached {cached_count} templates")
     
     # 2. Cache all components
     print("\n🧩 Caching components...")
-    components = await mongo_db.components.find({}).to_list(length=None)
-    cached_count = 0
-    for component in components:
-        component_id = component.get('component_id')
-        if component_id:
-            component.pop('_id', None)
-            await cache.set_component(component_id, component, ttl=7200)
-            cached_count += 1
-    print(f"✅ Cached {cached_count} components")
+    components = await mongo_db.components.find({}, {'_id': 0}).to_list(length=None)
+    component_count = await cache.mset_with_ttl(
+        {f"component:{c['component_id']}": c for c in components if c.get('component_id')},
+        ttl=7200
+    )
+    print(f"✅ Cached {component_count} components")
     
     # 3. Cache user credits
     print("\n💳 Caching user credits...")
     async with AsyncSessionLocal() as session:
         result = await session.execute(select(User.id, User.credits))
         users = result.all()
-        for user_id, credits in users:
-            await cache.set_user_credits(user_id, credits, ttl=300)  # 5 minutes
+        # Tagged per user so invalidate_user_cache drops them without a keyspace scan
+        await cache.mset_with_ttl(
+            {f"user:{user_id}:credits": credits for user_id, credits in users},
+            ttl=300,  # 5 minutes
+            tags={f"user:{user_id}:credits": [f"user:{user_id}"] for user_id, _ in users}
+        )
     print(f"✅ Cached credits for {len(users)} users")
     
     # 4. Cache system stats
@@ -52,20 +50,18 @@ async def warm_cache():
         total_users = await session.execute(select(func.count(User.id)))
         user_count = total_users.scalar()
         await cache.set('stats:total_users', user_count, ttl=600)
-        
-        # Total templates
-        template_count = await mongo_db.templates.count_documents({})
-        await cache.set('stats:total_templates', template_count, ttl=3600)
-        
-        # Total components
-        component_count = await mongo_db.components.count_documents({})
-        await cache.set('stats:total_components', component_count, ttl=3600)
+    
+    # Template and component totals in one round trip
+    await cache.mset_with_ttl({
+        'stats:total_templates': await mongo_db.templates.count_documents({}),
+        'stats:total_components': await mongo_db.components.count_documents({}),
+    }, ttl=3600)
     
     print(f"✅ Cached system stats")
     
     print("\n🎉 Cache warming complete!")
     print(f"   Templates: {cached_count}")
-    print(f"   Components: {len(components)}")
+    print(f"   Components: {component_count}")
     print(f"   User credits: {len(users)}")
 
 if __name__ == "__main__":
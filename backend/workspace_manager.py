@@ -11,6 +11,9 @@ from datetime import datetime
 from pathlib import Path
 import random
 
+from container_sync import container_sync
+from workspace_pool import WORKSPACE_IMAGE, WORKSPACE_POOL_ENABLED, WorkspacePool
+
 class WorkspaceManager:
     """
     Manages Docker-based development workspaces for projects.
@@ -23,10 +26,22 @@ class WorkspaceManager:
             self.base_port = 4000  # Starting port for workspaces
             self.max_port = 5000   # Max port range
             self.workspaces: Dict[str, Dict] = {}  # project_id -> workspace info
+            # Warm containers claimed by create_workspace; refilled once start_pool() runs
+            self.pool = WorkspacePool(self.client, self._allocate_port) if WORKSPACE_POOL_ENABLED else None
             print("✅ Docker client initialized")
         except Exception as e:
             print(f"⚠️ Docker not available: {e}")
             self.client = None
+            self.pool = None
+    
+    def start_pool(self):
+        """Start refilling the warm container pool (needs a running event loop)"""
+        if self.pool:
+            self.pool.start()
+    
+    async def stop_pool(self):
+        if self.pool:
+            await self.pool.stop()
     
     async def create_workspace(
         self, 
@@ -61,74 +76,66 @@ class WorkspaceManager:
                 "message": "Docker is not available. Live preview requires Docker."
             }
         
+        slot = None
         try:
-            # Create workspace directory
             workspace_path = f"/tmp/workspaces/{user_id}/{project_id}"
-            os.makedirs(workspace_path, exist_ok=True)
-            
-            # Write all files to workspace
-            for file_path, content in files.items():
-                full_path = os.path.join(workspace_path, file_path)
-                os.makedirs(os.path.dirname(full_path), exist_ok=True)
-                
-                with open(full_path, 'w', encoding='utf-8') as f:
-                    f.write(content)
+            slot = self.pool.claim() if self.pool else None
+            if slot:
+                # Ports are the slot's; keep them reserved while the workspace is set up
+                self.workspaces[project_id] = {
+                    "frontend_port": slot["frontend_port"],
+                    "backend_port": slot["backend_port"],
+                    "status": "starting"
+                }
+                await asyncio.to_thread(WorkspacePool.attach_directory, slot, workspace_path)
             
-            print(f"✅ Created workspace at {workspace_path} with {len(files)} files")
+            # Create workspace directory (bind-mounted at /workspace)
+            os.makedirs(workspace_path, exist_ok=True)
             
             # Allocate ports
-            frontend_port = await self._allocate_port()
-            backend_port = await self._allocate_port()
-            
-            # Create Dockerfile for the workspace
-            dockerfile_content = self._generate_dockerfile()
-            with open(os.path.join(workspace_path, 'Dockerfile'), 'w') as f:
-                f.write(dockerfile_content)
+            if slot:
+                frontend_port = slot["frontend_port"]
+                backend_port = slot["backend_port"]
+            else:
+                frontend_port = await self._allocate_port()
+                backend_port = await self._allocate_port()
             
-            # Create docker-compose.yml if not exists
-            if 'docker-compose.yml' not in files:
-                compose_content = self._generate_docker_compose(frontend_port, backend_port)
-                with open(os.path.join(workspace_path, 'docker-compose.yml'), 'w') as f:
-                    f.write(compose_content)
-            
-            # Create startup script
-            startup_script = self._generate_startup_script()
-            startup_path = os.path.join(workspace_path, 'start.sh')
-            with open(startup_path, 'w') as f:
-                f.write(startup_script)
-            os.chmod(startup_path, 0o755)
+            # Project files plus scaffolding, pushed into the container in a
+            # single put_archive below
+            workspace_files = self._with_scaffolding(files, frontend_port, backend_port)
             
             # Build and start container
             container_name = f"autowebiq-{project_id[:8]}"
             
             # Check if container already exists
             try:
-                existing = self.client.containers.get(container_name)
-                existing.stop()
-                existing.remove()
+                existing = await asyncio.to_thread(self.client.containers.get, container_name)
+                await asyncio.to_thread(existing.stop)
+                await asyncio.to_thread(existing.remove)
+                container_sync.forget(existing.id)
                 print(f"🗑️ Removed existing container {container_name}")
             except docker.errors.NotFound:
                 pass
             
-            # Create and start new container
-            container = self.client.containers.run(
-                "node:18-alpine",
-                name=container_name,
-                detach=True,
-                ports={
-                    '3000/tcp': frontend_port,
-                    '8000/tcp': backend_port
-                },
-                volumes={
-                    workspace_path: {'bind': '/workspace', 'mode': 'rw'}
-                },
-                working_dir='/workspace',
-                command='sh -c "apk add --no-cache python3 py3-pip && ./start.sh"',
-                environment={
-                    'NODE_ENV': 'development',
-                    'VITE_API_URL': f'http://localhost:{backend_port}'
-                }
-            )
+            if slot:
+                # Warm container: dependencies are installed, only the dev servers need starting
+                container = await asyncio.to_thread(self.client.containers.get, slot["container_id"])
+                await asyncio.to_thread(container.rename, container_name)
+                sync = await container_sync.sync(container, workspace_files)
+                await asyncio.to_thread(
+                    container.exec_run,
+                    ['sh', '-c', './start.sh > /proc/1/fd/1 2>&1'],
+                    detach=True,
+                    workdir='/workspace'
+                )
+                print(f"♻️ Claimed warm container {slot['name']} for {container_name}")
+            else:
+                # Create the container, inject the files, then start it
+                container = await asyncio.to_thread(self._create_cold_container, container_name, workspace_path, frontend_port, backend_port)
+                sync = await container_sync.sync(container, workspace_files)
+                await asyncio.to_thread(container.start)
+            
+            print(f"✅ Created workspace at {workspace_path} with {len(files)} files ({sync['bytes_sent']} bytes synced)")
             
             workspace_id = f"ws_{project_id[:12]}"
             
@@ -142,6 +149,7 @@ class WorkspaceManager:
                 "workspace_path": workspace_path,
                 "user_id": user_id,
                 "created_at": datetime.utcnow().isoformat(),
+                "warm_start": slot is not None,
                 "status": "running"
             }
             
@@ -161,6 +169,7 @@ class WorkspaceManager:
                 "frontend_port": frontend_port,
                 "backend_port": backend_port,
                 "workspace_path": workspace_path,
+                "warm_start": slot is not None,
                 "message": "Workspace created successfully. Starting services..."
             }
             
@@ -168,12 +177,40 @@ class WorkspaceManager:
             print(f"❌ Workspace creation failed: {e}")
             import traceback
             traceback.print_exc()
+            if slot and self.workspaces.get(project_id, {}).get("status") == "starting":
+                # The project files stay in the slot directory; only the claimed container goes
+                del self.workspaces[project_id]
+                try:
+                    container = await asyncio.to_thread(self.client.containers.get, slot["container_id"])
+                    await asyncio.to_thread(container.remove, force=True)
+                except Exception:
+                    pass
             
             return {
                 "status": "error",
                 "message": f"Failed to create workspace: {str(e)}"
             }
     
+    def _create_cold_container(self, container_name: str, workspace_path: str, frontend_port: int, backend_port: int):
+        """Create (but do not start) a fresh workspace container when no warm one is available"""
+        return self.client.containers.create(
+            WORKSPACE_IMAGE,
+            name=container_name,
+            ports={
+                '3000/tcp': frontend_port,
+                '8000/tcp': backend_port
+            },
+            volumes={
+                workspace_path: {'bind': '/workspace', 'mode': 'rw'}
+            },
+            working_dir='/workspace',
+            command='sh -c "apk add --no-cache python3 py3-pip && ./start.sh"',
+            environment={
+                'NODE_ENV': 'development',
+                'VITE_API_URL': f'http://localhost:{backend_port}'
+            }
+        )
+    
     async def get_workspace_status(self, project_id: str) -> Dict:
         """Get status of a workspace"""
         if project_id not in self.workspaces:
@@ -259,10 +296,16 @@ class WorkspaceManager:
             container = self.client.containers.get(workspace["container_id"])
             container.stop()
             container.remove()
+            container_sync.forget(container.id)
             
-            # Remove workspace directory
-            if os.path.exists(workspace["workspace_path"]):
-                shutil.rmtree(workspace["workspace_path"])
+            # Remove workspace directory (a symlink to the slot directory for warm-started ones)
+            workspace_path = workspace["workspace_path"]
+            if os.path.islink(workspace_path):
+                slot_path = os.path.realpath(workspace_path)
+                os.unlink(workspace_path)
+                shutil.rmtree(slot_path, ignore_errors=True)
+            elif os.path.exists(workspace_path):
+                shutil.rmtree(workspace_path)
             
             # Remove from tracking
             del self.workspaces[project_id]
@@ -277,6 +320,35 @@ class WorkspaceManager:
                 "message": f"Failed to delete workspace: {str(e)}"
             }
     
+    async def sync_workspace(self, project_id: str, files: Dict[str, str], prune: bool = False,
+                             force: bool = False) -> Dict:
+        """
+        Push updated project files into a running workspace. Only files whose
+        content changed since the last sync (or whose copy in the workspace
+        directory was edited since) are sent, in one tar archive; with
+        prune=True, previously synced files missing from `files` are removed.
+        The generated scaffolding is always included, so it is never pruned.
+        force=True resends everything.
+        """
+        if project_id not in self.workspaces:
+            return {"status": "error", "message": "Workspace not found"}
+        
+        workspace = self.workspaces[project_id]
+        
+        try:
+            container = await asyncio.to_thread(self.client.containers.get, workspace["container_id"])
+            files = self._with_scaffolding(files, workspace["frontend_port"], workspace["backend_port"])
+            result = await container_sync.sync(
+                container, files, prune=prune, force=force, host_root=workspace["workspace_path"]
+            )
+            result["message"] = f"Synced {result['files_sent']} changed files"
+            return result
+        except Exception as e:
+            return {
+                "status": "error",
+                "message": f"Failed to sync workspace: {str(e)}"
+            }
+    
     async def get_workspace_logs(self, project_id: str, tail: int = 100) -> Dict:
         """Get logs from workspace container"""
         if project_id not in self.workspaces:
@@ -304,6 +376,8 @@ class WorkspaceManager:
         for ws in self.workspaces.values():
             used_ports.add(ws.get("frontend_port"))
             used_ports.add(ws.get("backend_port"))
+        if self.pool:
+            used_ports |= self.pool.reserved_ports()
         
         for port in range(self.base_port, self.max_port):
             if port not in used_ports:
@@ -311,6 +385,15 @@ class WorkspaceManager:
         
         raise Exception("No available ports")
     
+    def _with_scaffolding(self, files: Dict[str, str], frontend_port: int, backend_port: int) -> Dict[str, str]:
+        """Project files plus the generated Dockerfile, docker-compose.yml (unless the project has one) and start.sh"""
+        workspace_files = dict(files)
+        workspace_files['Dockerfile'] = self._generate_dockerfile()
+        if 'docker-compose.yml' not in files:
+            workspace_files['docker-compose.yml'] = self._generate_docker_compose(frontend_port, backend_port)
+        workspace_files['start.sh'] = self._generate_startup_script()
+        return workspace_files
+    
     def _generate_dockerfile(self) -> str:
         """Generate Dockerfile for workspace"""
         return """FROM node:18-alpine
@@ -356,7 +439,11 @@ echo "🚀 Starting AutoWebIQ Workspace..."
 if [ -d "frontend" ] && [ -f "frontend/package.json" ]; then
     echo "📦 Installing frontend dependencies..."
     cd frontend
-    npm install
+    # Warm pool containers ship the common packages; copying them is faster than downloading
+    if [ ! -d "node_modules" ] && [ -d "/opt/warm/node_modules" ]; then
+        cp -r /opt/warm/node_modules ./node_modules
+    fi
+    npm install --prefer-offline --no-audit --no-fund
     echo "✅ Frontend dependencies installed"
     
     echo "🎨 Starting frontend server..."
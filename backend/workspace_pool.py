@@ -0,0 +1,307 @@
+# Workspace Container Pool
+# Idle workspace containers started ahead of demand with Python and the
+# common npm/pip dependencies already installed; create_workspace claims a
+# ready one instead of cold-starting node:18-alpine, and the pool is refilled
+# in the background to a size that follows the recent claim rate
+
+from collections import deque
+from prometheus_client import Counter, Gauge
+from typing import Awaitable, Callable, Dict, List, Optional
+import asyncio
+import logging
+import math
+import os
+import shutil
+import socket
+import time
+import uuid
+
+import docker
+
+logger = logging.getLogger(__name__)
+
+WORKSPACE_POOL_ENABLED = os.environ.get('WORKSPACE_POOL_ENABLED', 'true').lower() == 'true'
+WORKSPACE_POOL_MIN_SIZE = int(os.environ.get('WORKSPACE_POOL_MIN_SIZE', '1'))
+WORKSPACE_POOL_MAX_SIZE = int(os.environ.get('WORKSPACE_POOL_MAX_SIZE', '6'))
+# Claims are counted over this window (seconds) to estimate demand
+WORKSPACE_POOL_DEMAND_WINDOW = float(os.environ.get('WORKSPACE_POOL_DEMAND_WINDOW', '600'))
+WORKSPACE_POOL_INTERVAL = float(os.environ.get('WORKSPACE_POOL_INTERVAL', '15'))
+# Idle containers above the target size are removed after this long (seconds)
+WORKSPACE_POOL_IDLE_TTL = float(os.environ.get('WORKSPACE_POOL_IDLE_TTL', '900'))
+# Containers still warming after this long (seconds) are discarded
+WORKSPACE_POOL_WARMUP_TIMEOUT = float(os.environ.get('WORKSPACE_POOL_WARMUP_TIMEOUT', '600'))
+WORKSPACE_POOL_NPM_PACKAGES = os.environ.get(
+    'WORKSPACE_POOL_NPM_PACKAGES', 'vite @vitejs/plugin-react react react-dom react-router-dom axios'
+)
+WORKSPACE_POOL_PIP_PACKAGES = os.environ.get(
+    'WORKSPACE_POOL_PIP_PACKAGES', 'fastapi uvicorn pydantic python-dotenv requests'
+)
+WORKSPACE_IMAGE = 'node:18-alpine'
+WORKSPACE_POOL_ROOT = '/tmp/workspaces/_pool'
+POOL_NAME_PREFIX = 'autowebiq-pool-'
+POOL_LABEL = 'autowebiq.pool'
+OWNER_LABEL = 'autowebiq.pool.owner'
+READY_MARKER = '/tmp/warm-ready'
+# Initial warm-up estimate until one has been measured (seconds)
+DEFAULT_WARMUP_SECONDS = 180.0
+
+# Installs the shared dependencies outside /workspace (node_modules in
+# /opt/warm, the npm cache in ~/.npm, pip packages globally) and then idles
+WARM_COMMAND = (
+    "apk add --no-cache python3 py3-pip bash git"
+    " && mkdir -p /opt/warm && cd /opt/warm && npm init -y > /dev/null"
+    " && npm install --no-audit --no-fund {npm}"
+    " && PIP_BREAK_SYSTEM_PACKAGES=1 pip3 install --no-cache-dir {pip}"
+    f" && touch {READY_MARKER}; exec tail -f /dev/null"
+)
+
+POOL_CLAIMS = Counter(
+    'workspace_pool_claims_total',
+    'Workspace creations by whether a warm container was available (hit) or not (miss)',
+    ['result']
+)
+POOL_SIZE = Gauge(
+    'workspace_pool_containers',
+    'Pooled workspace containers by state',
+    ['state']
+)
+POOL_TARGET = Gauge(
+    'workspace_pool_target_size',
+    'Pool size the refill loop is aiming for'
+)
+
+
+class WorkspacePool:
+    """
+    Pre-started workspace containers, owned by one API process.
+
+    Ports and the /workspace bind mount have to be fixed when a container is
+    created, so every pooled container gets its ports up front and mounts its
+    own slot directory under WORKSPACE_POOL_ROOT; claiming hands the slot to a
+    project, whose workspace path becomes a symlink to it.
+
+    The target size follows Little's law: enough containers to cover the
+    claims expected while a replacement warms up (claim rate over the demand
+    window times the measured warm-up time), clamped to [min_size, max_size].
+    """
+
+    def __init__(self, client, allocate_port: Callable[[], Awaitable[int]],
+                 min_size: int = WORKSPACE_POOL_MIN_SIZE, max_size: int = WORKSPACE_POOL_MAX_SIZE):
+        self.client = client
+        self.allocate_port = allocate_port
+        self.min_size = min_size
+        self.max_size = max(max_size, min_size)
+        self.slots: List[Dict] = []
+        self.claims: deque = deque()
+        self.warmup_seconds = DEFAULT_WARMUP_SECONDS
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    # ==================== Sizing ====================
+
+    def _demand_rate(self) -> float:
+        """Claims per second over the demand window"""
+        cutoff = time.monotonic() - WORKSPACE_POOL_DEMAND_WINDOW
+        while self.claims and self.claims[0] < cutoff:
+            self.claims.popleft()
+        return len(self.claims) / WORKSPACE_POOL_DEMAND_WINDOW
+
+    def target_size(self) -> int:
+        needed = math.ceil(self._demand_rate() * self.warmup_seconds)
+        return min(max(needed, self.min_size), self.max_size)
+
+    def reserved_ports(self) -> set:
+        """Ports bound by pooled containers, which the port allocator must skip"""
+        ports = set()
+        for slot in self.slots:
+            ports.add(slot["frontend_port"])
+            ports.add(slot["backend_port"])
+        return ports
+
+    # ==================== Claim ====================
+
+    def claim(self) -> Optional[Dict]:
+        """Take a ready container out of the pool (None if none is ready) and trigger a refill"""
+        self.claims.append(time.monotonic())
+        ready = [slot for slot in self.slots if slot["state"] == "ready"]
+        slot = None
+        if ready:
+            # Most recently readied first: the oldest idle ones are the first to be trimmed
+            slot = max(ready, key=lambda s: s["ready_at"])
+            self.slots.remove(slot)
+        POOL_CLAIMS.labels('hit' if slot else 'miss').inc()
+        self._wake.set()
+        return slot
+
+    @staticmethod
+    def attach_directory(slot: Dict, workspace_path: str):
+        """
+        Point workspace_path at the slot directory, carrying over any files
+        already there (including those of a previously claimed slot).
+        """
+        previous = None
+        if os.path.islink(workspace_path):
+            previous = os.path.realpath(workspace_path)
+            os.unlink(workspace_path)
+        elif os.path.isdir(workspace_path):
+            previous = workspace_path
+        if previous and os.path.isdir(previous):
+            for entry in os.listdir(previous):
+                os.replace(os.path.join(previous, entry), os.path.join(slot["path"], entry))
+            shutil.rmtree(previous, ignore_errors=True)
+        os.makedirs(os.path.dirname(workspace_path), exist_ok=True)
+        os.symlink(slot["path"], workspace_path)
+
+    # ==================== Refill ====================
+
+    async def _create_slot(self):
+        slot_id = uuid.uuid4().hex[:10]
+        slot = {
+            "name": f"{POOL_NAME_PREFIX}{slot_id}",
+            "path": os.path.join(WORKSPACE_POOL_ROOT, slot_id),
+            "frontend_port": await self.allocate_port(),
+            "backend_port": None,
+            "container_id": None,
+            "state": "starting",
+            "started_at": time.monotonic(),
+            "ready_at": None,
+        }
+        # Reserved before the next allocation so the two ports differ
+        self.slots.append(slot)
+        try:
+            slot["backend_port"] = await self.allocate_port()
+            os.makedirs(slot["path"], exist_ok=True)
+            command = WARM_COMMAND.format(npm=WORKSPACE_POOL_NPM_PACKAGES, pip=WORKSPACE_POOL_PIP_PACKAGES)
+            container = await asyncio.to_thread(
+                self.client.containers.run,
+                WORKSPACE_IMAGE,
+                name=slot["name"],
+                detach=True,
+                ports={'3000/tcp': slot["frontend_port"], '8000/tcp': slot["backend_port"]},
+                volumes={slot["path"]: {'bind': '/workspace', 'mode': 'rw'}},
+                working_dir='/workspace',
+                command=['sh', '-c', command],
+                environment={
+                    'NODE_ENV': 'development',
+                    'VITE_API_URL': f'http://localhost:{slot["backend_port"]}'
+                },
+                labels={POOL_LABEL: '1', OWNER_LABEL: self.owner}
+            )
+            slot["container_id"] = container.id
+            slot["state"] = "warming"
+        except Exception as e:
+            logger.warning(f"Pool container {slot['name']} failed to start: {e}")
+            await self._discard(slot)
+
+    async def _discard(self, slot: Dict):
+        if slot in self.slots:
+            self.slots.remove(slot)
+        if slot.get("container_id"):
+            try:
+                container = await asyncio.to_thread(self.client.containers.get, slot["container_id"])
+                await asyncio.to_thread(container.remove, force=True)
+            except docker.errors.NotFound:
+                pass
+            except Exception as e:
+                logger.warning(f"Could not remove pool container {slot['name']}: {e}")
+        await asyncio.to_thread(shutil.rmtree, slot["path"], True)
+
+    async def _check(self, slot: Dict):
+        """Promote a warmed-up container, or drop one that died or never warmed up"""
+        try:
+            container = await asyncio.to_thread(self.client.containers.get, slot["container_id"])
+            if container.status != "running":
+                raise RuntimeError(f"container is {container.status}")
+            if slot["state"] == "warming":
+                result = await asyncio.to_thread(container.exec_run, ['test', '-f', READY_MARKER])
+                if result.exit_code == 0:
+                    now = time.monotonic()
+                    slot["state"] = "ready"
+                    slot["ready_at"] = now
+                    # EWMA so one slow registry pull does not dominate the sizing
+                    self.warmup_seconds = 0.7 * self.warmup_seconds + 0.3 * (now - slot["started_at"])
+                elif time.monotonic() - slot["started_at"] > WORKSPACE_POOL_WARMUP_TIMEOUT:
+                    raise RuntimeError("warm-up timed out")
+        except Exception as e:
+            # Claimed while being checked: it belongs to a workspace now
+            if slot in self.slots:
+                logger.warning(f"Discarding pool container {slot['name']}: {e}")
+                await self._discard(slot)
+
+    async def reconcile(self):
+        """One refill round: check warming containers, then grow or trim towards the target"""
+        await asyncio.gather(*(
+            self._check(slot) for slot in list(self.slots) if slot["state"] in ("warming", "ready")
+        ))
+
+        target = self.target_size()
+        missing = target - len(self.slots)
+        if missing > 0:
+            await asyncio.gather(*(self._create_slot() for _ in range(missing)))
+        elif missing < 0:
+            now = time.monotonic()
+            idle = sorted(
+                (slot for slot in self.slots
+                 if slot["state"] == "ready" and now - slot["ready_at"] > WORKSPACE_POOL_IDLE_TTL),
+                key=lambda s: s["ready_at"]
+            )
+            for slot in idle[:-missing]:
+                await self._discard(slot)
+
+        POOL_TARGET.set(target)
+        for state in ("starting", "warming", "ready"):
+            POOL_SIZE.labels(state).set(sum(1 for slot in self.slots if slot["state"] == state))
+
+    async def _remove_orphans(self):
+        """Remove pool containers left behind by API processes on this host that are gone"""
+        containers = await asyncio.to_thread(
+            self.client.containers.list, all=True, filters={"label": POOL_LABEL}
+        )
+        hostname = socket.gethostname()
+        for container in containers:
+            host, _, pid = container.labels.get(OWNER_LABEL, "").rpartition(":")
+            if not container.name.startswith(POOL_NAME_PREFIX) or host != hostname or not pid.isdigit():
+                continue
+            try:
+                os.kill(int(pid), 0)
+                continue
+            except ProcessLookupError:
+                pass
+            except PermissionError:
+                continue
+            logger.info(f"Removing orphaned pool container {container.name}")
+            await asyncio.to_thread(container.remove, force=True)
+            slot_path = os.path.join(WORKSPACE_POOL_ROOT, container.name[len(POOL_NAME_PREFIX):])
+            await asyncio.to_thread(shutil.rmtree, slot_path, True)
+
+    async def _loop(self):
+        try:
+            await self._remove_orphans()
+        except Exception as e:
+            logger.warning(f"Pool orphan cleanup failed: {e}")
+        while True:
+            try:
+                await self.reconcile()
+            except Exception as e:
+                logger.error(f"Workspace pool refill failed: {e}")
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=WORKSPACE_POOL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    async def stop(self):
+        """Stop refilling and remove the idle containers (claimed ones belong to their workspaces)"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await asyncio.gather(*(self._discard(slot) for slot in list(self.slots)), return_exceptions=True)